@@ -1,26 +1,195 @@
-import math
+from functools import lru_cache
 
 import numpy as np
 
-from minigrid.core.constants import OBJECT_TO_IDX, TILE_PIXELS
-from minigrid.core.world_object import Wall, WorldObj
-from minigrid.utils.rendering import (
-    downsample,
-    fill_coords,
-    highlight_img,
-    point_in_rect,
-    point_in_triangle,
-    rotate_fn,
+from minigrid.core.constants import (
+    COLOR_TO_IDX,
+    OBJECT_TO_IDX,
+    STATE_TO_IDX,
+    TILE_PIXELS,
 )
+from minigrid.core.reachability import component_labels, distance_field, passable_mask
+from minigrid.core.tile_cache import TileCache, tile_code, tile_codes
+from minigrid.core.world_object import Floor, Goal, Lava, Wall, WorldObj
+from minigrid.core.zobrist import cell_key, grid_hash
+
+# Encoding of an empty cell
+EMPTY_ENCODING = (OBJECT_TO_IDX["empty"], 0, 0)
+
+# Encoding of the cells outside of a grid
+WALL_ENCODING = Wall().encode()
+
+# Classes of the objects that have no state besides their encoding and that
+# nothing refers to by identity. Those that were only created from the
+# encoding are left out of pickles, and created again on demand.
+STATIC_CLASSES = (Wall, Floor, Lava, Goal)
+
+# Number of attributes of the objects created from an encoding
+_NUM_VIEW_ATTRS = len(vars(Wall()))
+
+
+def _is_static_view(obj):
+    """
+    Whether an object can be created again from the grid encoding
+    """
+
+    return (
+        type(obj) in STATIC_CLASSES
+        and len(obj.__dict__) == _NUM_VIEW_ATTRS
+        and obj.init_pos is None
+        and obj.cur_pos is None
+        and obj.contains is None
+    )
+
+
+def _fill_up(gen, pro, width):
+    """
+    Propagate the set bits of `gen` towards the high bits, through the
+    consecutive set bits of `pro`
+    """
+
+    shift = 1
+    while shift < width:
+        gen = gen | (pro & (gen << shift))
+        pro = pro & (pro << shift)
+        shift *= 2
+
+    return gen
+
+
+def _fill_down(gen, pro, width):
+    """
+    Propagate the set bits of `gen` towards the low bits, through the
+    consecutive set bits of `pro`
+    """
+
+    shift = 1
+    while shift < width:
+        gen = gen | (pro & (gen >> shift))
+        pro = pro & (pro >> shift)
+        shift *= 2
+
+    return gen
+
+
+def _propagate_vis_row(transparent, seen, width):
+    """
+    Propagate visibility along a row of cells, stored as bitmasks where bit i
+    is cell i. Returns the cells seen in the row and the cells of the row
+    above that are visible through it. The bitmasks can be ints or arrays
+    of uint64, for a batch of rows.
+    """
+
+    full = (1 << width) - 1
+
+    # Left to right, each visible transparent cell reveals the next one
+    right = _fill_up(seen & transparent, transparent, width)
+    seen = seen | ((right << 1) & full)
+    right = right & (full >> 1)
+
+    # Right to left
+    left = _fill_down(seen & transparent, transparent, width)
+    seen = seen | (left >> 1)
+    left = left & (full ^ 1)
+
+    above = right | (right << 1) | left | (left >> 1)
+
+    return seen, above
+
+
+# The same rows come up again and again, so single rows are memoized
+_process_vis_row = lru_cache(maxsize=2**16)(_propagate_vis_row)
+
+
+def compute_vis_mask(encoding, agent_pos):
+    """
+    Compute which cells of an encoded grid are visible from `agent_pos`,
+    the agent looking towards the top of the grid. Walls, closed and locked
+    doors hide the cells behind them.
+    """
+
+    width, height = encoding.shape[:2]
+
+    types = encoding[:, :, 0]
+    transparent = (types != OBJECT_TO_IDX["wall"]) & (
+        (types != OBJECT_TO_IDX["door"]) | (encoding[:, :, 2] == STATE_TO_IDX["open"])
+    )
+
+    # Bitmask of the transparent cells of each row
+    num_bytes = (width + 7) // 8
+    rows = np.packbits(transparent.T, axis=1, bitorder="little")
+    rows = [int.from_bytes(row.tobytes(), "little") for row in rows]
+
+    # Sweep the rows from the bottom to the top of the grid
+    seen = [0] * height
+    above = 0
+    for j in reversed(range(agent_pos[1] + 1)):
+        if j == agent_pos[1]:
+            above |= 1 << int(agent_pos[0])
+        seen[j], above = _process_vis_row(rows[j], above, width)
+
+    seen = b"".join(row.to_bytes(num_bytes, "little") for row in seen)
+    seen = np.frombuffer(seen, dtype=np.uint8).reshape(height, num_bytes)
+    mask = np.unpackbits(seen, axis=1, count=width, bitorder="little").T
+
+    return mask.astype(bool)
+
+
+def compute_vis_masks(encodings, agent_pos):
+    """
+    Compute the visibility masks of a batch of encoded grids of the same
+    size, of shape (n, width, height, 3), the agent being at `agent_pos` in
+    all of them. The rows of all the grids are swept together.
+    """
+
+    n, width, height = encodings.shape[:3]
+
+    # Rows are stored in 64 bits integers
+    if width >= 64:
+        masks = [compute_vis_mask(encoding, agent_pos) for encoding in encodings]
+        return np.array(masks, dtype=bool).reshape(n, width, height)
+
+    types = encodings[..., 0]
+    transparent = (types != OBJECT_TO_IDX["wall"]) & (
+        (types != OBJECT_TO_IDX["door"]) | (encodings[..., 2] == STATE_TO_IDX["open"])
+    )
+
+    # Bitmask of the transparent cells of each row of each grid
+    bits = np.uint64(1) << np.arange(width, dtype=np.uint64)
+    rows = (transparent.swapaxes(1, 2) * bits).sum(axis=2, dtype=np.uint64)
+
+    # Sweep the rows from the bottom to the top of the grids
+    seen = np.zeros((n, height), dtype=np.uint64)
+    above = np.zeros(n, dtype=np.uint64)
+    for j in reversed(range(agent_pos[1] + 1)):
+        if j == agent_pos[1]:
+            above |= np.uint64(1 << int(agent_pos[0]))
+        seen[:, j], above = _propagate_vis_row(rows[:, j], above, width)
+
+    return (seen[:, None, :] & bits[:, None]) != 0
 
 
 class Grid:
     """
     Represent a grid and operations on it
+
+    The canonical state of the grid is its encoding, of shape
+    (width, height, 3), holding the (type, color, state) triple of every cell.
+    It is kept up to date by `set` and by the objects placed in the grid when
+    their state changes, so that it can be read without re-encoding cells.
+    Object instances (and their payloads, e.g. `Box.contains`) are kept in
+    the `objs` side table, and are created on demand from the encoding for
+    cells that were filled without one (e.g. walls).
     """
 
-    # Static cache of pre-renderer tiles
-    tile_cache = {}
+    # Static cache of pre-rendered tiles. It can be replaced by any object
+    # providing `get_atlas(tile_size, subdivs)`, e.g. a `TileCache` with a
+    # different memory budget.
+    tile_cache = TileCache()
+
+    # Zobrist hash of the encoding, None until it is first computed. Code
+    # writing to the encoding without going through `set` must reset it.
+    _zobrist = None
 
     def __init__(self, width, height):
         assert width >= 3
@@ -29,27 +198,84 @@ class Grid:
         self.width = width
         self.height = height
 
-        self.grid = [None] * width * height
+        self._encoding = np.empty((width, height, 3), dtype=np.uint8)
+        self._encoding[:, :] = EMPTY_ENCODING
+
+        # Object instance at each position, None if not created yet
+        self.objs = np.full((width, height), None, dtype=object)
+
+    @property
+    def encoding(self):
+        """
+        Read-only view of the live encoding of the grid
+        """
+
+        view = self._encoding.view()
+        view.flags.writeable = False
+        return view
+
+    @property
+    def grid(self):
+        """
+        List of the cell contents in row-major order
+        """
+
+        return [self.get(i, j) for j in range(self.height) for i in range(self.width)]
+
+    def __getstate__(self):
+        # Pickle the encoding as bytes, and only the objects that can't be
+        # created again from it, with their flat cell indices. Reachability
+        # results are recomputed on demand.
+        state = self.__dict__.copy()
+        state.pop("_reach_cache", None)
+        state["_encoding"] = self._encoding.tobytes()
+
+        objs = state.pop("objs").ravel().tolist()
+        indices = [
+            index
+            for index, obj in enumerate(objs)
+            if obj is not None and not _is_static_view(obj)
+        ]
+        state["objs"] = (indices, [objs[index] for index in indices])
+
+        return state
+
+    def __setstate__(self, state):
+        objs = state.pop("objs")
+        self.__dict__.update(state)
+
+        # Grids pickled with their whole object table
+        if isinstance(objs, np.ndarray):
+            self.objs = objs
+            return
+
+        indices, objs = objs
+        encoding = np.frombuffer(state["_encoding"], dtype=np.uint8)
+        self._encoding = encoding.reshape(self.width, self.height, 3).copy()
+
+        self.objs = np.full((self.width, self.height), None, dtype=object)
+        for index, obj in zip(indices, objs):
+            self._attach(*divmod(index, self.height), obj)
 
     def __contains__(self, key):
         if isinstance(key, WorldObj):
-            for e in self.grid:
+            for e in self.objs.flat:
                 if e is key:
                     return True
         elif isinstance(key, tuple):
-            for e in self.grid:
-                if e is None:
-                    continue
-                if (e.color, e.type) == key:
-                    return True
-                if key[0] is None and key[1] == e.type:
-                    return True
+            color, obj_type = key
+            if obj_type in ("empty", "unseen") or obj_type not in OBJECT_TO_IDX:
+                return False
+            match = self._encoding[:, :, 0] == OBJECT_TO_IDX[obj_type]
+            if color is not None:
+                if color not in COLOR_TO_IDX:
+                    return False
+                match &= self._encoding[:, :, 1] == COLOR_TO_IDX[color]
+            return bool(match.any())
         return False
 
     def __eq__(self, other):
-        grid1 = self.encode()
-        grid2 = other.encode()
-        return np.array_equal(grid2, grid1)
+        return np.array_equal(other._encoding, self._encoding)
 
     def __ne__(self, other):
         return not self == other
@@ -59,27 +285,178 @@ class Grid:
 
         return deepcopy(self)
 
+    def _attach(self, i, j, v):
+        """
+        Store an object instance for a cell whose encoding is already set
+        """
+
+        self.objs[i, j] = v
+        v._grid = self
+        v._grid_pos = (i, j)
+
+    def _detach(self, i, j):
+        """
+        Remove the object instance stored for a cell, if any
+        """
+
+        v = self.objs[i, j]
+        if v is not None:
+            self.objs[i, j] = None
+            if v._grid is self and v._grid_pos == (i, j):
+                v._grid = None
+                v._grid_pos = None
+
+    def _cell_key(self, i, j):
+        """
+        Zobrist key of the current content of a cell
+        """
+
+        encoding = self._encoding
+        return cell_key(
+            i, j, encoding.item(i, j, 0), encoding.item(i, j, 1), encoding.item(i, j, 2)
+        )
+
+    def _update_cell(self, v):
+        """
+        Update the encoding of the cell holding an object after its state
+        changed (e.g. a door being opened)
+        """
+
+        i, j = v._grid_pos
+        if self.objs[i, j] is v:
+            zobrist = self._zobrist
+            if zobrist is not None:
+                zobrist ^= self._cell_key(i, j)
+
+            self._encoding[i, j] = v.encode()
+
+            if zobrist is not None:
+                self._zobrist = zobrist ^ self._cell_key(i, j)
+
     def set(self, i, j, v):
         assert i >= 0 and i < self.width
         assert j >= 0 and j < self.height
-        self.grid[j * self.width + i] = v
+
+        self._detach(i, j)
+
+        zobrist = self._zobrist
+        if zobrist is not None:
+            zobrist ^= self._cell_key(i, j)
+
+        if v is None:
+            self._encoding[i, j] = EMPTY_ENCODING
+        else:
+            self._encoding[i, j] = v.encode()
+            self._attach(i, j, v)
+
+        if zobrist is not None:
+            self._zobrist = zobrist ^ self._cell_key(i, j)
+
+    def zobrist_hash(self):
+        """
+        64-bit Zobrist hash of the grid, computed once and then updated
+        incrementally as cells are set
+        """
+
+        if self._zobrist is None:
+            self._zobrist = grid_hash(self._encoding)
+
+        return self._zobrist
 
     def get(self, i, j):
         assert i >= 0 and i < self.width
         assert j >= 0 and j < self.height
-        return self.grid[j * self.width + i]
+
+        v = self.objs[i, j]
+        if v is None and self._encoding.item(i, j, 0) > OBJECT_TO_IDX["empty"]:
+            # Create a view of the cell from its encoding
+            v = WorldObj.decode(*self._encoding[i, j])
+            self._attach(i, j, v)
+
+        return v
+
+    def free_mask(self, x, y, width, height):
+        """
+        Boolean mask of the empty cells of a rectangle of the grid
+        """
+
+        cells = (slice(x, x + width), slice(y, y + height), 0)
+        return self._encoding[cells] <= OBJECT_TO_IDX["empty"]
+
+    def _reach_cached(self, key, compute):
+        """
+        Get a reachability result computed on the grid, cached until the
+        encoding of the grid changes
+        """
+
+        encoding = self._encoding.tobytes()
+        cache = self.__dict__.get("_reach_cache")
+        if cache is None or cache[0] != encoding:
+            cache = self._reach_cache = (encoding, {})
+
+        if key not in cache[1]:
+            result = compute()
+            result.flags.writeable = False
+            cache[1][key] = result
+
+        return cache[1][key]
+
+    def distance_field(self, source, doors="closed", lava=False):
+        """
+        Shortest-path distances from `source` to every cell, UNREACHABLE for
+        the cells that can't be reached, see `passable_mask` for `doors`
+        and `lava` and `distance_field` in `minigrid.core.reachability`
+        """
+
+        source = (int(source[0]), int(source[1]))
+        return self._reach_cached(
+            ("distance_field", source, doors, lava),
+            lambda: distance_field(passable_mask(self._encoding, doors, lava), source),
+        )
+
+    def component_labels(self, doors="closed", lava=False):
+        """
+        Labels of the connected components of the passable cells, see
+        `component_labels` in `minigrid.core.reachability`
+        """
+
+        return self._reach_cached(
+            ("component_labels", doors, lava),
+            lambda: component_labels(passable_mask(self._encoding, doors, lava)),
+        )
+
+    def _fill(self, x, y, width, height, obj_type):
+        """
+        Fill a rectangle of cells with new instances of an object type
+        """
+
+        obj = obj_type()
+
+        if type(WorldObj.decode(*obj.encode())) is not obj_type:
+            # The object can't be recreated from its encoding, store instances
+            for i in range(x, x + width):
+                for j in range(y, y + height):
+                    self.set(i, j, obj_type())
+            return
+
+        assert x >= 0 and x + width <= self.width
+        assert y >= 0 and y + height <= self.height
+
+        cells = (slice(x, x + width), slice(y, y + height))
+        for i, j in zip(*np.nonzero(self.objs[cells].astype(bool))):
+            self._detach(x + i, y + j)
+        self._encoding[cells] = obj.encode()
+        self._zobrist = None
 
     def horz_wall(self, x, y, length=None, obj_type=Wall):
         if length is None:
             length = self.width - x
-        for i in range(0, length):
-            self.set(x + i, y, obj_type())
+        self._fill(x, y, length, 1, obj_type)
 
     def vert_wall(self, x, y, length=None, obj_type=Wall):
         if length is None:
             length = self.height - y
-        for j in range(0, length):
-            self.set(x, y + j, obj_type())
+        self._fill(x, y, 1, length, obj_type)
 
     def wall_rect(self, x, y, w, h):
         self.horz_wall(x, y, w)
@@ -87,150 +464,158 @@ class Grid:
         self.vert_wall(x, y, h)
         self.vert_wall(x + w - 1, y, h)
 
-    def rotate_left(self):
+    @staticmethod
+    def _from_cells(encoding, objs):
         """
-        Rotate the grid to the left (counter-clockwise)
+        Create a grid from an encoding and the matching object side table.
+        The objects stay attached to the grid they were copied from.
         """
 
-        grid = Grid(self.height, self.width)
-
-        for i in range(self.width):
-            for j in range(self.height):
-                v = self.get(i, j)
-                grid.set(j, grid.height - 1 - i, v)
+        grid = Grid.__new__(Grid)
+        grid.width, grid.height = encoding.shape[:2]
+        grid._encoding = np.ascontiguousarray(encoding)
+        grid.objs = objs.copy()
 
         return grid
 
+    def rotate_left(self):
+        """
+        Rotate the grid to the left (counter-clockwise)
+        """
+
+        return Grid._from_cells(
+            self._encoding[::-1].swapaxes(0, 1), self.objs[::-1].swapaxes(0, 1)
+        )
+
     def slice(self, topX, topY, width, height):
         """
         Get a subset of the grid
         """
 
-        grid = Grid(width, height)
+        # Cells outside of the grid are walls
+        encoding = np.empty((width, height, 3), dtype=np.uint8)
+        encoding[:, :] = WALL_ENCODING
+        objs = np.full((width, height), None, dtype=object)
 
-        for j in range(0, height):
-            for i in range(0, width):
-                x = topX + i
-                y = topY + j
+        x0, x1 = max(topX, 0), min(topX + width, self.width)
+        y0, y1 = max(topY, 0), min(topY + height, self.height)
 
-                if x >= 0 and x < self.width and y >= 0 and y < self.height:
-                    v = self.get(x, y)
-                else:
-                    v = Wall()
+        if x0 < x1 and y0 < y1:
+            dst = (slice(x0 - topX, x1 - topX), slice(y0 - topY, y1 - topY))
+            encoding[dst] = self._encoding[x0:x1, y0:y1]
+            objs[dst] = self.objs[x0:x1, y0:y1]
 
-                grid.set(i, j, v)
+        return Grid._from_cells(encoding, objs)
 
-        return grid
+    def _clip_cells(self, xs, ys):
+        """
+        Clip cell coordinates to the grid, also returning which were inside
+        """
 
-    @classmethod
-    def render_tile(
-        cls, obj, agent_dir=None, highlight=False, tile_size=TILE_PIXELS, subdivs=3
-    ):
+        inside = (xs >= 0) & (xs < self.width) & (ys >= 0) & (ys < self.height)
+
+        return np.where(inside, xs, 0), np.where(inside, ys, 0), inside
+
+    def encode_cells(self, xs, ys):
         """
-        Render a tile and cache the result
+        Produce the encoding of the cells at the given coordinates, laid out
+        like the coordinate arrays. Cells outside of the grid are walls.
         """
 
-        # Hash map lookup key for the cache
-        key = (agent_dir, highlight, tile_size)
-        key = obj.encode() + key if obj else key
+        xs, ys, inside = self._clip_cells(xs, ys)
 
-        if key in cls.tile_cache:
-            return cls.tile_cache[key]
+        array = self._encoding[xs, ys]
+        array[~inside] = WALL_ENCODING
 
-        img = np.zeros(
-            shape=(tile_size * subdivs, tile_size * subdivs, 3), dtype=np.uint8
-        )
+        return array
 
-        # Draw the grid lines (top and left edges)
-        fill_coords(img, point_in_rect(0, 0.031, 0, 1), (100, 100, 100))
-        fill_coords(img, point_in_rect(0, 1, 0, 0.031), (100, 100, 100))
+    def gather(self, xs, ys):
+        """
+        Get the cells at the given coordinates as a new grid, laid out like
+        the coordinate arrays. Cells outside of the grid are walls.
+        """
 
-        if obj is not None:
-            obj.render(img)
+        xs, ys, inside = self._clip_cells(xs, ys)
 
-        # Overlay the agent on top
-        if agent_dir is not None:
-            tri_fn = point_in_triangle(
-                (0.12, 0.19),
-                (0.87, 0.50),
-                (0.12, 0.81),
-            )
+        encoding = self._encoding[xs, ys]
+        encoding[~inside] = WALL_ENCODING
+        objs = self.objs[xs, ys]
+        objs[~inside] = None
 
-            # Rotate the agent based on its direction
-            tri_fn = rotate_fn(tri_fn, cx=0.5, cy=0.5, theta=0.5 * math.pi * agent_dir)
-            fill_coords(img, tri_fn, (255, 0, 0))
+        return Grid._from_cells(encoding, objs)
 
-        # Highlight the cell if needed
-        if highlight:
-            highlight_img(img)
+    @classmethod
+    def render_tile(
+        cls, obj, agent_dir=None, highlight=False, tile_size=TILE_PIXELS, subdivs=3
+    ):
+        """
+        Render a tile and cache the result
+        """
 
-        # Downsample the image to perform supersampling/anti-aliasing
-        img = downsample(img, subdivs)
+        atlas = cls.tile_cache.get_atlas(tile_size, subdivs)
 
-        # Cache the rendered tile
-        cls.tile_cache[key] = img
+        code = tile_code(obj.encode() if obj else None, agent_dir, highlight)
 
-        return img
+        return atlas.get_tile(code, obj)
 
-    def render(self, tile_size, agent_pos, agent_dir=None, highlight_mask=None):
+    @classmethod
+    def render_encoding(
+        cls,
+        encoding,
+        tile_size,
+        agent_pos,
+        agent_dir=None,
+        highlight_mask=None,
+        frame=None,
+        out=None,
+    ):
         """
-        Render this grid at a given scale
-        :param r: target renderer object
-        :param tile_size: tile size in pixels
+        Render an encoded grid at a given scale, with the tile of every cell
+        gathered from the tile atlas of that scale. If a `FrameCache` is
+        given, only the tiles that changed since the frame it holds are
+        drawn.
+
+        A batch of encoded grids of the same size, of shape
+        (..., width, height, 3), can be rendered at once by passing one agent
+        position, direction and highlight mask per grid. The images are
+        written to `out` if given.
         """
 
-        if highlight_mask is None:
-            highlight_mask = np.zeros(shape=(self.width, self.height), dtype=bool)
-
-        # Compute the total grid size
-        width_px = self.width * tile_size
-        height_px = self.height * tile_size
+        atlas = cls.tile_cache.get_atlas(tile_size)
+        codes = tile_codes(encoding, agent_pos, agent_dir, highlight_mask)
 
-        img = np.zeros(shape=(height_px, width_px, 3), dtype=np.uint8)
+        if frame is None:
+            return atlas.render(codes, out)
 
-        # Render the grid
-        for j in range(0, self.height):
-            for i in range(0, self.width):
-                cell = self.get(i, j)
+        img = frame.render(atlas, codes)
+        if out is None:
+            return img.copy()
 
-                agent_here = np.array_equal(agent_pos, (i, j))
-                tile_img = Grid.render_tile(
-                    cell,
-                    agent_dir=agent_dir if agent_here else None,
-                    highlight=highlight_mask[i, j],
-                    tile_size=tile_size,
-                )
+        out[...] = img
+        return out
 
-                ymin = j * tile_size
-                ymax = (j + 1) * tile_size
-                xmin = i * tile_size
-                xmax = (i + 1) * tile_size
-                img[ymin:ymax, xmin:xmax, :] = tile_img
+    def render(
+        self, tile_size, agent_pos, agent_dir=None, highlight_mask=None, frame=None
+    ):
+        """
+        Render this grid at a given scale
+        :param r: target renderer object
+        :param tile_size: tile size in pixels
+        """
 
-        return img
+        return Grid.render_encoding(
+            self._encoding, tile_size, agent_pos, agent_dir, highlight_mask, frame
+        )
 
     def encode(self, vis_mask=None):
         """
         Produce a compact numpy encoding of the grid
         """
 
-        if vis_mask is None:
-            vis_mask = np.ones((self.width, self.height), dtype=bool)
-
-        array = np.zeros((self.width, self.height, 3), dtype="uint8")
-
-        for i in range(self.width):
-            for j in range(self.height):
-                if vis_mask[i, j]:
-                    v = self.get(i, j)
+        array = self._encoding.copy()
 
-                    if v is None:
-                        array[i, j, 0] = OBJECT_TO_IDX["empty"]
-                        array[i, j, 1] = 0
-                        array[i, j, 2] = 0
-
-                    else:
-                        array[i, j, :] = v.encode()
+        if vis_mask is not None:
+            array[~vis_mask] = 0
 
         return array
 
@@ -243,53 +628,19 @@ class Grid:
         width, height, channels = array.shape
         assert channels == 3
 
-        vis_mask = np.ones(shape=(width, height), dtype=bool)
+        vis_mask = array[:, :, 0] != OBJECT_TO_IDX["unseen"]
+        seen = vis_mask & (array[:, :, 0] != OBJECT_TO_IDX["empty"])
 
         grid = Grid(width, height)
-        for i in range(width):
-            for j in range(height):
-                type_idx, color_idx, state = array[i, j]
-                v = WorldObj.decode(type_idx, color_idx, state)
-                grid.set(i, j, v)
-                vis_mask[i, j] = type_idx != OBJECT_TO_IDX["unseen"]
+        grid._encoding[seen] = array[seen]
 
         return grid, vis_mask
 
     def process_vis(self, agent_pos):
-        mask = np.zeros(shape=(self.width, self.height), dtype=bool)
-
-        mask[agent_pos[0], agent_pos[1]] = True
-
-        for j in reversed(range(0, self.height)):
-            for i in range(0, self.width - 1):
-                if not mask[i, j]:
-                    continue
-
-                cell = self.get(i, j)
-                if cell and not cell.see_behind():
-                    continue
-
-                mask[i + 1, j] = True
-                if j > 0:
-                    mask[i + 1, j - 1] = True
-                    mask[i, j - 1] = True
-
-            for i in reversed(range(1, self.width)):
-                if not mask[i, j]:
-                    continue
-
-                cell = self.get(i, j)
-                if cell and not cell.see_behind():
-                    continue
-
-                mask[i - 1, j] = True
-                if j > 0:
-                    mask[i - 1, j - 1] = True
-                    mask[i, j - 1] = True
+        mask = compute_vis_mask(self._encoding, agent_pos)
 
-        for j in range(0, self.height):
-            for i in range(0, self.width):
-                if not mask[i, j]:
-                    self.set(i, j, None)
+        for i, j in zip(*np.nonzero(self.objs.astype(bool) & ~mask)):
+            self._detach(i, j)
+        self._encoding[~mask] = EMPTY_ENCODING
 
         return mask
@@ -0,0 +1,165 @@
+"""
+Reachability and shortest-path distances over encoded grids.
+
+Searches are breadth-first, one wavefront at a time. Masks of cells are
+stored as bitboards, Python ints where bit `y * (width + 1) + x` is cell
+(x, y), the extra column keeping shifted rows from wrapping around. Each
+wavefront is then computed for the whole grid at once from the previous
+one with a few shifts, and NumPy converts the masks back to arrays.
+"""
+import numpy as np
+
+from minigrid.core.constants import OBJECT_TO_IDX, STATE_TO_IDX
+
+# Distance of the cells that can't be reached
+UNREACHABLE = -1
+
+
+def passable_mask(encoding, doors="closed", lava=False):
+    """
+    Mask of the cells of an encoded grid the agent can move through: empty
+    cells, floors and goals, lava if `lava` is set, and doors depending on
+    `doors`: "open" for open doors only, "closed" to also go through closed
+    doors, which the agent can open, or "locked" for all doors.
+    """
+
+    types = encoding[:, :, 0]
+    states = encoding[:, :, 2]
+
+    passable = (
+        (types == OBJECT_TO_IDX["empty"])
+        | (types == OBJECT_TO_IDX["floor"])
+        | (types == OBJECT_TO_IDX["goal"])
+    )
+    if lava:
+        passable |= types == OBJECT_TO_IDX["lava"]
+
+    # Door states are ordered open, closed, locked
+    assert doors in ("open", "closed", "locked")
+    passable |= (types == OBJECT_TO_IDX["door"]) & (states <= STATE_TO_IDX[doors])
+
+    return passable
+
+
+def _to_bits(mask):
+    """
+    Bitboard of a (width, height) mask
+    """
+
+    width, height = mask.shape
+    rows = np.zeros((height, width + 1), dtype=bool)
+    rows[:, :width] = mask.T
+
+    return int.from_bytes(np.packbits(rows, bitorder="little").tobytes(), "little")
+
+
+def _from_bits(bitboards, width, height):
+    """
+    Masks of shape (n, width, height) of a list of n bitboards
+    """
+
+    stride = width + 1
+    num_bytes = (height * stride + 7) // 8
+
+    data = b"".join(bits.to_bytes(num_bytes, "little") for bits in bitboards)
+    data = np.frombuffer(data, dtype=np.uint8).reshape(len(bitboards), num_bytes)
+    masks = np.unpackbits(data, axis=1, count=height * stride, bitorder="little")
+    masks = masks.reshape(len(bitboards), height, stride)[:, :, :width]
+
+    return masks.swapaxes(1, 2).astype(bool)
+
+
+def _source_mask(sources, shape):
+    """
+    Mask of the source cells, given as a mask or a single (x, y) position
+    """
+
+    if isinstance(sources, np.ndarray) and sources.dtype == bool:
+        assert sources.shape == shape
+        return sources
+
+    mask = np.zeros(shape, dtype=bool)
+    mask[sources[0], sources[1]] = True
+
+    return mask
+
+
+def _wavefronts(front, passable, reachable, stride):
+    """
+    Breadth-first search from the cells of `front`, moving through the
+    `passable` cells into the `reachable` ones. The first wavefront always
+    spreads, as it holds the starting cells. Returns the list of wavefronts.
+    """
+
+    fronts = []
+    reached = moving = front
+
+    while front:
+        fronts.append(front)
+        front = (
+            (moving << 1) | (moving >> 1) | (moving << stride) | (moving >> stride)
+        ) & reachable
+        front &= ~reached
+        reached |= front
+        moving = front & passable
+
+    return fronts
+
+
+def distance_field(passable, sources):
+    """
+    Shortest-path distances, in moves, from the nearest of `sources` to
+    every cell of a grid, given the mask of its passable cells.
+
+    The agent does not move through the other cells, but they get the
+    distance at which the agent would be facing them plus one, so that an
+    object is reachable if its distance is not UNREACHABLE. `sources` is
+    either a position (x, y) or a mask of the starting cells.
+    """
+
+    width, height = passable.shape
+    sources = _source_mask(sources, passable.shape)
+
+    fronts = _wavefronts(
+        _to_bits(sources),
+        _to_bits(passable),
+        _to_bits(np.ones_like(passable)),
+        width + 1,
+    )
+
+    dist = np.full((width, height), UNREACHABLE, dtype=np.int32)
+    if fronts:
+        masks = _from_bits(fronts, width, height)
+        reached = masks.any(axis=0)
+        dist[reached] = masks.argmax(axis=0)[reached]
+
+    return dist
+
+
+def component_labels(passable):
+    """
+    Label the connected components of the passable cells of a grid, from 0
+    in the order of their first cell in row-major order. Other cells are
+    labelled UNREACHABLE.
+    """
+
+    width, height = passable.shape
+    passable_bits = remaining = _to_bits(passable)
+
+    components = []
+    while remaining:
+        # Flood the component of the lowest remaining cell
+        seed = remaining & -remaining
+        fronts = _wavefronts(seed, passable_bits, passable_bits, width + 1)
+        component = 0
+        for front in fronts:
+            component |= front
+        components.append(component)
+        remaining &= ~component
+
+    labels = np.full((width, height), UNREACHABLE, dtype=np.int32)
+    if components:
+        masks = _from_bits(components, width, height)
+        labels[passable] = masks.argmax(axis=0)[passable]
+
+    return labels
@@ -18,6 +18,15 @@ def reject_next_to(env, pos):
     return d < 2
 
 
+def reject_next_to_mask(env, xs, ys):
+    """
+    Vectorized version of `reject_next_to` over arrays of coordinates
+    """
+
+    sx, sy = env.agent_pos
+    return abs(sx - xs) + abs(sy - ys) < 2
+
+
 class Room:
     def __init__(self, top, size):
         # Top-left corner and size (tuples)
@@ -184,7 +193,7 @@ class RoomGrid(MiniGridEnv):
         room = self.get_room(i, j)
 
         pos = self.place_obj(
-            obj, room.top, room.size, reject_fn=reject_next_to, max_tries=1000
+            obj, room.top, room.size, reject_mask=reject_next_to_mask, max_tries=1000
         )
 
         room.objs.append(obj)
@@ -313,56 +322,71 @@ class RoomGrid(MiniGridEnv):
     def connect_all(self, door_colors=COLOR_NAMES, max_itrs=5000):
         """
         Make sure that all rooms are reachable by the agent from its
-        starting position
+        starting position.
+
+        Doors are added on walls drawn uniformly among those without a door
+        between two unlocked rooms, until all rooms are connected to the
+        starting room. Connectivity is tracked incrementally with a
+        union-find over the rooms.
         """
 
+        num_rooms = self.num_rows * self.num_cols
+
+        # Union-find over the rooms, indexed by j * num_cols + i
+        parent = list(range(num_rooms))
+        size = [1] * num_rooms
+
+        def find(room):
+            while parent[room] != room:
+                parent[room] = parent[parent[room]]
+                room = parent[room]
+            return room
+
+        def union(room, other):
+            room, other = find(room), find(other)
+            if room != other:
+                if size[room] < size[other]:
+                    room, other = other, room
+                parent[other] = room
+                size[room] += size[other]
+
+        # Walls a door can be added on, each listed once from the room on
+        # their left or top side
+        candidates = []
+        for j in range(0, self.num_rows):
+            for i in range(0, self.num_cols):
+                room = self.room_grid[j][i]
+                for k, other in ((0, (i + 1, j)), (1, (i, j + 1))):
+                    if not room.neighbors[k]:
+                        continue
+                    other = other[1] * self.num_cols + other[0]
+                    if room.doors[k]:
+                        union(j * self.num_cols + i, other)
+                    elif not room.locked and not room.neighbors[k].locked:
+                        candidates.append((i, j, k, other))
+
         start_room = self.room_from_pos(*self.agent_pos)
+        start_i, start_j = (p // (self.room_size - 1) for p in start_room.top)
+        start = start_j * self.num_cols + start_i
 
         added_doors = []
 
-        def find_reach():
-            reach = set()
-            stack = [start_room]
-            while len(stack) > 0:
-                room = stack.pop()
-                if room in reach:
-                    continue
-                reach.add(room)
-                for i in range(0, 4):
-                    if room.doors[i]:
-                        stack.append(room.neighbors[i])
-            return reach
-
-        num_itrs = 0
-
-        while True:
+        # If all rooms are reachable, stop
+        while size[find(start)] < num_rooms:
             # This is to handle rare situations where random sampling produces
-            # a level that cannot be connected, producing in an infinite loop
-            if num_itrs > max_itrs:
+            # a level that cannot be connected
+            if len(candidates) == 0 or len(added_doors) >= max_itrs:
                 raise RecursionError("connect_all failed")
-            num_itrs += 1
-
-            # If all rooms are reachable, stop
-            reach = find_reach()
-            if len(reach) == self.num_rows * self.num_cols:
-                break
-
-            # Pick a random room and door position
-            i = self._rand_int(0, self.num_cols)
-            j = self._rand_int(0, self.num_rows)
-            k = self._rand_int(0, 4)
-            room = self.get_room(i, j)
 
-            # If there is already a door there, skip
-            if not room.door_pos[k] or room.doors[k]:
-                continue
-
-            if room.locked or room.neighbors[k].locked:
-                continue
+            # Pick a random wall without a door
+            idx = self._rand_int(0, len(candidates))
+            candidates[idx], candidates[-1] = candidates[-1], candidates[idx]
+            i, j, k, other = candidates.pop()
 
             color = self._rand_elem(door_colors)
             door, _ = self.add_door(i, j, k, color, False)
             added_doors.append(door)
+            union(j * self.num_cols + i, other)
 
         return added_doors
 
@@ -0,0 +1,513 @@
+import math
+import os
+import tempfile
+from collections import OrderedDict
+
+import numpy as np
+
+from minigrid.core.constants import (
+    COLOR_TO_IDX,
+    OBJECT_TO_IDX,
+    STATE_TO_IDX,
+    TILE_PIXELS,
+)
+from minigrid.core.world_object import WorldObj
+from minigrid.utils.rendering import (
+    downsample,
+    fill_coords,
+    highlight_img,
+    point_in_rect,
+    point_in_triangle,
+    rotate_fn,
+)
+
+# Number of values of each part of a tile code. The agent direction takes
+# one more value than there are directions, for tiles without the agent.
+NUM_TILE_TYPES = len(OBJECT_TO_IDX)
+NUM_TILE_COLORS = len(COLOR_TO_IDX)
+NUM_TILE_STATES = len(STATE_TO_IDX)
+NUM_TILE_DIRS = 5
+
+# Number of distinct tile codes
+NUM_TILE_CODES = NUM_TILE_TYPES * NUM_TILE_COLORS * NUM_TILE_STATES * NUM_TILE_DIRS * 2
+
+# Default memory budget of a tile cache, in bytes. An atlas of all the
+# tiles at the default tile size takes about 2MB.
+DEFAULT_TILE_CACHE_BYTES = 64 * 2**20
+
+
+def tile_code(obj_encoding=None, agent_dir=None, highlight=False):
+    """
+    Compute the code identifying the tile of a cell, given the encoding of
+    the object in the cell (None if the cell is empty), the direction of the
+    agent if it is in the cell and whether the cell is highlighted
+    """
+
+    type_idx, color, state = obj_encoding or (OBJECT_TO_IDX["empty"], 0, 0)
+    if type_idx <= OBJECT_TO_IDX["empty"]:
+        type_idx, color, state = OBJECT_TO_IDX["empty"], 0, 0
+
+    code = (type_idx * NUM_TILE_COLORS + color) * NUM_TILE_STATES + state
+    code = code * NUM_TILE_DIRS + (0 if agent_dir is None else agent_dir + 1)
+
+    return code * 2 + bool(highlight)
+
+
+def tile_codes(encoding, agent_pos=None, agent_dir=None, highlight_mask=None):
+    """
+    Compute the tile code of every cell of an encoded grid, or of a batch of
+    encoded grids of shape (..., width, height, 3) with one agent position,
+    direction and highlight mask per grid
+    """
+
+    width, height = encoding.shape[-3:-1]
+
+    codes = encoding.astype(np.int32)
+    types, colors, states = codes[..., 0], codes[..., 1], codes[..., 2]
+
+    # Unseen and empty cells are both rendered as empty tiles
+    empty = types <= OBJECT_TO_IDX["empty"]
+    types[empty] = OBJECT_TO_IDX["empty"]
+    colors[empty] = 0
+    states[empty] = 0
+
+    codes = (types * NUM_TILE_COLORS + colors) * NUM_TILE_STATES + states
+    codes *= NUM_TILE_DIRS
+
+    if agent_dir is not None:
+        xs, ys = np.reshape(agent_pos, (-1, 2)).T
+        dirs = np.reshape(agent_dir, -1)
+
+        # Add the agent to its cell in each grid, if it is inside the grid
+        inside = (xs >= 0) & (xs < width) & (ys >= 0) & (ys < height)
+        grids = codes.reshape(-1, width, height)
+        grids[np.flatnonzero(inside), xs[inside], ys[inside]] += dirs[inside] + 1
+
+    codes *= 2
+    if highlight_mask is not None:
+        codes += highlight_mask
+
+    return codes
+
+
+def all_tile_codes():
+    """
+    List the codes of all the tiles that can be rendered from an encoding:
+    every object type and color (and door state), with and without the agent
+    in each direction, highlighted or not
+    """
+
+    encodings = [None]
+    for type_name, type_idx in OBJECT_TO_IDX.items():
+        if type_name in ("unseen", "empty", "agent"):
+            continue
+        num_states = NUM_TILE_STATES if type_name == "door" else 1
+        for color in range(NUM_TILE_COLORS):
+            for state in range(num_states):
+                encodings.append((type_idx, color, state))
+
+    return np.array(
+        [
+            tile_code(encoding, agent_dir, highlight)
+            for encoding in encodings
+            for agent_dir in (None, 0, 1, 2, 3)
+            for highlight in (False, True)
+        ]
+    )
+
+
+def decode_tile_code(code):
+    """
+    Get the object, agent direction and highlighting of a tile code
+    """
+
+    code, highlight = divmod(int(code), 2)
+    code, agent_dir = divmod(code, NUM_TILE_DIRS)
+    code, state = divmod(code, NUM_TILE_STATES)
+    type_idx, color = divmod(code, NUM_TILE_COLORS)
+
+    obj = WorldObj.decode(type_idx, color, state)
+    agent_dir = agent_dir - 1 if agent_dir else None
+
+    return obj, agent_dir, bool(highlight)
+
+
+def render_tile(obj, agent_dir=None, highlight=False, tile_size=TILE_PIXELS, subdivs=3):
+    """
+    Render a tile, without caching the result
+    """
+
+    img = np.zeros(shape=(tile_size * subdivs, tile_size * subdivs, 3), dtype=np.uint8)
+
+    # Draw the grid lines (top and left edges)
+    fill_coords(img, point_in_rect(0, 0.031, 0, 1), (100, 100, 100))
+    fill_coords(img, point_in_rect(0, 1, 0, 0.031), (100, 100, 100))
+
+    if obj is not None:
+        obj.render(img)
+
+    # Overlay the agent on top
+    if agent_dir is not None:
+        tri_fn = point_in_triangle(
+            (0.12, 0.19),
+            (0.87, 0.50),
+            (0.12, 0.81),
+        )
+
+        # Rotate the agent based on its direction
+        tri_fn = rotate_fn(tri_fn, cx=0.5, cy=0.5, theta=0.5 * math.pi * agent_dir)
+        fill_coords(img, tri_fn, (255, 0, 0))
+
+    # Highlight the cell if needed
+    if highlight:
+        highlight_img(img)
+
+    # Downsample the image to perform supersampling/anti-aliasing
+    return downsample(img, subdivs)
+
+
+class TileAtlas:
+    """
+    Rendered tiles of one size, stacked in a single array so that the tiles
+    of a whole grid can be gathered at once. Tiles are rendered the first
+    time their code is looked up.
+    """
+
+    def __init__(self, tile_size=TILE_PIXELS, subdivs=3):
+        self.tile_size = tile_size
+        self.subdivs = subdivs
+
+        # Index of the tile of each code in `tiles`, -1 if not rendered yet
+        self.slots = np.full(NUM_TILE_CODES, -1, dtype=np.int32)
+        self.tiles = np.zeros((16, tile_size, tile_size, 3), dtype=np.uint8)
+        self.num_tiles = 0
+
+        # Number of tiles looked up that were already rendered, and number
+        # of tiles rendered
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def num_bytes(self):
+        """
+        Size of the tile storage of the atlas, in bytes
+        """
+
+        return self.tiles.nbytes
+
+    def add(self, code, obj=None):
+        """
+        Render the tile of a code and store it in the atlas. The object
+        decoded from the code is drawn unless `obj` is given.
+        """
+
+        decoded, agent_dir, highlight = decode_tile_code(code)
+        if obj is None:
+            obj = decoded
+
+        if self.num_tiles == len(self.tiles):
+            self.tiles = np.concatenate([self.tiles, np.zeros_like(self.tiles)])
+
+        slot = self.num_tiles
+        self.tiles[slot] = render_tile(
+            obj, agent_dir, highlight, self.tile_size, self.subdivs
+        )
+        self.slots[code] = slot
+        self.num_tiles += 1
+
+        return slot
+
+    def lookup(self, codes):
+        """
+        Get the slots of an array of tile codes, rendering missing tiles
+        """
+
+        slots = self.slots[codes]
+
+        num_missing = 0
+        missing = slots < 0
+        if missing.any():
+            missing = np.unique(codes[missing])
+            for code in missing:
+                self.add(code)
+            num_missing = len(missing)
+            slots = self.slots[codes]
+
+        self.hits += slots.size - num_missing
+        self.misses += num_missing
+
+        return slots
+
+    def get_tile(self, code, obj=None):
+        """
+        Get the tile of a single code, rendering it with `obj` if missing
+        """
+
+        slot = self.slots[code]
+        if slot < 0:
+            slot = self.add(code, obj)
+            self.misses += 1
+        else:
+            self.hits += 1
+
+        return self.tiles[slot]
+
+    def gather(self, codes):
+        """
+        Get the tiles of an array of tile codes, rendering missing tiles
+        """
+
+        slots = self.lookup(codes)
+
+        return self.tiles[slots]
+
+    def build(self):
+        """
+        Render all the tiles that are not in the atlas yet
+        """
+
+        self.lookup(all_tile_codes())
+
+    def save(self, path):
+        """
+        Render all the tiles and write them to an atlas file. The file is
+        written to a temporary file first, so that processes sharing the
+        atlas never read a partially written file.
+        """
+
+        tiles = self.gather(all_tile_codes())
+
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.save(f, tiles)
+            os.chmod(tmp_path, 0o644)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+    @classmethod
+    def load(cls, path, tile_size=TILE_PIXELS, subdivs=3):
+        """
+        Load an atlas file written by `save`. The tiles are memory-mapped
+        read-only, so that processes loading the same file share its pages.
+        """
+
+        codes = all_tile_codes()
+        tiles = np.load(path, mmap_mode="r")
+
+        if tiles.shape != (len(codes), tile_size, tile_size, 3):
+            raise ValueError(
+                f"atlas file {path} holds tiles of shape {tiles.shape[1:]}, "
+                f"expected {len(codes)} tiles of size {tile_size}"
+            )
+
+        atlas = cls(tile_size, subdivs)
+        atlas.tiles = tiles
+        atlas.slots[codes] = np.arange(len(codes))
+        atlas.num_tiles = len(codes)
+
+        return atlas
+
+    def render(self, codes, out=None):
+        """
+        Render an image from a (width, height) array of tile codes, or a
+        batch of images from an array of shape (..., width, height). The
+        images are written to `out` if given.
+        """
+
+        *batch, width, height = codes.shape
+        tile_size = self.tile_size
+        shape = (*batch, height * tile_size, width * tile_size, 3)
+
+        # Gather the tiles in (row, column) order then interleave the pixel
+        # rows of the tiles of each grid row
+        tiles = self.gather(codes.swapaxes(-1, -2)).swapaxes(-3, -4)
+
+        if out is None:
+            return tiles.reshape(shape)
+
+        if out.shape != shape:
+            raise ValueError(f"output of shape {out.shape}, expected {shape}")
+
+        # Write the tiles through a view of `out` with one axis per tile row
+        # and column, which fails rather than copying if `out` is strided
+        view = out.view()
+        view.shape = tiles.shape
+        view[...] = tiles
+
+        return out
+
+
+class TileCache:
+    """
+    Tile atlases of all the tile sizes used for rendering
+
+    The atlases are kept within a memory budget of `max_bytes` (None for no
+    limit), by evicting the least recently used ones. The most recently used
+    atlas is always kept, even if it is larger than the budget. Hits, misses
+    and evicted tiles are counted, see `stats`.
+
+    If `path` is given, atlases are stored as files in that directory, one
+    per tile size and number of subdivisions. The first process needing an
+    atlas renders all its tiles and writes the file, and the atlas is then
+    memory-mapped from the file, e.g. to share it between worker processes:
+
+        Grid.tile_cache = TileCache("~/.cache/minigrid")
+    """
+
+    def __init__(self, path=None, max_bytes=DEFAULT_TILE_CACHE_BYTES):
+        self.path = os.path.expanduser(path) if path is not None else None
+        self.max_bytes = max_bytes
+        self.atlases = OrderedDict()
+
+        self.reset_stats()
+
+    def atlas_file(self, tile_size=TILE_PIXELS, subdivs=3):
+        """
+        Get the path of the atlas file of a tile size
+        """
+
+        return os.path.join(self.path, f"tiles_{tile_size}x{subdivs}.npy")
+
+    def _create_atlas(self, tile_size, subdivs):
+        if self.path is None:
+            return TileAtlas(tile_size, subdivs)
+
+        path = self.atlas_file(tile_size, subdivs)
+        if not os.path.exists(path):
+            os.makedirs(self.path, exist_ok=True)
+            TileAtlas(tile_size, subdivs).save(path)
+
+        return TileAtlas.load(path, tile_size, subdivs)
+
+    def get_atlas(self, tile_size=TILE_PIXELS, subdivs=3):
+        """
+        Get the atlas of a tile size, creating it if needed
+        """
+
+        key = (tile_size, subdivs)
+        atlas = self.atlases.get(key)
+
+        if atlas is None:
+            atlas = self._create_atlas(tile_size, subdivs)
+            self.atlases[key] = atlas
+        else:
+            self.atlases.move_to_end(key)
+
+        # Tiles rendered since the last call are only accounted for here
+        if self.max_bytes is not None:
+            self._evict(self.max_bytes)
+
+        return atlas
+
+    def _evict(self, max_bytes):
+        num_bytes = self.num_bytes
+        while num_bytes > max_bytes and len(self.atlases) > 1:
+            _, atlas = self.atlases.popitem(last=False)
+            num_bytes -= atlas.num_bytes
+            self._drop(atlas)
+            self.evictions += atlas.num_tiles
+
+    def _drop(self, atlas):
+        # Keep the counters of the dropped atlases
+        self._hits += atlas.hits
+        self._misses += atlas.misses
+
+    @property
+    def num_bytes(self):
+        """
+        Size of the tile storage of all the atlases, in bytes
+        """
+
+        return sum(atlas.num_bytes for atlas in self.atlases.values())
+
+    def prewarm(self, tile_sizes=(TILE_PIXELS,), subdivs=3):
+        """
+        Render all the tiles of some tile sizes ahead of time
+        """
+
+        for tile_size in tile_sizes:
+            self.get_atlas(tile_size, subdivs).build()
+
+    def stats(self):
+        """
+        Get the counters of the cache: tiles looked up that were already
+        rendered (hits), rendered tiles (misses), tiles evicted to stay
+        within the budget, and current number of atlases and bytes used
+        """
+
+        atlases = self.atlases.values()
+
+        return {
+            "hits": self._hits + sum(atlas.hits for atlas in atlases),
+            "misses": self._misses + sum(atlas.misses for atlas in atlases),
+            "evictions": self.evictions,
+            "num_atlases": len(self.atlases),
+            "num_bytes": self.num_bytes,
+        }
+
+    def reset_stats(self):
+        """
+        Reset the hit, miss and eviction counters
+        """
+
+        for atlas in self.atlases.values():
+            atlas.hits = 0
+            atlas.misses = 0
+
+        self._hits = 0
+        self._misses = 0
+        self.evictions = 0
+
+    def clear(self):
+        """
+        Drop all the rendered tiles. Atlas files are kept.
+        """
+
+        for atlas in self.atlases.values():
+            self._drop(atlas)
+        self.atlases.clear()
+
+
+class FrameCache:
+    """
+    Last frame rendered from a grid, along with the tile code of each cell,
+    so that the next frame is drawn by replacing only the tiles of the cells
+    whose code changed (e.g. the cells the agent left and entered, a door
+    that opened, or the cells entering and leaving the highlighted view)
+    """
+
+    def __init__(self):
+        # The atlas is identified by its (tile_size, subdivs) key rather than
+        # held, so that the frame doesn't keep evicted atlases alive
+        self.atlas_key = None
+        self.codes = None
+        self.img = None
+
+    def render(self, atlas, codes):
+        """
+        Update the frame from a (width, height) array of tile codes and
+        return it. The returned image is updated in place by later calls.
+        """
+
+        atlas_key = (atlas.tile_size, atlas.subdivs)
+        if (
+            self.img is None
+            or self.atlas_key != atlas_key
+            or self.codes.shape != codes.shape
+        ):
+            self.img = atlas.render(codes)
+        else:
+            xs, ys = np.nonzero(codes != self.codes)
+            if len(xs) > 0:
+                width, height = codes.shape
+                tile_size = atlas.tile_size
+                tiles = self.img.reshape(height, tile_size, width, tile_size, 3)
+                tiles[ys, :, xs] = atlas.gather(codes[xs, ys])
+
+        self.atlas_key = atlas_key
+        self.codes = codes
+
+        return self.img
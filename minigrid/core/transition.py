@@ -0,0 +1,218 @@
+"""
+Pure transition function of MiniGrid environments on encoded states.
+
+`transition` applies actions to encoded states with the semantics of
+`MiniGridEnv.step` for the built-in objects, returning new states rather
+than changing the environment, so that many actions can be evaluated from
+the same state. An encoded state is a dictionary of arrays, all of them
+with the same leading batch dimensions (none for a single state):
+
+- "grid": (..., width, height, 3) encoded grids
+- "agent_pos": (..., 2) positions of the agents
+- "agent_dir": (...) directions of the agents
+- "carrying": (..., 3) encodings of the carried objects, EMPTY_ENCODING
+  when the agent carries nothing
+- "contents": (..., width, height, 3) encodings of the contents of the
+  boxes in the grids, EMPTY_ENCODING for empty boxes and other cells
+- "carrying_contents": (..., 3) encodings of the contents of the carried
+  boxes
+- "step_count": (...) step counts
+
+Boxes are opened one level at a time: the contents of objects in boxes are
+not part of the state, so these objects are empty once revealed.
+Environments overriding `step` (e.g. moving obstacles or checking
+missions) add their own rules on top of these.
+"""
+import numpy as np
+
+from minigrid.core.actions import Actions
+from minigrid.core.constants import DIR_TO_VEC, OBJECT_TO_IDX, STATE_TO_IDX
+from minigrid.core.grid import EMPTY_ENCODING
+from minigrid.core.world_object import WorldObj
+
+
+def _object_tables():
+    """
+    Tables of whether the agent can walk on, pick up and toggle the objects
+    decoded from each type and state
+    """
+
+    shape = (len(OBJECT_TO_IDX), len(STATE_TO_IDX))
+    can_overlap = np.zeros(shape, dtype=bool)
+    can_pickup = np.zeros(shape, dtype=bool)
+    can_toggle = np.zeros(shape, dtype=bool)
+
+    can_overlap[OBJECT_TO_IDX["empty"]] = True
+
+    for type_name, type_idx in OBJECT_TO_IDX.items():
+        if type_name in ("unseen", "empty", "agent"):
+            continue
+        for state in STATE_TO_IDX.values():
+            obj = WorldObj.decode(type_idx, 0, state)
+            can_overlap[type_idx, state] = obj.can_overlap()
+            can_pickup[type_idx, state] = obj.can_pickup()
+            can_toggle[type_idx, state] = type(obj).toggle is not WorldObj.toggle
+
+    return can_overlap, can_pickup, can_toggle
+
+
+CAN_OVERLAP, CAN_PICKUP, CAN_TOGGLE = _object_tables()
+
+DIR_VECS = np.array(DIR_TO_VEC)
+
+# Actions as plain integers, which are faster to compare arrays with
+LEFT, RIGHT, FORWARD, PICKUP, DROP, TOGGLE, DONE = (int(a) for a in Actions)
+
+
+def _encode(obj):
+    return EMPTY_ENCODING if obj is None else obj.encode()
+
+
+def encode_state(env):
+    """
+    Encoded state of an environment, see the module documentation
+    """
+
+    grid = env.grid
+    contents = np.empty_like(grid.encoding)
+    contents[:, :] = EMPTY_ENCODING
+    for x, y in np.argwhere(grid.encoding[:, :, 0] == OBJECT_TO_IDX["box"]):
+        contents[x, y] = _encode(grid.get(x, y).contains)
+
+    carrying = env.carrying
+    carrying_contents = None if carrying is None else carrying.contains
+
+    return {
+        "grid": grid.encoding.copy(),
+        "agent_pos": np.array(env.agent_pos, dtype=np.int64),
+        "agent_dir": np.array(env.agent_dir, dtype=np.int64),
+        "carrying": np.array(_encode(carrying), dtype=np.uint8),
+        "contents": contents,
+        "carrying_contents": np.array(_encode(carrying_contents), dtype=np.uint8),
+        "step_count": np.array(env.step_count, dtype=np.int64),
+    }
+
+
+def stack_states(states):
+    """
+    Stack encoded states into a batch
+    """
+
+    return {key: np.stack([state[key] for state in states]) for key in states[0]}
+
+
+def _flat(array, batch_shape, item_shape=()):
+    """
+    Copy of an array broadcast to the batch shape, with flat batch dimensions
+    """
+
+    array = np.broadcast_to(array, batch_shape + item_shape)
+    return array.reshape((-1,) + item_shape).copy()
+
+
+def transition(state, action, max_steps):
+    """
+    Apply actions to encoded states, as `MiniGridEnv.step` does. The states,
+    `action` and `max_steps` are broadcast together, so that e.g. all the
+    actions can be applied to a single state with `np.arange(7)`. Returns
+    the new states, along with the rewards and whether the episodes
+    terminated or were truncated.
+    """
+
+    width, height = state["grid"].shape[-3:-1]
+    batch_shape = np.broadcast_shapes(
+        np.shape(state["agent_dir"]), np.shape(action), np.shape(max_steps)
+    )
+
+    # Work on flat batches of copies of the states
+    cells_shape = (width, height, 3)
+    grid = _flat(state["grid"], batch_shape, cells_shape)
+    contents = _flat(state["contents"], batch_shape, cells_shape)
+    agent_pos = _flat(state["agent_pos"], batch_shape, (2,)).astype(np.int64)
+    agent_dir = _flat(state["agent_dir"], batch_shape).astype(np.int64)
+    carrying = _flat(state["carrying"], batch_shape, (3,))
+    carrying_contents = _flat(state["carrying_contents"], batch_shape, (3,))
+    step_count = _flat(state["step_count"], batch_shape) + 1
+
+    action = _flat(action, batch_shape)
+    max_steps = _flat(max_steps, batch_shape)
+    if np.any((action < 0) | (action > DONE)):
+        raise ValueError(f"Unknown action: {action}")
+
+    num_states = len(agent_dir)
+    idx = np.arange(num_states)
+    reward = np.zeros(num_states)
+    terminated = np.zeros(num_states, dtype=bool)
+
+    # Contents of the cells in front of the agents
+    fwd_pos = agent_pos + DIR_VECS[agent_dir]
+    fwd_x = np.minimum(np.maximum(fwd_pos[:, 0], 0), width - 1)
+    fwd_y = np.minimum(np.maximum(fwd_pos[:, 1], 0), height - 1)
+    fwd_type, fwd_color, fwd_state = grid[idx, fwd_x, fwd_y].T.astype(np.int64)
+
+    # Rotate left and right
+    agent_dir = (agent_dir - (action == LEFT) + (action == RIGHT)) % 4
+
+    # Move forward
+    forward = action == FORWARD
+    move = forward & CAN_OVERLAP[fwd_type, fwd_state]
+    agent_pos[move] = fwd_pos[move]
+
+    goal = forward & (fwd_type == OBJECT_TO_IDX["goal"])
+    lava = forward & (fwd_type == OBJECT_TO_IDX["lava"])
+    terminated[goal | lava] = True
+    reward[goal] = 1 - 0.9 * (step_count[goal] / max_steps[goal])
+
+    # Pick up an object
+    empty_handed = carrying[:, 0] == OBJECT_TO_IDX["empty"]
+    pickup = (action == PICKUP) & CAN_PICKUP[fwd_type, fwd_state]
+    pickup &= empty_handed
+    cells = (idx[pickup], fwd_x[pickup], fwd_y[pickup])
+    carrying[pickup] = grid[cells]
+    carrying_contents[pickup] = contents[cells]
+    grid[cells] = EMPTY_ENCODING
+    contents[cells] = EMPTY_ENCODING
+
+    # Drop the carried object
+    drop = (action == DROP) & (fwd_type == OBJECT_TO_IDX["empty"])
+    drop &= ~empty_handed
+    cells = (idx[drop], fwd_x[drop], fwd_y[drop])
+    grid[cells] = carrying[drop]
+    contents[cells] = carrying_contents[drop]
+    carrying[drop] = EMPTY_ENCODING
+    carrying_contents[drop] = EMPTY_ENCODING
+
+    # Open and close doors, unlocking them with a key of the same color
+    toggle = action == TOGGLE
+    door = toggle & (fwd_type == OBJECT_TO_IDX["door"])
+    locked = fwd_state == STATE_TO_IDX["locked"]
+    unlock = door & locked & (carrying[:, 0] == OBJECT_TO_IDX["key"])
+    unlock &= carrying[:, 1] == fwd_color
+    grid[idx[unlock], fwd_x[unlock], fwd_y[unlock], 2] = STATE_TO_IDX["open"]
+    door &= ~locked
+    grid[idx[door], fwd_x[door], fwd_y[door], 2] = 1 - fwd_state[door]
+
+    # Replace boxes by their contents
+    box = toggle & (fwd_type == OBJECT_TO_IDX["box"])
+    cells = (idx[box], fwd_x[box], fwd_y[box])
+    grid[cells] = contents[cells]
+    contents[cells] = EMPTY_ENCODING
+
+    truncated = step_count >= max_steps
+
+    new_state = {
+        "grid": grid.reshape(batch_shape + (width, height, 3)),
+        "agent_pos": agent_pos.reshape(batch_shape + (2,)),
+        "agent_dir": agent_dir.reshape(batch_shape),
+        "carrying": carrying.reshape(batch_shape + (3,)),
+        "contents": contents.reshape(batch_shape + (width, height, 3)),
+        "carrying_contents": carrying_contents.reshape(batch_shape + (3,)),
+        "step_count": step_count.reshape(batch_shape),
+    }
+
+    return (
+        new_state,
+        reward.reshape(batch_shape),
+        terminated.reshape(batch_shape),
+        truncated.reshape(batch_shape),
+    )
@@ -23,6 +23,12 @@ class WorldObj:
     def __init__(self, type, color):
         assert type in OBJECT_TO_IDX, type
         assert color in COLOR_TO_IDX, color
+
+        # Grid holding the object and position in that grid, used to keep
+        # the grid encoding up to date when the object state changes
+        self._grid = None
+        self._grid_pos = None
+
         self.type = type
         self.color = color
         self.contains = None
@@ -33,6 +39,40 @@ class WorldObj:
         # Current position of the object
         self.cur_pos = None
 
+    @property
+    def type(self):
+        return self._type
+
+    @type.setter
+    def type(self, value):
+        self._type = value
+        self.update_encoding()
+
+    @property
+    def color(self):
+        return self._color
+
+    @color.setter
+    def color(self, value):
+        self._color = value
+        self.update_encoding()
+
+    def __getstate__(self):
+        # The link to the grid holding the object is set again when the
+        # grid is unpickled
+        state = self.__dict__.copy()
+        del state["_grid"], state["_grid_pos"]
+        return state
+
+    def __setstate__(self, state):
+        # Objects pickled before the encoded attributes became properties
+        for name in ("type", "color"):
+            if name in state:
+                state["_" + name] = state.pop(name)
+        state.setdefault("_grid", None)
+        state.setdefault("_grid_pos", None)
+        self.__dict__.update(state)
+
     def can_overlap(self):
         """Can the agent overlap with this?"""
         return False
@@ -57,6 +97,14 @@ class WorldObj:
         """Encode the a description of this object as a 3-tuple of integers"""
         return (OBJECT_TO_IDX[self.type], COLOR_TO_IDX[self.color], 0)
 
+    def update_encoding(self):
+        """
+        Propagate a change of the encoding of this object to the grid holding
+        it. Objects with mutable state must call this whenever it changes.
+        """
+        if self._grid is not None:
+            self._grid._update_cell(self)
+
     @staticmethod
     def decode(type_idx, color_idx, state):
         """Create an object from a 3-tuple state description"""
@@ -162,8 +210,26 @@ class Wall(WorldObj):
 class Door(WorldObj):
     def __init__(self, color, is_open=False, is_locked=False):
         super().__init__("door", color)
-        self.is_open = is_open
-        self.is_locked = is_locked
+        self._is_open = is_open
+        self._is_locked = is_locked
+
+    @property
+    def is_open(self):
+        return self._is_open
+
+    @is_open.setter
+    def is_open(self, value):
+        self._is_open = value
+        self.update_encoding()
+
+    @property
+    def is_locked(self):
+        return self._is_locked
+
+    @is_locked.setter
+    def is_locked(self, value):
+        self._is_locked = value
+        self.update_encoding()
 
     def can_overlap(self):
         """The agent can only walk over this cell when the door is open"""
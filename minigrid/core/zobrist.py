@@ -0,0 +1,121 @@
+"""
+Zobrist hashing of environment states.
+
+The hash of a state is the XOR of pseudo-random 64-bit keys, one per grid
+cell content, one for the agent pose and one for the carried object, so
+that changing a cell only takes XORing out its old key and XORing in the
+new one. Keys are computed with the splitmix64 finalizer rather than looked
+up in tables, which would need an entry for every content of every cell.
+"""
+import numpy as np
+
+from minigrid.core.constants import OBJECT_TO_IDX
+
+MASK = (1 << 64) - 1
+
+# Tags keeping the keys of cells, agent poses and carried objects apart
+AGENT_TAG = 1 << 60
+CARRYING_TAG = 2 << 60
+
+
+def mix64(x):
+    """
+    splitmix64 finalizer, mapping 64-bit integers to pseudo-random ones
+    """
+
+    x = (x + 0x9E3779B97F4A7C15) & MASK
+    x = ((x ^ (x >> 30)) * 0xBF58476D1CE4E5B9) & MASK
+    x = ((x ^ (x >> 27)) * 0x94D049BB133111EB) & MASK
+    return x ^ (x >> 31)
+
+
+def _mix64_array(x):
+    """
+    `mix64` of an array of uint64, with wrapping multiplications
+    """
+
+    x = x + np.uint64(0x9E3779B97F4A7C15)
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+
+def _code(type_idx, color_idx, state):
+    return type_idx | (color_idx << 4) | (state << 8)
+
+
+def cell_key(i, j, type_idx, color_idx, state):
+    """
+    Key of the content of cell (i, j), given by its encoding
+    """
+
+    return mix64((((int(i) << 16) | int(j)) << 12) | _code(type_idx, color_idx, state))
+
+
+def _grid_hashes(encodings):
+    """
+    Hashes of encoded grids of shape (..., width, height, 3), as an array
+    """
+
+    width, height = encodings.shape[-3:-1]
+    encodings = encodings.astype(np.uint64)
+
+    xs, ys = np.meshgrid(
+        np.arange(width, dtype=np.uint64),
+        np.arange(height, dtype=np.uint64),
+        indexing="ij",
+    )
+    codes = _code(encodings[..., 0], encodings[..., 1], encodings[..., 2])
+    keys = _mix64_array((((xs << np.uint64(16)) | ys) << np.uint64(12)) | codes)
+
+    return np.bitwise_xor.reduce(keys, axis=(-2, -1))
+
+
+def grid_hash(encoding):
+    """
+    Hash of an encoded grid, the XOR of the keys of all its cells
+    """
+
+    return int(_grid_hashes(encoding))
+
+
+def agent_key(agent_pos, agent_dir):
+    """
+    Key of the pose of the agent
+    """
+
+    x, y = agent_pos
+    return mix64(AGENT_TAG | (((int(x) << 16) | int(y)) << 4) | int(agent_dir))
+
+
+def carrying_key(carrying):
+    """
+    Key of the object carried by the agent, 0 if it carries nothing
+    """
+
+    if carrying is None:
+        return 0
+
+    return mix64(CARRYING_TAG | _code(*carrying.encode()))
+
+
+def state_hashes(grid, agent_pos, agent_dir, carrying):
+    """
+    Hashes of batches of encoded states (see `minigrid.core.transition`),
+    as an array of uint64, matching `MiniGridEnv.state_hash`
+    """
+
+    x = np.asarray(agent_pos[..., 0], dtype=np.uint64)
+    y = np.asarray(agent_pos[..., 1], dtype=np.uint64)
+    agent_dir = np.asarray(agent_dir, dtype=np.uint64)
+    agent_keys = _mix64_array(
+        np.uint64(AGENT_TAG) | (((x << np.uint64(16)) | y) << np.uint64(4)) | agent_dir
+    )
+
+    carrying = carrying.astype(np.uint64)
+    codes = _code(carrying[..., 0], carrying[..., 1], carrying[..., 2])
+    carrying_keys = _mix64_array(np.uint64(CARRYING_TAG) | codes)
+    nothing = carrying[..., 0] == OBJECT_TO_IDX["empty"]
+    carrying_keys = np.where(nothing, np.uint64(0), carrying_keys)
+
+    return _grid_hashes(grid) ^ agent_keys ^ carrying_keys
@@ -0,0 +1,224 @@
+"""
+Background generation of BabyAI levels.
+
+Rejection sampling makes level generation slow and heavy-tailed: most levels
+take a few milliseconds but some need dozens of attempts. A `LevelQueue`
+generates the levels of the next episodes on a private copy of the
+environment, in a background thread or process, so that `reset()` only has
+to install the attributes the generator assigned.
+
+By default the queue follows the stream of unseeded resets: a seeded reset
+restarts the stream from its seed, discarding the queued levels and waiting
+for the new one. When the seeds of the upcoming episodes are known, e.g. for
+an evaluation over a fixed set of seeds, pass them as `seeds` so that their
+levels are generated ahead of time as well.
+"""
+import copy
+import multiprocessing as mp
+import pickle
+import queue
+import threading
+import time
+import traceback
+
+from minigrid.level_bank import generate_level
+
+
+def _generate_levels(env, seeds, control, levels, use_process):
+    """
+    Generator loop: fill `levels` with (tag, level) pairs until closed.
+
+    Without `seeds`, levels continue the stream of unseeded resets and are
+    tagged with their epoch; a ("seed", epoch, seed) command restarts the
+    stream from a new seed. With `seeds`, the level of each seed is tagged
+    with the seed, and a (None, None) pair marks the end of the sequence.
+    """
+
+    epoch, seed, level = 0, None, None
+    if seeds is not None:
+        seeds = iter(seeds)
+
+    while True:
+        try:
+            command = control.get_nowait()
+        except queue.Empty:
+            command = None
+
+        if command is not None:
+            if command[0] == "close":
+                break
+            _, epoch, seed = command
+            level = None
+
+        # Levels leave the generator as copies, taken before the next level
+        # is generated (queues of processes pickle lazily)
+        copy_level = pickle.dumps if use_process else copy.deepcopy
+
+        try:
+            if level is None and seeds is not None:
+                seed = next(seeds, None)
+                if seed is None:
+                    level = (None, None)
+                else:
+                    level = (seed, copy_level(generate_level(env, seed)))
+            elif level is None:
+                level = (epoch, copy_level(generate_level(env, seed)))
+                seed = None
+        except Exception:
+            level = (None, traceback.format_exc())
+
+        try:
+            levels.put(level, timeout=0.05)
+            level = None
+        except queue.Full:
+            pass
+
+    if hasattr(levels, "cancel_join_thread"):
+        levels.cancel_join_thread()
+
+
+class LevelQueue:
+    """
+    Bounded queue of levels generated ahead of time for an environment.
+
+    Levels are produced by replaying the environment's reset sequence on a
+    copy of it: `get(seed)` restarts the stream exactly like `reset(seed=seed)`
+    and `get()` continues it like `reset()`. The levels served are therefore
+    identical to inline generation as long as stepping the environment does
+    not draw from its random number generator, which holds for BabyAI levels.
+
+    Given `seeds`, the queue instead generates the levels of these seeds in
+    order, and `get(seed)` serves the next one if `seed` is the expected
+    seed. Other resets return None, leaving the level to be generated inline.
+    """
+
+    def __init__(self, env, max_depth=8, use_process=False, context=None, seeds=None):
+        assert max_depth >= 1
+
+        self.max_depth = max_depth
+        self.use_process = use_process
+        self.seeded = seeds is not None
+        self.ended = False
+        self.epoch = 0
+
+        # Queue metrics
+        self.served = 0
+        self.waits = 0
+        self.wait_time = 0.0
+        self.discarded = 0
+        self.misses = 0
+
+        # Worker processes need the whole sequence up front
+        if seeds is not None and use_process:
+            seeds = list(seeds)
+
+        # The generator works on its own copy, sharing any level bank
+        env = copy.deepcopy(env, {id(env.level_bank): env.level_bank})
+        env.level_queue = None
+
+        if use_process:
+            ctx = mp.get_context(context)
+            self.control = ctx.Queue()
+            self.levels = ctx.Queue(max_depth)
+            self.worker = ctx.Process(
+                target=_generate_levels,
+                args=(env, seeds, self.control, self.levels, True),
+                daemon=True,
+            )
+        else:
+            self.control = queue.Queue()
+            self.levels = queue.Queue(max_depth)
+            self.worker = threading.Thread(
+                target=_generate_levels,
+                args=(env, seeds, self.control, self.levels, False),
+                daemon=True,
+            )
+        self.worker.start()
+
+    @property
+    def depth(self):
+        """
+        Number of levels ready to be served, or None if the platform
+        cannot report it
+        """
+
+        try:
+            return self.levels.qsize()
+        except NotImplementedError:
+            return None
+
+    def _pop(self):
+        start = time.perf_counter()
+
+        try:
+            tag, level = self.levels.get_nowait()
+        except queue.Empty:
+            tag, level = self.levels.get()
+            self.waits += 1
+            self.wait_time += time.perf_counter() - start
+
+        if tag is None and level is not None:
+            raise RuntimeError("level generation failed:\n" + level)
+
+        return tag, level
+
+    def get(self, seed=None):
+        """
+        Pop the next level, restarting the stream from `seed` if given.
+        Returns None if the queue has no level for this reset.
+        """
+
+        if self.seeded:
+            if seed is None or self.ended:
+                self.misses += 1
+                return None
+
+            tag, level = self._pop()
+            if tag is None:
+                self.ended = True
+            if tag != seed:
+                self.discarded += level is not None
+                self.misses += 1
+                return None
+
+        else:
+            if seed is not None:
+                self.epoch += 1
+                self.control.put(("seed", self.epoch, seed))
+
+            while True:
+                tag, level = self._pop()
+                if tag == self.epoch:
+                    break
+                self.discarded += 1
+
+        self.served += 1
+        return pickle.loads(level) if self.use_process else level
+
+    def stats(self):
+        """
+        Queue-depth and latency counters
+        """
+
+        return {
+            "depth": self.depth,
+            "max_depth": self.max_depth,
+            "served": self.served,
+            "waits": self.waits,
+            "wait_time": self.wait_time,
+            "discarded": self.discarded,
+            "misses": self.misses,
+        }
+
+    def close(self, timeout=1.0):
+        if self.worker is None:
+            return
+
+        self.control.put(("close",))
+        self.worker.join(timeout)
+        if self.use_process:
+            if self.worker.is_alive():
+                self.worker.terminate()
+            self.levels.cancel_join_thread()
+            self.control.cancel_join_thread()
+        self.worker = None
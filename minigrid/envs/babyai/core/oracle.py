@@ -0,0 +1,676 @@
+"""
+Shortest-path oracle for BabyAI levels, and generation of demonstrations.
+
+The `Oracle` of an environment gives the next action to complete its
+instructions from the current state. It works on the clauses of the
+compiled verifier one at a time, in the order the sequencing nodes
+require, and breaks each of them into steps: fetching the key of a locked
+door, freeing its hands, clearing an object blocking the way, and facing
+the cell to act on. Each step is a navigation to the nearest state facing
+a target cell, following a breadth-first search over the states of the
+agent (its cell and direction) backwards from the target cells. Turns,
+moves and opening the closed doors on the way are counted as actions, so
+the paths are shortest in actions. Searches are cached until the grid
+changes, so most steps only look up the current state.
+
+Demonstrations are generated in parallel by `generate_demos`, and written
+as one pickled record per successful episode:
+
+    python -m minigrid.envs.babyai.core.oracle --env-id BabyAI-BossLevel-v0 --seeds 0 1000 --out demos.pkl
+
+`load_demos` reads them back. Unpickling can run arbitrary code: only load
+demonstrations from a trusted source.
+"""
+import multiprocessing as mp
+import pickle
+
+import gymnasium as gym
+import numpy as np
+
+from minigrid.core.constants import COLOR_TO_IDX, OBJECT_TO_IDX, STATE_TO_IDX
+from minigrid.core.reachability import _to_bits, passable_mask
+from minigrid.core.transition import FORWARD, LEFT, RIGHT
+from minigrid.envs.babyai.core.verifier import (
+    AFTER,
+    DIR_DELTAS,
+    GOTO,
+    OPEN,
+    PICKUP,
+    PUT_NEXT,
+)
+
+# Number of searches kept in the cache of an oracle
+CACHE_SIZE = 64
+
+# Types of the objects the agent can move out of its way
+OBJECT_TYPES = [OBJECT_TO_IDX[obj_type] for obj_type in ("key", "ball", "box")]
+
+# Extra actions counted to move an object out of the way: picking it up,
+# turning to drop it and turning back
+OBJECT_DELAY = 4
+
+
+class OracleFailure(Exception):
+    """
+    Exception raised when the oracle can't complete the instructions
+    """
+
+    pass
+
+
+def _shift(bits, offset):
+    return bits << offset if offset > 0 else bits >> -offset
+
+
+def _facing_levels(targets, standable, delays, stride):
+    """
+    Breadth-first search over the states of the agent, backwards from the
+    states facing one of the `targets` cells. Bitboards (see
+    `minigrid.core.reachability`) give the cells the agent can stand on, and
+    `delays` pairs bitboards of cells with the number of extra actions it
+    takes to move in them, e.g. to open doors. Returns the list of levels of
+    the search, each with one bitboard of cells by direction of the agent.
+    """
+
+    offsets = [dx + dy * stride for dx, dy in DIR_DELTAS]
+    delayed = 0
+    for bits, _ in delays:
+        delayed |= bits
+
+    level = [_shift(targets, -offset) & standable for offset in offsets]
+    levels = [level]
+    seen = list(level)
+
+    # States of later levels, reached through delayed cells
+    pending = {}
+
+    while any(level) or pending:
+        next_level = pending.pop(len(levels), [0, 0, 0, 0])
+        for d, offset in enumerate(offsets):
+            # Turning to face the direction, or moving forward
+            bits = level[(d + 1) % 4] | level[(d - 1) % 4]
+            bits |= _shift(level[d] & ~delayed, -offset) & standable
+            next_level[d] = (next_level[d] | bits) & ~seen[d]
+            seen[d] |= next_level[d]
+
+            for cells, delay in delays:
+                bits = _shift(level[d] & cells, -offset) & standable
+                if bits:
+                    later = pending.setdefault(len(levels) + delay, [0, 0, 0, 0])
+                    later[d] |= bits
+
+        level = next_level
+        levels.append(level)
+
+    return levels
+
+
+def _next_step(levels, delays, stride, k, x, y, d):
+    """
+    Action taking the agent in the state at level `k` of a search closer to
+    the targets, and the number of levels it goes down
+    """
+
+    dx, dy = DIR_DELTAS[d]
+    bit = 1 << (y * stride + x)
+    front_bit = 1 << ((y + dy) * stride + x + dx)
+
+    cost = 1
+    for cells, delay in delays:
+        if cells & front_bit:
+            cost += delay
+            break
+    if k >= cost and levels[k - cost][d] & front_bit:
+        return FORWARD, cost
+
+    if levels[k - 1][(d - 1) % 4] & bit:
+        return LEFT, 1
+    return RIGHT, 1
+
+
+class Oracle:
+    """
+    Oracle giving the next action to complete the instructions of a BabyAI
+    environment, see the module documentation. Raises an `OracleFailure`
+    when no plan is found.
+    """
+
+    def __init__(self, env):
+        self.env = env.unwrapped
+        if self.env.verifier is None:
+            raise ValueError("the oracle needs compiled instructions")
+
+        self.actions = self.env.actions
+        self.cache = {}
+
+        # Object moved out of the way of the agent, if any, and cells of the
+        # way not to drop objects in
+        self.blocker = None
+        self.route = set()
+
+    def _active_clause(self):
+        """
+        Clause to work on next, following the order of the sequencing nodes
+        """
+
+        verifier = self.env.verifier
+        index = verifier.root
+        while index >= 0:
+            kind, a, b, _, a_done, b_done = verifier.nodes[index]
+            if kind == AFTER:
+                index = a if b_done == "success" else b
+            else:
+                index = b if a_done == "success" else a
+
+        return verifier.clauses[~index]
+
+    def _cells(self, positions):
+        """
+        Mask of the cells at a list of positions
+        """
+
+        mask = np.zeros((self.env.width, self.env.height), dtype=bool)
+        for x, y in positions:
+            mask[x, y] = True
+
+        return mask
+
+    def _placed(self, objs):
+        """
+        Positions of the objects of a list that are in the grid
+        """
+
+        objs_table = self.env.grid.objs
+        positions = []
+        missing = set()
+        for obj in objs:
+            if obj.cur_pos is not None:
+                x, y = int(obj.cur_pos[0]), int(obj.cur_pos[1])
+                if x >= 0 and objs_table[x, y] is obj:
+                    positions.append((x, y))
+                    continue
+            missing.add(id(obj))
+
+        # Objects taken out of boxes don't have a position
+        if missing:
+            for (x, y), obj in np.ndenumerate(objs_table):
+                if obj is not None and id(obj) in missing:
+                    positions.append((x, y))
+
+        return positions
+
+    def _search(self, targets, through_objects, use_key):
+        """
+        Search levels towards the `targets` mask, moving through objects if
+        `through_objects` is set and unlocking doors with the carried key if
+        `use_key` is set, cached until the grid changes
+        """
+
+        env = self.env
+        encoding = env.grid.encoding
+        carrying = env.carrying
+        key_color = None
+        if use_key and carrying is not None and carrying.type == "key":
+            key_color = carrying.color
+
+        key = (encoding.tobytes(), key_color, targets.tobytes(), through_objects)
+        if key in self.cache:
+            return self.cache[key]
+
+        types, states = encoding[:, :, 0], encoding[:, :, 2]
+        closed = (types == OBJECT_TO_IDX["door"]) & (states == STATE_TO_IDX["closed"])
+        if key_color is not None:
+            # Doors locked with the carried key open like closed doors
+            closed |= (
+                (types == OBJECT_TO_IDX["door"])
+                & (states == STATE_TO_IDX["locked"])
+                & (encoding[:, :, 1] == COLOR_TO_IDX[key_color])
+            )
+        standable = passable_mask(encoding, doors="closed") | closed
+
+        # Opening doors takes an action, and moving objects a few more
+        delays = [(_to_bits(closed), 1)]
+        if through_objects:
+            objects = np.isin(types, OBJECT_TYPES)
+            standable |= objects
+            delays.append((_to_bits(objects), OBJECT_DELAY))
+
+        levels = _facing_levels(
+            _to_bits(targets), _to_bits(standable), delays, env.width + 1
+        )
+
+        if len(self.cache) >= CACHE_SIZE:
+            self.cache.clear()
+        self.cache[key] = (levels, delays)
+
+        return self.cache[key]
+
+    def _agent_level(self, levels):
+        """
+        Level of the current state of the agent in a search, None if it
+        isn't in the search
+        """
+
+        env = self.env
+        x, y = int(env.agent_pos[0]), int(env.agent_pos[1])
+        bit = 1 << (y * (env.width + 1) + x)
+
+        for k, level in enumerate(levels):
+            if level[env.agent_dir] & bit:
+                return k
+
+        return None
+
+    def _navigate(self, targets, through_objects=False, use_key=True):
+        """
+        Next action towards facing one of the `targets` cells: None if the
+        agent faces one already, "blocked" if an object is in the way, and
+        "unreachable" if there is no way to face them
+        """
+
+        env = self.env
+        levels, delays = self._search(targets, through_objects, use_key)
+
+        k = self._agent_level(levels)
+        if k is None:
+            return "unreachable"
+        if k == 0:
+            return None
+
+        x, y = int(env.agent_pos[0]), int(env.agent_pos[1])
+        step, _ = _next_step(levels, delays, env.width + 1, k, x, y, env.agent_dir)
+        if step == FORWARD:
+            front_type, _, front_state = env.grid.encoding[tuple(env.front_pos)]
+            if front_type in OBJECT_TYPES:
+                return "blocked"
+            if (
+                front_type == OBJECT_TO_IDX["door"]
+                and front_state != STATE_TO_IDX["open"]
+            ):
+                return self.actions.toggle
+
+        return self.actions(step)
+
+    def _route(self, targets):
+        """
+        Cells on the path to facing one of the `targets` cells, moving
+        through objects
+        """
+
+        env = self.env
+        levels, delays = self._search(targets, True, True)
+        stride = env.width + 1
+
+        k = self._agent_level(levels)
+        x, y = int(env.agent_pos[0]), int(env.agent_pos[1])
+        d = env.agent_dir
+        cells = set()
+        while k > 0:
+            step, cost = _next_step(levels, delays, stride, k, x, y, d)
+            if step == FORWARD:
+                dx, dy = DIR_DELTAS[d]
+                x, y = x + dx, y + dy
+                cells.add((x, y))
+            else:
+                d = (d + 1) % 4 if step == RIGHT else (d - 1) % 4
+            k -= cost
+
+        dx, dy = DIR_DELTAS[d]
+        cells.add((x + dx, y + dy))
+
+        return cells
+
+    def _reachable(self, positions, use_key=True):
+        """
+        Whether the agent can face one of the cells at `positions`, possibly
+        after moving objects out of its way, and unlocking doors with the
+        carried key if `use_key` is set
+        """
+
+        if len(positions) == 0:
+            return False
+
+        step = self._navigate(self._cells(positions), True, use_key)
+        return step != "unreachable"
+
+    def _face(self, positions, action, unlock=True):
+        """
+        Next action to face one of the cells at `positions` and then take
+        `action`, moving objects out of the way, and unlocking locked doors
+        if `unlock` is set
+        """
+
+        env = self.env
+        if len(positions) == 0:
+            raise OracleFailure("no target cell")
+
+        targets = self._cells(positions)
+        step = self._navigate(targets)
+        if step == "unreachable":
+            step = self._navigate(targets, through_objects=True)
+        if step == "unreachable":
+            if not unlock:
+                raise OracleFailure("the target cells can't be reached")
+            return self._unlock()
+
+        if step is None:
+            return action
+        if step == "blocked":
+            self.blocker = env.grid.get(*env.front_pos)
+            self.route = self._route(targets)
+            return self._clear_blocker()
+
+        return step
+
+    def _unlock(self, doors=None):
+        """
+        Next action towards unlocking one of the `doors`, all the locked
+        doors by default, with the carried key, or else towards fetching the
+        key of one, from a box if needed
+        """
+
+        env = self.env
+        objs = [obj for obj in env.grid.objs.ravel().tolist() if obj is not None]
+        if doors is None:
+            doors = [obj for obj in objs if obj.type == "door"]
+        doors = [door for door in doors if door.is_locked]
+        colors = {door.color for door in doors}
+
+        carrying = env.carrying
+        if carrying is not None and carrying.type == "key":
+            positions = self._placed(
+                [door for door in doors if door.color == carrying.color]
+            )
+            if self._reachable(positions):
+                return self._face(positions, self.actions.toggle, unlock=False)
+
+        keys = [obj for obj in objs if obj.type == "key" and obj.color in colors]
+        if self._reachable(self._placed(keys)):
+            return self._pickup(keys, unlock=False)
+
+        boxes = [
+            obj
+            for obj in objs
+            if obj.type == "box"
+            and obj.contains is not None
+            and obj.contains.type == "key"
+            and obj.contains.color in colors
+        ]
+        positions = self._placed(boxes)
+        if self._reachable(positions):
+            return self._face(positions, self.actions.toggle, unlock=False)
+
+        raise OracleFailure("the target cells can't be reached")
+
+    def _drop(self):
+        """
+        Next action to drop the carried object out of the way: next to a
+        door or on the way of the agent only if no other cell can be reached
+        """
+
+        env = self.env
+        types = env.grid.encoding[:, :, 0]
+        free = types == OBJECT_TO_IDX["empty"]
+        free[tuple(env.agent_pos)] = False
+
+        doors = types == OBJECT_TO_IDX["door"]
+        out_of_way = free & ~doors
+        out_of_way[1:] &= ~doors[:-1]
+        out_of_way[:-1] &= ~doors[1:]
+        out_of_way[:, 1:] &= ~doors[:, :-1]
+        out_of_way[:, :-1] &= ~doors[:, 1:]
+        for x, y in self.route:
+            out_of_way[x, y] = False
+
+        for cells in (out_of_way, free):
+            step = self._navigate(cells)
+            if step != "unreachable":
+                return self.actions.drop if step is None else step
+
+        raise OracleFailure("no cell to drop the carried object in")
+
+    def _pickup(self, objs, unlock=True):
+        """
+        Next action to pick up one of the objects, with free hands
+        """
+
+        # Keep the carried key until it has unlocked the way
+        positions = self._placed([obj for obj in objs if obj.can_pickup()])
+        if not self._reachable(positions, use_key=False):
+            if not unlock:
+                raise OracleFailure("the objects can't be reached")
+            return self._unlock()
+
+        if self.env.carrying is not None:
+            return self._drop()
+
+        return self._face(positions, self.actions.pickup)
+
+    def _clear_blocker(self):
+        """
+        Next action to move the object blocking the way
+        """
+
+        carrying = self.env.carrying
+        if carrying is not None:
+            if carrying is self.blocker:
+                self.blocker = None
+            return self._drop()
+
+        return self._face(self._placed([self.blocker]), self.actions.pickup)
+
+    def act(self):
+        """
+        Next action to complete the instructions
+        """
+
+        env = self.env
+
+        if self.blocker is not None:
+            if env.carrying is self.blocker:
+                self.blocker = None
+            else:
+                return self._clear_blocker()
+        elif env.carrying is None:
+            self.route = set()
+
+        kind, instr, _, targets, next_cells = self._active_clause()[:5]
+        carrying = env.carrying
+
+        if kind == GOTO:
+            # Any action facing the object completes the clause
+            return self._face(list(targets), self.actions.done)
+
+        if kind == OPEN:
+            doors = instr.desc.obj_set
+            key_color = carrying.color if carrying and carrying.type == "key" else None
+            openable = [
+                door for door in doors if not door.is_locked or door.color == key_color
+            ]
+            if openable:
+                return self._face(self._placed(openable), self.actions.toggle)
+
+            # Fetch the key of a locked door
+            return self._unlock(doors)
+
+        if kind == PICKUP:
+            return self._pickup(instr.desc.obj_set)
+
+        assert kind == PUT_NEXT
+        if carrying is not None and any(
+            carrying is obj for obj in instr.desc_move.obj_set
+        ):
+            width, height = env.width, env.height
+            types = env.grid.encoding[:, :, 0]
+            cells = [
+                (x, y)
+                for x, y in next_cells
+                if 0 <= x < width
+                and 0 <= y < height
+                and types[x, y] == OBJECT_TO_IDX["empty"]
+            ]
+            if cells:
+                return self._face(cells, self.actions.drop)
+
+            # Make room next to the fixed objects
+            for x, y in next_cells:
+                if 0 <= x < width and 0 <= y < height and types[x, y] in OBJECT_TYPES:
+                    if self._reachable([(x, y)]):
+                        self.blocker = env.grid.get(x, y)
+                        self.route = {(x, y)}
+                        return self._clear_blocker()
+
+            raise OracleFailure("no room next to the objects")
+
+        return self._pickup(instr.desc_move.obj_set)
+
+
+def run_episode(env, seed=None, max_steps=None):
+    """
+    Run an episode with the actions of the oracle, returning its
+    observations, the actions taken and the final reward. Episodes the
+    oracle fails to complete have a reward of 0.
+    """
+
+    obs, _ = env.reset(seed=seed)
+    oracle = Oracle(env)
+
+    observations, actions = [], []
+    reward, done = 0, False
+    while not done:
+        try:
+            action = oracle.act()
+        except OracleFailure:
+            break
+        observations.append(obs)
+        actions.append(action)
+        obs, reward, terminated, truncated, _ = env.step(action)
+        done = terminated or truncated or len(actions) == max_steps
+
+    return observations, actions, reward
+
+
+def _demo(env, seed):
+    """
+    Demonstration of the oracle for a seed, None if it failed
+    """
+
+    observations, actions, reward = run_episode(env, seed)
+    if reward <= 0:
+        return None
+
+    return {
+        "seed": seed,
+        "mission": observations[0]["mission"],
+        "images": np.stack([obs["image"] for obs in observations]),
+        "directions": np.array([obs["direction"] for obs in observations], np.uint8),
+        "actions": np.array(actions, dtype=np.uint8),
+        "reward": reward,
+    }
+
+
+# Environment of a worker process of `generate_demos`
+_worker_env = None
+
+
+def _init_worker(env_id, env_kwargs):
+    global _worker_env
+    _worker_env = gym.make(env_id, **env_kwargs)
+
+
+def _worker_demo(seed):
+    return _demo(_worker_env, seed)
+
+
+def generate_demos(
+    env_id, seeds, path, num_workers=None, chunksize=16, context=None, **kwargs
+):
+    """
+    Generate demonstrations of the oracle for a list of seeds with
+    `num_workers` processes (all the CPUs by default, none to run in this
+    process), streaming them to the file at `path` in the order of the
+    seeds. Each successful episode is a pickled dictionary holding the
+    seed, the mission, the stacked observation images and directions, the
+    actions and the final reward. Returns the numbers of demonstrations
+    written and of failed episodes.
+    """
+
+    num_demos = num_failures = 0
+
+    with open(path, "wb") as file:
+
+        def write(demo):
+            nonlocal num_demos, num_failures
+            if demo is None:
+                num_failures += 1
+            else:
+                pickle.dump(demo, file, protocol=pickle.HIGHEST_PROTOCOL)
+                num_demos += 1
+
+        if num_workers == 0:
+            env = gym.make(env_id, **kwargs)
+            for seed in seeds:
+                write(_demo(env, seed))
+            env.close()
+        else:
+            ctx = mp.get_context(context)
+            with ctx.Pool(num_workers, _init_worker, (env_id, kwargs)) as pool:
+                for demo in pool.imap(_worker_demo, seeds, chunksize):
+                    write(demo)
+
+    return num_demos, num_failures
+
+
+def load_demos(path):
+    """
+    Iterate over the demonstrations written by `generate_demos`
+    """
+
+    with open(path, "rb") as file:
+        while True:
+            try:
+                yield pickle.load(file)
+            except EOFError:
+                return
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Generate demonstrations of the BabyAI oracle. They are "
+        "stored as pickled objects, so only share and load them from trusted "
+        "sources."
+    )
+    parser.add_argument(
+        "--env-id",
+        dest="env_id",
+        help="gym environment to generate demonstrations for",
+        required=True,
+    )
+    parser.add_argument(
+        "--seeds",
+        type=int,
+        nargs=2,
+        metavar=("START", "STOP"),
+        help="range of seeds to generate",
+        default=[0, 1000],
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        help="number of worker processes, all the CPUs by default",
+        default=None,
+    )
+    parser.add_argument(
+        "--out", help="file to write the demonstrations to", required=True
+    )
+    args = parser.parse_args()
+
+    num_demos, num_failures = generate_demos(
+        args.env_id, range(*args.seeds), args.out, args.workers
+    )
+    print(
+        f"Generated {num_demos} demonstrations of {args.env_id} in {args.out}, "
+        f"{num_failures} episodes failed"
+    )
@@ -3,7 +3,12 @@ Copied and adapted from https://github.com/mila-iqia/babyai
 """
 from typing import Optional
 
+import numpy as np
+
+from minigrid.core.constants import OBJECT_TO_IDX
+from minigrid.core.reachability import UNREACHABLE
 from minigrid.core.roomgrid import RoomGrid
+from minigrid.envs.babyai.core.level_queue import LevelQueue
 from minigrid.envs.babyai.core.verifier import (
     ActionInstr,
     AfterInstr,
@@ -11,6 +16,7 @@ from minigrid.envs.babyai.core.verifier import (
     BeforeInstr,
     PutNextInstr,
     SeqInstr,
+    compile_instr,
 )
 from minigrid.minigrid_env import MissionSpace
 
@@ -60,6 +66,14 @@ class RoomGridLevel(RoomGrid):
             self.fixed_max_steps = True
         else:
             max_steps = 0  # only for initialization
+
+        # Optional queue of levels generated in the background
+        self.level_queue = None
+        self._next_level = None
+
+        # Instructions compiled when the verifier is reset
+        self.verifier = None
+
         super().__init__(
             room_size=room_size,
             mission_space=mission_space,
@@ -67,11 +81,35 @@ class RoomGridLevel(RoomGrid):
             **kwargs
         )
 
+    def pregenerate_levels(
+        self, max_depth=8, use_process=False, context=None, seeds=None
+    ):
+        """
+        Generate the levels of upcoming episodes ahead of time, in a
+        background thread (or process if `use_process` is set), keeping up
+        to `max_depth` of them ready. Resets then install a pre-generated
+        level, which is the same one inline generation would produce
+        for the same seed. Queue metrics are available from
+        `self.level_queue.stats()`.
+
+        The queue follows unseeded resets, and each seeded reset restarts it.
+        If the seeds of the upcoming resets are known, pass them as `seeds`
+        to have their levels generated ahead of time instead.
+        """
+
+        if self.level_queue is not None:
+            self.level_queue.close()
+        self.level_queue = LevelQueue(self, max_depth, use_process, context, seeds)
+
     def reset(self, **kwargs):
+        if self.level_queue is not None:
+            self._next_level = self.level_queue.get(kwargs.get("seed"))
+
         obs = super().reset(**kwargs)
 
         # Recreate the verifier
         self.instrs.reset_verifier(self)
+        self.verifier = compile_instr(self.instrs, self)
 
         # Compute the time step limit based on the maze size and instructions
         nav_time_room = self.room_size**2
@@ -91,7 +129,10 @@ class RoomGridLevel(RoomGrid):
             self.update_objs_poss()
 
         # If we've successfully completed the mission
-        status = self.instrs.verify(action)
+        if self.verifier is not None:
+            status = self.verifier.verify(action)
+        else:
+            status = self.instrs.verify(action)
 
         if status == "success":
             terminated = True
@@ -104,7 +145,11 @@ class RoomGridLevel(RoomGrid):
 
     def update_objs_poss(self, instr=None):
         if instr is None:
-            instr = self.instrs
+            self.update_objs_poss(self.instrs)
+            if self.verifier is not None:
+                self.verifier.update_targets()
+            return
+
         if (
             isinstance(instr, BeforeInstr)
             or isinstance(instr, AndInstr)
@@ -115,7 +160,61 @@ class RoomGridLevel(RoomGrid):
         else:
             instr.update_objs_poss()
 
+    def _instr_parts(self, instr):
+        """
+        List the instructions of a tree and the object descriptions they hold
+        """
+
+        if isinstance(instr, SeqInstr):
+            return [
+                instr,
+                *self._instr_parts(instr.instr_a),
+                *self._instr_parts(instr.instr_b),
+            ]
+
+        parts = [instr]
+        for attr in ("desc", "desc_move", "desc_fixed"):
+            if hasattr(instr, attr):
+                parts.append(getattr(instr, attr))
+
+        return parts
+
+    def get_state(self, state=None):
+        """
+        Snapshot of the state of the environment, see `MiniGridEnv.get_state`,
+        including the progress of the instructions
+        """
+
+        state = super().get_state(state)
+
+        state["instrs"] = [
+            (part, part.__dict__.copy()) for part in self._instr_parts(self.instrs)
+        ]
+        state["verifier"] = None if self.verifier is None else self.verifier.get_state()
+
+        return state
+
+    def set_state(self, state):
+        super().set_state(state)
+
+        for part, attrs in state["instrs"]:
+            part.__dict__.update(attrs)
+        if state["verifier"] is not None:
+            self.verifier.set_state(state["verifier"])
+
+    def close(self):
+        if self.level_queue is not None:
+            self.level_queue.close()
+            self.level_queue = None
+        super().close()
+
     def _gen_grid(self, width, height):
+        # Install a level generated in the background
+        if self._next_level is not None:
+            vars(self).update(self._next_level)
+            self._next_level = None
+            return
+
         # We catch RecursionError to deal with rare cases where
         # rejection sampling gets stuck in an infinite loop
         while True:
@@ -253,49 +352,19 @@ class RoomGridLevel(RoomGrid):
         (without unblocking)
         """
 
-        # Reachable positions
-        reachable = set()
-
-        # Work list
-        stack = [self.agent_pos]
-
-        while len(stack) > 0:
-            i, j = stack.pop()
-
-            if i < 0 or i >= self.grid.width or j < 0 or j >= self.grid.height:
-                continue
-
-            if (i, j) in reachable:
-                continue
-
-            # This position is reachable
-            reachable.add((i, j))
-
-            cell = self.grid.get(i, j)
-
-            # If there is something other than a door in this cell, it
-            # blocks reachability
-            if cell and cell.type != "door":
-                continue
-
-            # Visit the horizontal and vertical neighbors
-            stack.append((i + 1, j))
-            stack.append((i - 1, j))
-            stack.append((i, j + 1))
-            stack.append((i, j - 1))
+        # Objects block the way, doors don't, whatever their state
+        dist = self.grid.distance_field(self.agent_pos, doors="locked")
 
         # Check that all objects are reachable
-        for i in range(self.grid.width):
-            for j in range(self.grid.height):
-                cell = self.grid.get(i, j)
-
-                if not cell or cell.type == "wall":
-                    continue
-
-                if (i, j) not in reachable:
-                    if not raise_exc:
-                        return False
-                    raise RejectSampling("unreachable object at " + str((i, j)))
+        types = self.grid.encoding[:, :, 0]
+        objs = (types > OBJECT_TO_IDX["empty"]) & (types != OBJECT_TO_IDX["wall"])
+        unreachable = np.argwhere(objs & (dist == UNREACHABLE))
+
+        if len(unreachable) > 0:
+            if not raise_exc:
+                return False
+            pos = tuple(unreachable[0].tolist())
+            raise RejectSampling("unreachable object at " + str(pos))
 
         # All objects reachable
         return True
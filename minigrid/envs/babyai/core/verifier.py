@@ -6,7 +6,7 @@ from abc import ABC, abstractmethod
 
 import numpy as np
 
-from minigrid.core.constants import COLOR_NAMES, DIR_TO_VEC
+from minigrid.core.constants import COLOR_NAMES, COLOR_TO_IDX, DIR_TO_VEC, OBJECT_TO_IDX
 from minigrid.minigrid_env import MiniGridEnv
 
 # Object types we are allowed to describe in language
@@ -113,56 +113,55 @@ class ObjDesc:
 
         self.obj_poss = []
 
-        agent_room = env.room_from_pos(*env.agent_pos)
-
-        for i in range(env.grid.width):
-            for j in range(env.grid.height):
-                cell = env.grid.get(i, j)
-                if cell is None:
-                    continue
-
-                if not use_location:
-                    # we should keep tracking the same objects initially tracked only
-                    already_tracked = any([cell is obj for obj in self.obj_set])
-                    if not already_tracked:
-                        continue
-
-                # Check if object's type matches description
-                if self.type is not None and cell.type != self.type:
-                    continue
-
-                # Check if object's color matches description
-                if self.color is not None and cell.color != self.color:
-                    continue
-
-                # Check if object's position matches description
-                if use_location and self.loc in ["left", "right", "front", "behind"]:
-                    # Locations apply only to objects in the same room
-                    # the agent starts in
-                    if not agent_room.pos_inside(i, j):
-                        continue
-
-                    # Direction from the agent to the object
-                    v = (i - env.agent_pos[0], j - env.agent_pos[1])
-
-                    # (d1, d2) is an oriented orthonormal basis
-                    d1 = DIR_TO_VEC[env.agent_dir]
-                    d2 = (-d1[1], d1[0])
-
-                    # Check if object's position matches with location
-                    pos_matches = {
-                        "left": dot_product(v, d2) < 0,
-                        "right": dot_product(v, d2) > 0,
-                        "front": dot_product(v, d1) > 0,
-                        "behind": dot_product(v, d1) < 0,
-                    }
-
-                    if not (pos_matches[self.loc]):
-                        continue
-
-                if use_location:
-                    self.obj_set.append(cell)
-                self.obj_poss.append((i, j))
+        # Find the cells whose type and color match the description from
+        # the encoding of the grid, in the order of a column-major scan
+        encoding = env.grid.encoding
+        match = encoding[:, :, 0] > OBJECT_TO_IDX["empty"]
+        if self.type is not None:
+            match &= encoding[:, :, 0] == OBJECT_TO_IDX[self.type]
+        if self.color is not None:
+            match &= encoding[:, :, 1] == COLOR_TO_IDX[self.color]
+        xs, ys = np.nonzero(match)
+
+        # Check if the object positions match the description
+        if use_location and self.loc in ["left", "right", "front", "behind"]:
+            # Locations apply only to objects in the same room
+            # the agent starts in
+            room = env.room_from_pos(*env.agent_pos)
+            (top_x, top_y), (size_x, size_y) = room.top, room.size
+            inside = (xs >= top_x) & (xs < top_x + size_x)
+            inside &= (ys >= top_y) & (ys < top_y + size_y)
+
+            # Direction from the agent to the objects
+            vx = xs - env.agent_pos[0]
+            vy = ys - env.agent_pos[1]
+
+            # (d1, d2) is an oriented orthonormal basis
+            d1 = DIR_TO_VEC[env.agent_dir]
+            d2 = (-d1[1], d1[0])
+
+            pos_matches = {
+                "left": vx * d2[0] + vy * d2[1] < 0,
+                "right": vx * d2[0] + vy * d2[1] > 0,
+                "front": vx * d1[0] + vy * d1[1] > 0,
+                "behind": vx * d1[0] + vy * d1[1] < 0,
+            }
+
+            keep = inside & pos_matches[self.loc]
+            xs, ys = xs[keep], ys[keep]
+
+        if not use_location:
+            # we should keep tracking the same objects initially tracked only
+            tracked = {id(obj) for obj in self.obj_set}
+
+        for i, j in zip(xs.tolist(), ys.tolist()):
+            cell = env.grid.get(i, j)
+
+            if use_location:
+                self.obj_set.append(cell)
+            elif id(cell) not in tracked:
+                continue
+            self.obj_poss.append((i, j))
 
         return self.obj_set, self.obj_poss
 
@@ -562,3 +561,216 @@ class AndInstr(SeqInstr):
             return "success"
 
         return "continue"
+
+
+# Kinds of the clauses and sequencing nodes of compiled instructions
+GOTO, OPEN, PICKUP, PUT_NEXT = range(4)
+BEFORE, AFTER, AND = range(3)
+
+CLAUSE_KINDS = {
+    GoToInstr: GOTO,
+    OpenInstr: OPEN,
+    PickupInstr: PICKUP,
+    PutNextInstr: PUT_NEXT,
+}
+NODE_KINDS = {BeforeInstr: BEFORE, AfterInstr: AFTER, AndInstr: AND}
+
+# Direction vectors as tuples of ints, cheaper to add than NumPy arrays
+DIR_DELTAS = [(int(dx), int(dy)) for dx, dy in DIR_TO_VEC]
+
+
+def compile_instr(instr, env):
+    """
+    Compile an instruction tree whose verifier was reset on `env`, or return
+    None if it can only be verified through its `verify` methods
+    """
+
+    def compilable(instr):
+        if type(instr) in NODE_KINDS:
+            return compilable(instr.instr_a) and compilable(instr.instr_b)
+        return type(instr) in CLAUSE_KINDS
+
+    if use_done_actions or not compilable(instr):
+        return None
+
+    return CompiledInstr(instr, env)
+
+
+class CompiledInstr:
+    """
+    Instruction tree compiled into flat tables of clauses and sequencing
+    nodes, verified with the same semantics as `Instr.verify`.
+
+    Each clause holds a precomputed set of targets: the cells a GoTo clause
+    is satisfied in front of, the ids of the doors to open or of the objects
+    to pick up, and the ids of the objects to move with the cells next to
+    the fixed objects for PutNext. Sequencing nodes refer to their operands
+    by index, clauses being encoded as ~index. Each step then reads the
+    front cell and carried object once and checks them against the tables.
+    """
+
+    def __init__(self, instr, env):
+        self.env = env
+
+        # Clauses: [kind, instr, strict, targets, next_cells, pre_carrying]
+        self.clauses = []
+
+        # Nodes: [kind, operand_a, operand_b, strict, a_done, b_done]
+        self.nodes = []
+
+        self.root = self._compile(instr)
+        self.update_targets()
+        self.stale_targets = False
+
+    def __setstate__(self, state):
+        # Targets hold the ids of the objects, which change when they are
+        # copied, so they are recomputed on the next verification
+        self.__dict__.update(state)
+        self.stale_targets = True
+
+    def _compile(self, instr):
+        if type(instr) in NODE_KINDS:
+            a = self._compile(instr.instr_a)
+            b = self._compile(instr.instr_b)
+            kind = NODE_KINDS[type(instr)]
+            self.nodes.append([kind, a, b, instr.strict, False, False])
+            return len(self.nodes) - 1
+
+        strict = getattr(instr, "strict", False)
+        self.clauses.append(
+            [CLAUSE_KINDS[type(instr)], instr, strict, None, None, None]
+        )
+        return ~(len(self.clauses) - 1)
+
+    def update_targets(self):
+        """
+        Recompute the targets of the clauses from the positions of the
+        objects matching their descriptions, after these are updated
+        """
+
+        for clause in self.clauses:
+            kind, instr = clause[0], clause[1]
+
+            if kind == GOTO:
+                clause[3] = {(int(x), int(y)) for x, y in instr.desc.obj_poss}
+            elif kind == PUT_NEXT:
+                clause[3] = {id(obj) for obj in instr.desc_move.obj_set}
+                clause[4] = {
+                    (int(x) + dx, int(y) + dy)
+                    for x, y in instr.desc_fixed.obj_poss
+                    for dx, dy in DIR_DELTAS
+                }
+            else:
+                clause[3] = {id(obj) for obj in instr.desc.obj_set}
+
+    def _refresh_targets(self):
+        if self.stale_targets:
+            self.update_targets()
+            self.stale_targets = False
+
+    def get_state(self):
+        """
+        Progress of the verification, restored by `set_state`
+        """
+
+        self._refresh_targets()
+        return (
+            [node[4:] for node in self.nodes],
+            [clause[3:] for clause in self.clauses],
+        )
+
+    def set_state(self, state):
+        nodes, clauses = state
+        for node, done in zip(self.nodes, nodes):
+            node[4:] = done
+        for clause, clause_state in zip(self.clauses, clauses):
+            clause[3:] = clause_state
+
+    def verify(self, action):
+        """
+        Verify the instructions after an action, see `Instr.verify`
+        """
+
+        self._refresh_targets()
+
+        env = self.env
+        x, y = env.agent_pos
+        dx, dy = DIR_DELTAS[env.agent_dir]
+        front = (int(x) + dx, int(y) + dy)
+
+        return self._verify(self.root, action, front, env.carrying)
+
+    def _verify(self, index, action, front, carrying):
+        if index < 0:
+            return self._verify_clause(self.clauses[~index], action, front, carrying)
+
+        node = self.nodes[index]
+        kind, a, b, strict = node[:4]
+
+        if kind == AND:
+            if node[4] != "success":
+                node[4] = self._verify(a, action, front, carrying)
+            if node[5] != "success":
+                node[5] = self._verify(b, action, front, carrying)
+            if node[4] == "success" and node[5] == "success":
+                return "success"
+            return "continue"
+
+        # After is Before with its operands swapped
+        if kind == AFTER:
+            a, b = b, a
+        first, second = (4, 5) if kind == BEFORE else (5, 4)
+
+        if node[first] == "success":
+            node[second] = self._verify(b, action, front, carrying)
+            if node[second] in ("success", "failure"):
+                return node[second]
+        else:
+            node[first] = self._verify(a, action, front, carrying)
+            if node[first] == "failure":
+                return "failure"
+            if node[first] == "success":
+                return self._verify(index, action, front, carrying)
+
+            # In strict mode, completing the second instruction first fails
+            if strict and self._verify(b, action, front, carrying) == "success":
+                return "failure"
+
+        return "continue"
+
+    def _verify_clause(self, clause, action, front, carrying):
+        kind, _, strict, targets = clause[:4]
+        actions = self.env.actions
+
+        if kind == GOTO:
+            return "success" if front in targets else "continue"
+
+        if kind == OPEN:
+            if action != actions.toggle:
+                return "continue"
+            front_cell = self.env.grid.get(*front)
+            if front_cell and id(front_cell) in targets and front_cell.is_open:
+                return "success"
+            if strict and front_cell and front_cell.type == "door":
+                return "failure"
+            return "continue"
+
+        # Pickup and PutNext keep track of what was carried at the last step
+        pre_carrying = clause[5]
+        clause[5] = carrying
+
+        if kind == PICKUP:
+            if action != actions.pickup:
+                return "continue"
+            if pre_carrying is None and id(carrying) in targets:
+                return "success"
+            if strict and carrying:
+                return "failure"
+            return "continue"
+
+        if strict and action == actions.pickup and carrying:
+            return "failure"
+        if action != actions.drop or id(pre_carrying) not in targets:
+            return "continue"
+        x, y = pre_carrying.cur_pos
+        return "success" if (int(x), int(y)) in clause[4] else "continue"
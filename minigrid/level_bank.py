@@ -0,0 +1,364 @@
+"""
+Seed-indexed banks of pre-generated levels.
+
+A level bank is a directory of `.npy` columns holding one row per seed:
+the grid encoding, the agent pose, the mission and a pickled payload with
+the object instances of the grid and the other attributes assigned by
+`_gen_grid` (e.g. `success_pos` or BabyAI `instrs`). The columns are
+memory-mapped, so opening a bank is cheap and restoring a level only
+touches its own rows.
+
+Restoring a level only installs the attributes its generation assigned, so
+the environment keeps its own step limit, view size and rendering settings.
+The other keyword arguments the bank was generated with must match those of
+the environment.
+
+The payload is unpickled when a level is restored, and unpickling can run
+arbitrary code: only load banks from a trusted source.
+
+Generate a bank with:
+
+    python -m minigrid.level_bank --env-id BabyAI-BossLevel-v0 --seeds 0 1000 --out bank
+
+and enable it on an environment with:
+
+    env.unwrapped.level_bank = LevelBank("bank")
+
+Resets with a seed contained in the bank then restore the level instead of
+running the generator; other resets generate levels as usual.
+"""
+import io
+import json
+import os
+import pickle
+
+import gymnasium as gym
+import numpy as np
+
+from minigrid.core.grid import Grid
+from minigrid.core.world_object import WorldObj
+
+# Keyword arguments of `MiniGridEnv` that play no part in level generation,
+# which a bank may be restored with any value of
+CONFIG_KWARGS = frozenset(
+    {
+        "agent_pov",
+        "agent_view_size",
+        "highlight",
+        "max_steps",
+        "render_mode",
+        "see_through_walls",
+        "tile_size",
+    }
+)
+
+# Attributes stored with every level, whether or not `_gen_grid` assigns them
+LEVEL_ATTRS = frozenset({"grid", "agent_pos", "agent_dir", "mission", "_np_random"})
+
+# Attributes stored in their own columns
+COLUMN_ATTRS = frozenset({"grid", "agent_pos", "agent_dir", "mission"})
+
+COLUMNS = (
+    "seeds",
+    "encoding",
+    "agent_pos",
+    "agent_numpy",
+    "agent_dir",
+    "mission_offsets",
+    "mission",
+    "payload_offsets",
+    "payload",
+)
+
+
+_recording_classes = {}
+
+
+def _recording_class(cls):
+    """
+    Subclass of `cls` whose instances record the names of the attributes
+    assigned on them in their `_assigned_attrs` set
+    """
+
+    if cls not in _recording_classes:
+
+        def __setattr__(self, name, value):
+            self.__dict__["_assigned_attrs"].add(name)
+            super(recording_cls, self).__setattr__(name, value)
+
+        recording_cls = type(
+            cls.__name__,
+            (cls,),
+            {
+                "__module__": cls.__module__,
+                "__qualname__": cls.__qualname__,
+                "__setattr__": __setattr__,
+            },
+        )
+        _recording_classes[cls] = recording_cls
+
+    return _recording_classes[cls]
+
+
+def generate_level(env, seed=None):
+    """
+    Generate a level on `env` the way `MiniGridEnv.reset` does and return
+    the attributes the generator assigned, including the random number
+    generator.
+
+    Assignments are recorded rather than diffed against the previous state,
+    since generators often assign values equal to the previous ones (e.g. a
+    color drawn again, or `None`).
+    """
+
+    gym.Env.reset(env, seed=seed)
+    env.agent_pos = (-1, -1)
+    env.agent_dir = -1
+
+    cls = type(env)
+    assigned = env.__dict__["_assigned_attrs"] = set()
+    env.__class__ = _recording_class(cls)
+    try:
+        env._gen_grid(env.width, env.height)
+    finally:
+        env.__class__ = cls
+        del env.__dict__["_assigned_attrs"]
+
+    attrs = vars(env)
+    return {k: attrs[k] for k in assigned | LEVEL_ATTRS if k in attrs}
+
+
+class _LevelPickler(pickle.Pickler):
+    """
+    Pickler storing references to the grid of the level instead of the grid
+    itself, which is held by the encoding column
+    """
+
+    def __init__(self, file, grid):
+        super().__init__(file, protocol=pickle.HIGHEST_PROTOCOL)
+        self.grid = grid
+
+    def persistent_id(self, obj):
+        return "grid" if obj is self.grid else None
+
+
+class _LevelUnpickler(pickle.Unpickler):
+    def __init__(self, file, grid):
+        super().__init__(file)
+        self.grid = grid
+
+    def persistent_load(self, pid):
+        return self.grid
+
+
+def _is_decodable(obj):
+    """
+    Check if an object is identical to the one the grid creates from its
+    encoding, so that it needs not be stored
+    """
+
+    decoded = WorldObj.decode(*obj.encode())
+    ignored = ("_grid", "_grid_pos")
+    return type(decoded) is type(obj) and all(
+        v == getattr(decoded, k) for k, v in vars(obj).items() if k not in ignored
+    )
+
+
+def _env_class(env):
+    return f"{type(env).__module__}:{type(env).__qualname__}"
+
+
+def _level_kwargs(env):
+    """
+    Keyword arguments an environment was made with that may affect the
+    levels it generates, in their JSON form
+    """
+
+    kwargs = env.spec.kwargs if env.spec is not None else {}
+    kwargs = {k: v for k, v in kwargs.items() if k not in CONFIG_KWARGS}
+    return json.loads(json.dumps(kwargs, sort_keys=True, default=repr))
+
+
+def _offsets(chunks):
+    offsets = np.zeros(len(chunks) + 1, dtype=np.int64)
+    np.cumsum([len(chunk) for chunk in chunks], out=offsets[1:])
+    return offsets
+
+
+def build_level_bank(env_id, seeds, path, **kwargs):
+    """Generate the levels of an environment for a set of seeds and save
+    them as a level bank.
+
+    Args:
+        env_id: id of a registered MiniGrid environment
+        seeds: iterable of integer seeds
+        path: directory the bank is written to
+        **kwargs: keyword arguments passed to `gym.make`
+
+    Returns:
+        The `LevelBank` opened from `path`
+    """
+
+    env = gym.make(env_id, **kwargs).unwrapped
+    seeds = np.array(list(seeds), dtype=np.int64)
+    if len(np.unique(seeds)) != len(seeds):
+        raise ValueError("level bank seeds must be unique")
+
+    num_levels = len(seeds)
+    encoding = np.empty((num_levels, env.width, env.height, 3), dtype=np.uint8)
+    agent_pos = np.empty((num_levels, 2), dtype=np.int64)
+    agent_numpy = np.empty((num_levels, 2), dtype=bool)
+    agent_dir = np.empty(num_levels, dtype=np.int64)
+    missions = []
+    payloads = []
+
+    for i, seed in enumerate(seeds.tolist()):
+        level = generate_level(env, seed)
+        grid = level.pop("grid")
+        encoding[i] = grid.encoding
+        agent_pos[i] = level["agent_pos"]
+        agent_dir[i] = level["agent_dir"]
+        agent_numpy[i] = [
+            isinstance(level["agent_pos"], np.ndarray),
+            isinstance(level["agent_dir"], np.generic),
+        ]
+        missions.append(level["mission"].encode("utf8"))
+
+        objs = [
+            (x, y, grid.objs[x, y])
+            for x, y in zip(*np.nonzero(grid.objs))
+            if not _is_decodable(grid.objs[x, y])
+        ]
+        extras = {k: v for k, v in level.items() if k not in COLUMN_ATTRS}
+        buffer = io.BytesIO()
+        _LevelPickler(buffer, grid).dump((objs, extras))
+        payloads.append(buffer.getvalue())
+
+    env.close()
+
+    columns = {
+        "seeds": seeds,
+        "encoding": encoding,
+        "agent_pos": agent_pos,
+        "agent_numpy": agent_numpy,
+        "agent_dir": agent_dir,
+        "mission_offsets": _offsets(missions),
+        "mission": np.frombuffer(b"".join(missions), dtype=np.uint8),
+        "payload_offsets": _offsets(payloads),
+        "payload": np.frombuffer(b"".join(payloads), dtype=np.uint8),
+    }
+
+    os.makedirs(path, exist_ok=True)
+    for name in COLUMNS:
+        np.save(os.path.join(path, f"{name}.npy"), columns[name])
+
+    meta = {
+        "env_id": env_id,
+        "env_class": _env_class(env),
+        "width": env.width,
+        "height": env.height,
+        "kwargs": _level_kwargs(env),
+        "num_levels": num_levels,
+    }
+    with open(os.path.join(path, "meta.json"), "w") as f:
+        json.dump(meta, f, indent=2)
+
+    return LevelBank(path)
+
+
+class LevelBank:
+    """
+    Read-only, memory-mapped bank of pre-generated levels indexed by seed.
+
+    Restoring a level unpickles its payload: only open banks from a trusted
+    source.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+        with open(os.path.join(path, "meta.json")) as f:
+            self.meta = json.load(f)
+
+        for name in COLUMNS:
+            file = os.path.join(path, f"{name}.npy")
+            setattr(self, name, np.load(file, mmap_mode="r"))
+
+        self.rows = {seed: row for row, seed in enumerate(self.seeds.tolist())}
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __contains__(self, seed):
+        return seed in self.rows
+
+    def restore(self, env, seed):
+        """
+        Install the level generated for `seed` on `env`, as `_gen_grid`
+        would have left it
+        """
+
+        if (
+            _env_class(env) != self.meta["env_class"]
+            or (env.width, env.height) != (self.meta["width"], self.meta["height"])
+            or _level_kwargs(env) != self.meta["kwargs"]
+        ):
+            raise ValueError(
+                f"level bank {self.path} was generated for {self.meta['env_id']} "
+                f"with {self.meta['kwargs']}"
+            )
+
+        row = self.rows[seed]
+
+        grid = Grid(env.width, env.height)
+        grid._encoding[:] = self.encoding[row]
+
+        start = self.payload_offsets[row].item()
+        end = self.payload_offsets[row + 1].item()
+        payload = io.BytesIO(self.payload[start:end].tobytes())
+        objs, extras = _LevelUnpickler(payload, grid).load()
+        for x, y, obj in objs:
+            grid.objs[x, y] = obj
+
+        vars(env).update(extras)
+        env.grid = grid
+
+        # Restore the pose with the types the generator used, which show in
+        # `hash()` and observations
+        pos_numpy, dir_numpy = self.agent_numpy[row].tolist()
+        agent_pos = self.agent_pos[row]
+        env.agent_pos = np.array(agent_pos) if pos_numpy else tuple(agent_pos.tolist())
+        agent_dir = self.agent_dir[row]
+        env.agent_dir = agent_dir if dir_numpy else agent_dir.item()
+
+        start = self.mission_offsets[row].item()
+        end = self.mission_offsets[row + 1].item()
+        env.mission = self.mission[start:end].tobytes().decode("utf8")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Generate a level bank. Banks store pickled objects, so "
+        "only share and load them from trusted sources."
+    )
+    parser.add_argument(
+        "--env-id",
+        dest="env_id",
+        help="gym environment to generate levels for",
+        required=True,
+    )
+    parser.add_argument(
+        "--seeds",
+        type=int,
+        nargs=2,
+        metavar=("START", "STOP"),
+        help="range of seeds to generate",
+        default=[0, 1000],
+    )
+    parser.add_argument("--out", help="directory to write the bank to", required=True)
+    args = parser.parse_args()
+
+    bank = build_level_bank(args.env_id, range(*args.seeds), args.out)
+    print(f"Generated {len(bank)} levels of {args.env_id} in {args.out}")
@@ -1,16 +1,43 @@
 import hashlib
 import math
 from abc import abstractmethod
-from enum import IntEnum
-from typing import Any, Callable, Optional, Union
+from functools import lru_cache
+from typing import Optional
 
 import gymnasium as gym
 import numpy as np
 from gymnasium import spaces
-from gymnasium.utils import seeding
 
-# Size in pixels of a tile in the full-scale human view
-from minigrid.utils.rendering import (
+from minigrid.core.actions import Actions
+from minigrid.core.constants import COLOR_NAMES, DIR_TO_VEC, TILE_PIXELS
+from minigrid.core.grid import EMPTY_ENCODING, Grid, compute_vis_mask
+from minigrid.core.mission import MissionSpace
+from minigrid.core.tile_cache import FrameCache
+from minigrid.core.zobrist import agent_key, carrying_key, grid_hash
+from minigrid.utils.window import Window
+
+# Names that used to be defined in this module, kept importable from it
+from minigrid.core.constants import (  # noqa: F401 isort:skip
+    COLOR_TO_IDX,
+    COLORS,
+    IDX_TO_COLOR,
+    IDX_TO_OBJECT,
+    OBJECT_TO_IDX,
+    STATE_TO_IDX,
+)
+from minigrid.core.mission import check_if_no_duplicate  # noqa: F401 isort:skip
+from minigrid.core.world_object import (  # noqa: F401 isort:skip
+    Ball,
+    Box,
+    Door,
+    Floor,
+    Goal,
+    Key,
+    Lava,
+    Wall,
+    WorldObj,
+)
+from minigrid.utils.rendering import (  # noqa: F401 isort:skip
     downsample,
     fill_coords,
     highlight_img,
@@ -20,808 +47,30 @@ from minigrid.utils.rendering import (
     point_in_triangle,
     rotate_fn,
 )
-from minigrid.utils.window import Window
-
-TILE_PIXELS = 32
-
-# Map of color names to RGB values
-COLORS = {
-    "red": np.array([255, 0, 0]),
-    "green": np.array([0, 255, 0]),
-    "blue": np.array([0, 0, 255]),
-    "purple": np.array([112, 39, 195]),
-    "yellow": np.array([255, 255, 0]),
-    "grey": np.array([100, 100, 100]),
-}
-
-COLOR_NAMES = sorted(list(COLORS.keys()))
-
-# Used to map colors to integers
-COLOR_TO_IDX = {"red": 0, "green": 1, "blue": 2, "purple": 3, "yellow": 4, "grey": 5}
-
-IDX_TO_COLOR = dict(zip(COLOR_TO_IDX.values(), COLOR_TO_IDX.keys()))
-
-# Map of object type to integers
-OBJECT_TO_IDX = {
-    "unseen": 0,
-    "empty": 1,
-    "wall": 2,
-    "floor": 3,
-    "door": 4,
-    "key": 5,
-    "ball": 6,
-    "box": 7,
-    "goal": 8,
-    "lava": 9,
-    "agent": 10,
-}
-
-IDX_TO_OBJECT = dict(zip(OBJECT_TO_IDX.values(), OBJECT_TO_IDX.keys()))
-
-# Map of state names to integers
-STATE_TO_IDX = {
-    "open": 0,
-    "closed": 1,
-    "locked": 2,
-}
-
-# Map of agent direction indices to vectors
-DIR_TO_VEC = [
-    # Pointing right (positive X)
-    np.array((1, 0)),
-    # Down (positive Y)
-    np.array((0, 1)),
-    # Pointing left (negative X)
-    np.array((-1, 0)),
-    # Up (negative Y)
-    np.array((0, -1)),
-]
-
-
-def check_if_no_duplicate(duplicate_list: list) -> bool:
-    """Check if given list contains any duplicates"""
-    return len(set(duplicate_list)) == len(duplicate_list)
-
-
-class MissionSpace(spaces.Space[str]):
-    r"""A space representing a mission for the Minigrid environments.
-    The space allows generating random mission strings constructed with an input placeholder list.
-    Example Usage::
-        >>> def _gen_mission() -> str:
-        >>>     return "Get the ball."
-        >>> observation_space = MissionSpace(mission_func=_gen_mission)
-        >>> observation_space.sample()
-            "Get the ball."
-        >>> def _gen_mission(color: str, object_type:str) -> str:
-        >>>     return f"Get the {color} {object_type}."
-        >>> observation_space = MissionSpace(
-        >>>     mission_func=_gen_mission,
-        >>>     ordered_placeholders=[["green", "blue"], ["ball", "key"]],
-        >>> )
-        >>> observation_space.sample()
-            "Get the green ball."
-    """
-
-    def __init__(
-        self,
-        mission_func: Callable[..., str],
-        ordered_placeholders: Optional["list[list[str]]"] = None,
-        seed: Optional[Union[int, seeding.RandomNumberGenerator]] = None,
-    ):
-        r"""Constructor of :class:`MissionSpace` space.
-
-        Args:
-            mission_func (lambda _placeholders(str): _mission(str)): Function that generates a mission string from random placeholders.
-            ordered_placeholders (Optional["list[list[str]]"]): List of lists of placeholders ordered in placing order in the mission function mission_func.
-            seed: seed: The seed for sampling from the space.
-        """
-        # Check that the ordered placeholders and mission function are well defined.
-        if ordered_placeholders is not None:
-            assert (
-                len(ordered_placeholders) == mission_func.__code__.co_argcount
-            ), f"The number of placeholders {len(ordered_placeholders)} is different from the number of parameters in the mission function {mission_func.__code__.co_argcount}."
-            for placeholder_list in ordered_placeholders:
-                assert check_if_no_duplicate(
-                    placeholder_list
-                ), "Make sure that the placeholders don't have any duplicate values."
-        else:
-            assert (
-                mission_func.__code__.co_argcount == 0
-            ), f"If the ordered placeholders are {ordered_placeholders}, the mission function shouldn't have any parameters."
-
-        self.ordered_placeholders = ordered_placeholders
-        self.mission_func = mission_func
-
-        super().__init__(dtype=str, seed=seed)
-
-        # Check that mission_func returns a string
-        sampled_mission = self.sample()
-        assert isinstance(
-            sampled_mission, str
-        ), f"mission_func must return type str not {type(sampled_mission)}"
-
-    def sample(self) -> str:
-        """Sample a random mission string."""
-        if self.ordered_placeholders is not None:
-            placeholders = []
-            for rand_var_list in self.ordered_placeholders:
-                idx = self.np_random.integers(0, len(rand_var_list))
-
-                placeholders.append(rand_var_list[idx])
-
-            return self.mission_func(*placeholders)
-        else:
-            return self.mission_func()
-
-    def contains(self, x: Any) -> bool:
-        """Return boolean specifying if x is a valid member of this space."""
-        # Store a list of all the placeholders from self.ordered_placeholders that appear in x
-        if self.ordered_placeholders is not None:
-            check_placeholder_list = []
-            for placeholder_list in self.ordered_placeholders:
-                for placeholder in placeholder_list:
-                    if placeholder in x:
-                        check_placeholder_list.append(placeholder)
-
-            # Remove duplicates from the list
-            check_placeholder_list = list(set(check_placeholder_list))
-
-            start_id_placeholder = []
-            end_id_placeholder = []
-            # Get the starting and ending id of the identified placeholders with possible duplicates
-            new_check_placeholder_list = []
-            for placeholder in check_placeholder_list:
-                new_start_id_placeholder = [
-                    i for i in range(len(x)) if x.startswith(placeholder, i)
-                ]
-                new_check_placeholder_list += [placeholder] * len(
-                    new_start_id_placeholder
-                )
-                end_id_placeholder += [
-                    start_id + len(placeholder) - 1
-                    for start_id in new_start_id_placeholder
-                ]
-                start_id_placeholder += new_start_id_placeholder
-
-            # Order by starting id the placeholders
-            ordered_placeholder_list = sorted(
-                zip(
-                    start_id_placeholder, end_id_placeholder, new_check_placeholder_list
-                )
-            )
-
-            # Check for repeated placeholders contained in each other
-            remove_placeholder_id = []
-            for i, placeholder_1 in enumerate(ordered_placeholder_list):
-                starting_id = i + 1
-                for j, placeholder_2 in enumerate(
-                    ordered_placeholder_list[starting_id:]
-                ):
-                    # Check if place holder ids overlap and keep the longest
-                    if max(placeholder_1[0], placeholder_2[0]) < min(
-                        placeholder_1[1], placeholder_2[1]
-                    ):
-                        remove_placeholder = min(
-                            placeholder_1[2], placeholder_2[2], key=len
-                        )
-                        if remove_placeholder == placeholder_1[2]:
-                            remove_placeholder_id.append(i)
-                        else:
-                            remove_placeholder_id.append(i + j + 1)
-            for id in remove_placeholder_id:
-                del ordered_placeholder_list[id]
-
-            final_placeholders = [
-                placeholder[2] for placeholder in ordered_placeholder_list
-            ]
-
-            # Check that the identified final placeholders are in the same order as the original placeholders.
-            for orered_placeholder, final_placeholder in zip(
-                self.ordered_placeholders, final_placeholders
-            ):
-                if final_placeholder in orered_placeholder:
-                    continue
-                else:
-                    return False
-            try:
-                mission_string_with_placeholders = self.mission_func(
-                    *final_placeholders
-                )
-            except Exception as e:
-                print(
-                    f"{x} is not contained in MissionSpace due to the following exception: {e}"
-                )
-                return False
-
-            return bool(mission_string_with_placeholders == x)
-
-        else:
-            return bool(self.mission_func() == x)
-
-    def __repr__(self) -> str:
-        """Gives a string representation of this space."""
-        return f"MissionSpace({self.mission_func}, {self.ordered_placeholders})"
-
-    def __eq__(self, other) -> bool:
-        """Check whether ``other`` is equivalent to this instance."""
-        if isinstance(other, MissionSpace):
-
-            # Check that place holder lists are the same
-            if self.ordered_placeholders is not None:
-                # Check length
-                if (len(self.order_placeholder) == len(other.order_placeholder)) and (
-                    all(
-                        set(i) == set(j)
-                        for i, j in zip(self.order_placeholder, other.order_placeholder)
-                    )
-                ):
-                    # Check mission string is the same with dummy space placeholders
-                    test_placeholders = [""] * len(self.order_placeholder)
-                    mission = self.mission_func(*test_placeholders)
-                    other_mission = other.mission_func(*test_placeholders)
-                    return mission == other_mission
-            else:
-
-                # Check that other is also None
-                if other.ordered_placeholders is None:
-
-                    # Check mission string is the same
-                    mission = self.mission_func()
-                    other_mission = other.mission_func()
-                    return mission == other_mission
-
-        # If none of the statements above return then False
-        return False
-
-
-class WorldObj:
-    """
-    Base class for grid world objects
-    """
-
-    def __init__(self, type, color):
-        assert type in OBJECT_TO_IDX, type
-        assert color in COLOR_TO_IDX, color
-        self.type = type
-        self.color = color
-        self.contains = None
-
-        # Initial position of the object
-        self.init_pos = None
-
-        # Current position of the object
-        self.cur_pos = None
-
-    def can_overlap(self):
-        """Can the agent overlap with this?"""
-        return False
-
-    def can_pickup(self):
-        """Can the agent pick this up?"""
-        return False
-
-    def can_contain(self):
-        """Can this contain another object?"""
-        return False
-
-    def see_behind(self):
-        """Can the agent see behind this object?"""
-        return True
-
-    def toggle(self, env, pos):
-        """Method to trigger/toggle an action this object performs"""
-        return False
-
-    def encode(self):
-        """Encode the a description of this object as a 3-tuple of integers"""
-        return (OBJECT_TO_IDX[self.type], COLOR_TO_IDX[self.color], 0)
-
-    @staticmethod
-    def decode(type_idx, color_idx, state):
-        """Create an object from a 3-tuple state description"""
-
-        obj_type = IDX_TO_OBJECT[type_idx]
-        color = IDX_TO_COLOR[color_idx]
-
-        if obj_type == "empty" or obj_type == "unseen":
-            return None
-
-        # State, 0: open, 1: closed, 2: locked
-        is_open = state == 0
-        is_locked = state == 2
-
-        if obj_type == "wall":
-            v = Wall(color)
-        elif obj_type == "floor":
-            v = Floor(color)
-        elif obj_type == "ball":
-            v = Ball(color)
-        elif obj_type == "key":
-            v = Key(color)
-        elif obj_type == "box":
-            v = Box(color)
-        elif obj_type == "door":
-            v = Door(color, is_open, is_locked)
-        elif obj_type == "goal":
-            v = Goal()
-        elif obj_type == "lava":
-            v = Lava()
-        else:
-            assert False, "unknown object type in decode '%s'" % obj_type
-
-        return v
-
-    def render(self, r):
-        """Draw this object with the given renderer"""
-        raise NotImplementedError
-
-
-class Goal(WorldObj):
-    def __init__(self):
-        super().__init__("goal", "green")
-
-    def can_overlap(self):
-        return True
-
-    def render(self, img):
-        fill_coords(img, point_in_rect(0, 1, 0, 1), COLORS[self.color])
-
-
-class Floor(WorldObj):
-    """
-    Colored floor tile the agent can walk over
-    """
-
-    def __init__(self, color="blue"):
-        super().__init__("floor", color)
-
-    def can_overlap(self):
-        return True
-
-    def render(self, img):
-        # Give the floor a pale color
-        color = COLORS[self.color] / 2
-        fill_coords(img, point_in_rect(0.031, 1, 0.031, 1), color)
-
-
-class Lava(WorldObj):
-    def __init__(self):
-        super().__init__("lava", "red")
-
-    def can_overlap(self):
-        return True
-
-    def render(self, img):
-        c = (255, 128, 0)
-
-        # Background color
-        fill_coords(img, point_in_rect(0, 1, 0, 1), c)
-
-        # Little waves
-        for i in range(3):
-            ylo = 0.3 + 0.2 * i
-            yhi = 0.4 + 0.2 * i
-            fill_coords(img, point_in_line(0.1, ylo, 0.3, yhi, r=0.03), (0, 0, 0))
-            fill_coords(img, point_in_line(0.3, yhi, 0.5, ylo, r=0.03), (0, 0, 0))
-            fill_coords(img, point_in_line(0.5, ylo, 0.7, yhi, r=0.03), (0, 0, 0))
-            fill_coords(img, point_in_line(0.7, yhi, 0.9, ylo, r=0.03), (0, 0, 0))
-
-
-class Wall(WorldObj):
-    def __init__(self, color="grey"):
-        super().__init__("wall", color)
-
-    def see_behind(self):
-        return False
-
-    def render(self, img):
-        fill_coords(img, point_in_rect(0, 1, 0, 1), COLORS[self.color])
 
 
-class Door(WorldObj):
-    def __init__(self, color, is_open=False, is_locked=False):
-        super().__init__("door", color)
-        self.is_open = is_open
-        self.is_locked = is_locked
-
-    def can_overlap(self):
-        """The agent can only walk over this cell when the door is open"""
-        return self.is_open
-
-    def see_behind(self):
-        return self.is_open
-
-    def toggle(self, env, pos):
-        # If the player has the right key to open the door
-        if self.is_locked:
-            if isinstance(env.carrying, Key) and env.carrying.color == self.color:
-                self.is_locked = False
-                self.is_open = True
-                return True
-            return False
-
-        self.is_open = not self.is_open
-        return True
-
-    def encode(self):
-        """Encode the a description of this object as a 3-tuple of integers"""
-
-        # State, 0: open, 1: closed, 2: locked
-        if self.is_open:
-            state = 0
-        elif self.is_locked:
-            state = 2
-        # if door is closed and unlocked
-        elif not self.is_open:
-            state = 1
-        else:
-            raise ValueError(
-                f"There is no possible state encoding for the state:\n -Door Open: {self.is_open}\n -Door Closed: {not self.is_open}\n -Door Locked: {self.is_locked}"
-            )
-
-        return (OBJECT_TO_IDX[self.type], COLOR_TO_IDX[self.color], state)
-
-    def render(self, img):
-        c = COLORS[self.color]
-
-        if self.is_open:
-            fill_coords(img, point_in_rect(0.88, 1.00, 0.00, 1.00), c)
-            fill_coords(img, point_in_rect(0.92, 0.96, 0.04, 0.96), (0, 0, 0))
-            return
-
-        # Door frame and door
-        if self.is_locked:
-            fill_coords(img, point_in_rect(0.00, 1.00, 0.00, 1.00), c)
-            fill_coords(img, point_in_rect(0.06, 0.94, 0.06, 0.94), 0.45 * np.array(c))
-
-            # Draw key slot
-            fill_coords(img, point_in_rect(0.52, 0.75, 0.50, 0.56), c)
-        else:
-            fill_coords(img, point_in_rect(0.00, 1.00, 0.00, 1.00), c)
-            fill_coords(img, point_in_rect(0.04, 0.96, 0.04, 0.96), (0, 0, 0))
-            fill_coords(img, point_in_rect(0.08, 0.92, 0.08, 0.92), c)
-            fill_coords(img, point_in_rect(0.12, 0.88, 0.12, 0.88), (0, 0, 0))
-
-            # Draw door handle
-            fill_coords(img, point_in_circle(cx=0.75, cy=0.50, r=0.08), c)
-
-
-class Key(WorldObj):
-    def __init__(self, color="blue"):
-        super().__init__("key", color)
-
-    def can_pickup(self):
-        return True
-
-    def render(self, img):
-        c = COLORS[self.color]
-
-        # Vertical quad
-        fill_coords(img, point_in_rect(0.50, 0.63, 0.31, 0.88), c)
-
-        # Teeth
-        fill_coords(img, point_in_rect(0.38, 0.50, 0.59, 0.66), c)
-        fill_coords(img, point_in_rect(0.38, 0.50, 0.81, 0.88), c)
-
-        # Ring
-        fill_coords(img, point_in_circle(cx=0.56, cy=0.28, r=0.190), c)
-        fill_coords(img, point_in_circle(cx=0.56, cy=0.28, r=0.064), (0, 0, 0))
-
-
-class Ball(WorldObj):
-    def __init__(self, color="blue"):
-        super().__init__("ball", color)
-
-    def can_pickup(self):
-        return True
-
-    def render(self, img):
-        fill_coords(img, point_in_circle(0.5, 0.5, 0.31), COLORS[self.color])
-
-
-class Box(WorldObj):
-    def __init__(self, color, contains=None):
-        super().__init__("box", color)
-        self.contains = contains
-
-    def can_pickup(self):
-        return True
-
-    def render(self, img):
-        c = COLORS[self.color]
-
-        # Outline
-        fill_coords(img, point_in_rect(0.12, 0.88, 0.12, 0.88), c)
-        fill_coords(img, point_in_rect(0.18, 0.82, 0.18, 0.82), (0, 0, 0))
-
-        # Horizontal slit
-        fill_coords(img, point_in_rect(0.16, 0.84, 0.47, 0.53), c)
-
-    def toggle(self, env, pos):
-        # Replace the box by its contents
-        env.grid.set(pos[0], pos[1], self.contains)
-        return True
-
-
-class Grid:
+@lru_cache(maxsize=None)
+def view_offsets(agent_dir, agent_view_size):
     """
-    Represent a grid and operations on it
+    Offsets from the agent position of the cells in its view, laid out like
+    the observation: cell (i, j) of the view is `i - agent_view_size // 2`
+    cells to the right of the agent and `agent_view_size - 1 - j` cells ahead
     """
 
-    # Static cache of pre-renderer tiles
-    tile_cache = {}
-
-    def __init__(self, width, height):
-        assert width >= 3
-        assert height >= 3
-
-        self.width = width
-        self.height = height
-
-        self.grid = [None] * width * height
-
-    def __contains__(self, key):
-        if isinstance(key, WorldObj):
-            for e in self.grid:
-                if e is key:
-                    return True
-        elif isinstance(key, tuple):
-            for e in self.grid:
-                if e is None:
-                    continue
-                if (e.color, e.type) == key:
-                    return True
-                if key[0] is None and key[1] == e.type:
-                    return True
-        return False
-
-    def __eq__(self, other):
-        grid1 = self.encode()
-        grid2 = other.encode()
-        return np.array_equal(grid2, grid1)
-
-    def __ne__(self, other):
-        return not self == other
-
-    def copy(self):
-        from copy import deepcopy
-
-        return deepcopy(self)
-
-    def set(self, i, j, v):
-        assert i >= 0 and i < self.width
-        assert j >= 0 and j < self.height
-        self.grid[j * self.width + i] = v
-
-    def get(self, i, j):
-        assert i >= 0 and i < self.width
-        assert j >= 0 and j < self.height
-        return self.grid[j * self.width + i]
-
-    def horz_wall(self, x, y, length=None, obj_type=Wall):
-        if length is None:
-            length = self.width - x
-        for i in range(0, length):
-            self.set(x + i, y, obj_type())
-
-    def vert_wall(self, x, y, length=None, obj_type=Wall):
-        if length is None:
-            length = self.height - y
-        for j in range(0, length):
-            self.set(x, y + j, obj_type())
-
-    def wall_rect(self, x, y, w, h):
-        self.horz_wall(x, y, w)
-        self.horz_wall(x, y + h - 1, w)
-        self.vert_wall(x, y, h)
-        self.vert_wall(x + w - 1, y, h)
-
-    def rotate_left(self):
-        """
-        Rotate the grid to the left (counter-clockwise)
-        """
-
-        grid = Grid(self.height, self.width)
-
-        for i in range(self.width):
-            for j in range(self.height):
-                v = self.get(i, j)
-                grid.set(j, grid.height - 1 - i, v)
-
-        return grid
-
-    def slice(self, topX, topY, width, height):
-        """
-        Get a subset of the grid
-        """
-
-        grid = Grid(width, height)
-
-        for j in range(0, height):
-            for i in range(0, width):
-                x = topX + i
-                y = topY + j
-
-                if x >= 0 and x < self.width and y >= 0 and y < self.height:
-                    v = self.get(x, y)
-                else:
-                    v = Wall()
-
-                grid.set(i, j, v)
-
-        return grid
-
-    @classmethod
-    def render_tile(
-        cls, obj, agent_dir=None, highlight=False, tile_size=TILE_PIXELS, subdivs=3
-    ):
-        """
-        Render a tile and cache the result
-        """
-
-        # Hash map lookup key for the cache
-        key = (agent_dir, highlight, tile_size)
-        key = obj.encode() + key if obj else key
-
-        if key in cls.tile_cache:
-            return cls.tile_cache[key]
-
-        img = np.zeros(
-            shape=(tile_size * subdivs, tile_size * subdivs, 3), dtype=np.uint8
-        )
-
-        # Draw the grid lines (top and left edges)
-        fill_coords(img, point_in_rect(0, 0.031, 0, 1), (100, 100, 100))
-        fill_coords(img, point_in_rect(0, 1, 0, 0.031), (100, 100, 100))
-
-        if obj is not None:
-            obj.render(img)
-
-        # Overlay the agent on top
-        if agent_dir is not None:
-            tri_fn = point_in_triangle(
-                (0.12, 0.19),
-                (0.87, 0.50),
-                (0.12, 0.81),
-            )
-
-            # Rotate the agent based on its direction
-            tri_fn = rotate_fn(tri_fn, cx=0.5, cy=0.5, theta=0.5 * math.pi * agent_dir)
-            fill_coords(img, tri_fn, (255, 0, 0))
-
-        # Highlight the cell if needed
-        if highlight:
-            highlight_img(img)
-
-        # Downsample the image to perform supersampling/anti-aliasing
-        img = downsample(img, subdivs)
-
-        # Cache the rendered tile
-        cls.tile_cache[key] = img
-
-        return img
-
-    def render(self, tile_size, agent_pos, agent_dir=None, highlight_mask=None):
-        """
-        Render this grid at a given scale
-        :param r: target renderer object
-        :param tile_size: tile size in pixels
-        """
-
-        if highlight_mask is None:
-            highlight_mask = np.zeros(shape=(self.width, self.height), dtype=bool)
-
-        # Compute the total grid size
-        width_px = self.width * tile_size
-        height_px = self.height * tile_size
-
-        img = np.zeros(shape=(height_px, width_px, 3), dtype=np.uint8)
-
-        # Render the grid
-        for j in range(0, self.height):
-            for i in range(0, self.width):
-                cell = self.get(i, j)
-
-                agent_here = np.array_equal(agent_pos, (i, j))
-                tile_img = Grid.render_tile(
-                    cell,
-                    agent_dir=agent_dir if agent_here else None,
-                    highlight=highlight_mask[i, j],
-                    tile_size=tile_size,
-                )
-
-                ymin = j * tile_size
-                ymax = (j + 1) * tile_size
-                xmin = i * tile_size
-                xmax = (i + 1) * tile_size
-                img[ymin:ymax, xmin:xmax, :] = tile_img
-
-        return img
-
-    def encode(self, vis_mask=None):
-        """
-        Produce a compact numpy encoding of the grid
-        """
-
-        if vis_mask is None:
-            vis_mask = np.ones((self.width, self.height), dtype=bool)
-
-        array = np.zeros((self.width, self.height, 3), dtype="uint8")
-
-        for i in range(self.width):
-            for j in range(self.height):
-                if vis_mask[i, j]:
-                    v = self.get(i, j)
-
-                    if v is None:
-                        array[i, j, 0] = OBJECT_TO_IDX["empty"]
-                        array[i, j, 1] = 0
-                        array[i, j, 2] = 0
-
-                    else:
-                        array[i, j, :] = v.encode()
-
-        return array
-
-    @staticmethod
-    def decode(array):
-        """
-        Decode an array grid encoding back into a grid
-        """
-
-        width, height, channels = array.shape
-        assert channels == 3
-
-        vis_mask = np.ones(shape=(width, height), dtype=bool)
-
-        grid = Grid(width, height)
-        for i in range(width):
-            for j in range(height):
-                type_idx, color_idx, state = array[i, j]
-                v = WorldObj.decode(type_idx, color_idx, state)
-                grid.set(i, j, v)
-                vis_mask[i, j] = type_idx != OBJECT_TO_IDX["unseen"]
+    f_vec = DIR_TO_VEC[agent_dir]
+    r_vec = np.array((-f_vec[1], f_vec[0]))
 
-        return grid, vis_mask
-
-    def process_vis(self, agent_pos):
-        mask = np.zeros(shape=(self.width, self.height), dtype=bool)
+    view_i, view_j = np.meshgrid(
+        np.arange(agent_view_size), np.arange(agent_view_size), indexing="ij"
+    )
+    right = view_i - agent_view_size // 2
+    ahead = agent_view_size - 1 - view_j
 
-        mask[agent_pos[0], agent_pos[1]] = True
+    offsets = (f_vec[0] * ahead + r_vec[0] * right, f_vec[1] * ahead + r_vec[1] * right)
+    for offset in offsets:
+        offset.flags.writeable = False
 
-        for j in reversed(range(0, self.height)):
-            for i in range(0, self.width - 1):
-                if not mask[i, j]:
-                    continue
-
-                cell = self.get(i, j)
-                if cell and not cell.see_behind():
-                    continue
-
-                mask[i + 1, j] = True
-                if j > 0:
-                    mask[i + 1, j - 1] = True
-                    mask[i, j - 1] = True
-
-            for i in reversed(range(1, self.width)):
-                if not mask[i, j]:
-                    continue
-
-                cell = self.get(i, j)
-                if cell and not cell.see_behind():
-                    continue
-
-                mask[i - 1, j] = True
-                if j > 0:
-                    mask[i - 1, j - 1] = True
-                    mask[i, j - 1] = True
-
-        for j in range(0, self.height):
-            for i in range(0, self.width):
-                if not mask[i, j]:
-                    self.set(i, j, None)
-
-        return mask
+    return offsets
 
 
 class MiniGridEnv(gym.Env):
@@ -835,20 +84,7 @@ class MiniGridEnv(gym.Env):
     }
 
     # Enumeration of possible actions
-    class Actions(IntEnum):
-        # Turn left, turn right, move forward
-        left = 0
-        right = 1
-        forward = 2
-        # Pick up an object
-        pickup = 3
-        # Drop an object
-        drop = 4
-        # Toggle/activate an object
-        toggle = 5
-
-        # Done completing task
-        done = 6
+    Actions = Actions
 
     def __init__(
         self,
@@ -924,12 +160,32 @@ class MiniGridEnv(gym.Env):
         self.grid = Grid(width, height)
         self.carrying = None
 
+        # Optional `LevelBank` of pre-generated levels used by `reset`
+        self.level_bank = None
+
         # Rendering attributes
         self.render_mode = render_mode
         self.highlight = highlight
         self.tile_size = tile_size
         self.agent_pov = agent_pov
 
+        # Last rendered frames, updated incrementally
+        self.full_frame = FrameCache()
+        self.pov_frame = FrameCache()
+
+    def __getstate__(self):
+        # The last rendered frames are caches, rebuilt on the next render,
+        # and the states recorded to check hashes are only for debugging
+        state = self.__dict__.copy()
+        del state["full_frame"], state["pov_frame"]
+        state.pop("_hashed_states", None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.full_frame = FrameCache()
+        self.pov_frame = FrameCache()
+
     def reset(self, *, seed=None, options=None):
         super().reset(seed=seed)
 
@@ -937,8 +193,12 @@ class MiniGridEnv(gym.Env):
         self.agent_pos = (-1, -1)
         self.agent_dir = -1
 
-        # Generate a new random grid at the start of each episode
-        self._gen_grid(self.width, self.height)
+        # Generate a new random grid at the start of each episode, or
+        # restore it from the level bank if it holds this seed
+        if self.level_bank is not None and seed in self.level_bank:
+            self.level_bank.restore(self, seed)
+        else:
+            self._gen_grid(self.width, self.height)
 
         # These fields should be defined by _gen_grid
         assert (
@@ -971,12 +231,122 @@ class MiniGridEnv(gym.Env):
         """
         sample_hash = hashlib.sha256()
 
-        to_encode = [self.grid.encode().tolist(), self.agent_pos, self.agent_dir]
+        to_encode = [self.grid.encoding.tolist(), self.agent_pos, self.agent_dir]
         for item in to_encode:
             sample_hash.update(str(item).encode("utf8"))
 
         return sample_hash.hexdigest()[:size]
 
+    def state_hash(self, check=False):
+        """
+        64-bit Zobrist hash of the state of the environment: its grid, the
+        pose of the agent and the object it carries. The hash of the grid is
+        updated incrementally as it changes, so this takes constant time.
+
+        With `check` set, the hash of the grid is recomputed from scratch
+        and the full states seen are recorded, raising a RuntimeError if the
+        hash is stale or if two different states get the same hash.
+        """
+
+        grid_key = self.grid.zobrist_hash()
+        key = (
+            grid_key
+            ^ agent_key(self.agent_pos, self.agent_dir)
+            ^ carrying_key(self.carrying)
+        )
+
+        if check:
+            if grid_key != grid_hash(self.grid.encoding):
+                raise RuntimeError("stale grid hash, the grid was written directly")
+
+            x, y = self.agent_pos
+            carrying = self.carrying.encode() if self.carrying else None
+            state = (
+                self.grid.encoding.tobytes(),
+                int(x),
+                int(y),
+                self.agent_dir,
+                carrying,
+            )
+
+            states = self.__dict__.setdefault("_hashed_states", {})
+            if states.setdefault(key, state) != state:
+                raise RuntimeError(f"hash collision on {key:#018x}")
+
+        return key
+
+    def get_state(self, state=None):
+        """
+        Snapshot of the state of the environment within an episode: the
+        encoding of the grid, the objects placed in it and their attributes,
+        the pose of the agent, the object it carries, the step count and the
+        state of the random number generator. It is restored by `set_state`,
+        which is much cheaper than copying the environment.
+
+        Objects are kept by reference along with a shallow copy of their
+        attributes, so a snapshot can only be restored in the episode it
+        was taken in. Passing a previous snapshot as `state` reuses its
+        buffers.
+        """
+
+        grid = self.grid
+        if state is None or state["grid"] is not grid:
+            state = {
+                "grid": grid,
+                "encoding": np.empty_like(grid._encoding),
+                "objs": np.empty_like(grid.objs),
+            }
+
+        np.copyto(state["encoding"], grid._encoding)
+        np.copyto(state["objs"], grid.objs)
+
+        objs = [obj for obj in grid.objs.ravel().tolist() if obj is not None]
+        if self.carrying is not None:
+            objs.append(self.carrying)
+        state["obj_attrs"] = [(obj, obj.__dict__.copy()) for obj in objs]
+
+        agent_pos = self.agent_pos
+        if isinstance(agent_pos, np.ndarray):
+            agent_pos = agent_pos.copy()
+
+        state["zobrist"] = grid._zobrist
+        state["agent_pos"] = agent_pos
+        state["agent_dir"] = self.agent_dir
+        state["carrying"] = self.carrying
+        state["step_count"] = self.step_count
+        state["rng"] = (
+            None if self._np_random is None else self._np_random.bit_generator.state
+        )
+
+        return state
+
+    def set_state(self, state):
+        """
+        Restore a snapshot taken by `get_state` in the current episode
+        """
+
+        grid = self.grid
+        if state["grid"] is not grid:
+            raise ValueError("the state was taken in another episode")
+
+        np.copyto(grid._encoding, state["encoding"])
+        np.copyto(grid.objs, state["objs"])
+        grid._zobrist = state["zobrist"]
+
+        for obj, attrs in state["obj_attrs"]:
+            obj.__dict__.update(attrs)
+
+        agent_pos = state["agent_pos"]
+        if isinstance(agent_pos, np.ndarray):
+            agent_pos = agent_pos.copy()
+
+        self.agent_pos = agent_pos
+        self.agent_dir = state["agent_dir"]
+        self.carrying = state["carrying"]
+        self.step_count = state["step_count"]
+        if state["rng"] is not None:
+            self._np_random.bit_generator.state = state["rng"]
+
     @property
     def steps_remaining(self):
         return self.max_steps - self.step_count
@@ -1109,13 +479,25 @@ class MiniGridEnv(gym.Env):
             self.np_random.integers(yLow, yHigh),
         )
 
-    def place_obj(self, obj, top=None, size=None, reject_fn=None, max_tries=math.inf):
+    def place_obj(
+        self,
+        obj,
+        top=None,
+        size=None,
+        reject_fn=None,
+        max_tries=math.inf,
+        reject_mask=None,
+    ):
         """
         Place an object at an empty position in the grid
 
         :param top: top-left position of the rectangle where to place
         :param size: size of the rectangle where to place
         :param reject_fn: function to filter out potential positions
+        :param max_tries: maximum number of positions to sample
+        :param reject_mask: vectorized alternative to `reject_fn`, called
+            as `reject_mask(env, xs, ys)` with broadcastable coordinate
+            arrays and returning a boolean array of the rejected positions
         """
 
         if top is None:
@@ -1126,35 +508,47 @@ class MiniGridEnv(gym.Env):
         if size is None:
             size = (self.grid.width, self.grid.height)
 
+        x0, y0 = top
+        x1 = min(top[0] + size[0], self.grid.width)
+        y1 = min(top[1] + size[1], self.grid.height)
+
+        # Mask of the candidate positions: empty cells of the rectangle,
+        # minus the agent's cell and the positions rejected by the mask
+        valid = self.grid.free_mask(x0, y0, x1 - x0, y1 - y0)
+        if self.agent_pos is not None:
+            ax, ay = self.agent_pos
+            if x0 <= ax < x1 and y0 <= ay < y1:
+                valid[ax - x0, ay - y0] = False
+        if reject_mask is not None:
+            xs, ys = np.ogrid[x0:x1, y0:y1]
+            valid &= ~reject_mask(self, xs, ys)
+
+        # Positions still to be checked by the filtering function
+        num_candidates = np.count_nonzero(valid)
         num_tries = 0
 
         while True:
-            # This is to handle with rare cases where rejection sampling
-            # gets stuck in an infinite loop
-            if num_tries > max_tries:
+            # Fail right away when no position is left, and otherwise handle
+            # the rare cases where rejection sampling gets stuck
+            if num_candidates == 0 or num_tries > max_tries:
                 raise RecursionError("rejection sampling failed in place_obj")
 
             num_tries += 1
 
-            pos = np.array(
-                (
-                    self._rand_int(top[0], min(top[0] + size[0], self.grid.width)),
-                    self._rand_int(top[1], min(top[1] + size[1], self.grid.height)),
-                )
+            # Sample positions the same way as before the mask existed, so
+            # that the levels generated for each seed are unchanged
+            pos = (
+                self._rand_int(x0, x1),
+                self._rand_int(y0, y1),
             )
 
-            pos = tuple(pos)
-
-            # Don't place the object on top of another object
-            if self.grid.get(*pos) is not None:
-                continue
-
-            # Don't place the object where the agent is
-            if np.array_equal(pos, self.agent_pos):
+            if not valid[pos[0] - x0, pos[1] - y0]:
                 continue
 
             # Check if there is a filtering criterion
             if reject_fn and reject_fn(self, pos):
+                valid[pos[0] - x0, pos[1] - y0] = False
+                num_candidates -= 1
                 continue
 
             break
@@ -1385,6 +779,21 @@ class MiniGridEnv(gym.Env):
 
         return obs, reward, terminated, truncated, {}
 
+    def get_view_cells(self, agent_view_size=None):
+        """
+        Get the grid coordinates of the cells in the agent's view, as two
+        arrays laid out like the observation (the agent being at the bottom
+        center, looking up). Note that the coordinates may be outside of the
+        grid.
+        if agent_view_size is None, self.agent_view_size is used
+        """
+
+        agent_view_size = agent_view_size or self.agent_view_size
+
+        dx, dy = view_offsets(int(self.agent_dir), agent_view_size)
+
+        return self.agent_pos[0] + dx, self.agent_pos[1] + dy
+
     def gen_obs_grid(self, agent_view_size=None):
         """
         Generate the sub-grid observed by the agent.
@@ -1393,17 +802,11 @@ class MiniGridEnv(gym.Env):
         if agent_view_size is None, self.agent_view_size is used
         """
 
-        topX, topY, botX, botY = self.get_view_exts(agent_view_size)
-
         agent_view_size = agent_view_size or self.agent_view_size
 
-        grid = self.grid.slice(topX, topY, agent_view_size, agent_view_size)
-
-        for i in range(self.agent_dir + 1):
-            grid = grid.rotate_left()
+        grid = self.grid.gather(*self.get_view_cells(agent_view_size))
 
         # Process occluders and visibility
-        # Note that this incurs some performance cost
         if not self.see_through_walls:
             vis_mask = grid.process_vis(
                 agent_pos=(agent_view_size // 2, agent_view_size - 1)
@@ -1422,15 +825,36 @@ class MiniGridEnv(gym.Env):
 
         return grid, vis_mask
 
+    def gen_obs_encoding(self, agent_view_size=None):
+        """
+        Generate the encoding of the sub-grid observed by the agent, along
+        with its visibility mask, without creating a sub-grid.
+        if agent_view_size is None, self.agent_view_size is used
+        """
+
+        agent_view_size = agent_view_size or self.agent_view_size
+
+        image = self.grid.encode_cells(*self.get_view_cells(agent_view_size))
+
+        # Process occluders and visibility
+        agent_pos = agent_view_size // 2, agent_view_size - 1
+        if not self.see_through_walls:
+            vis_mask = compute_vis_mask(image, agent_pos)
+        else:
+            vis_mask = np.ones(shape=image.shape[:2], dtype=bool)
+
+        # The agent sees what it's carrying at its own position
+        image[agent_pos] = self.carrying.encode() if self.carrying else EMPTY_ENCODING
+        image[~vis_mask] = 0
+
+        return image, vis_mask
+
     def gen_obs(self):
         """
         Generate the agent's view (partially observable, low-resolution encoding)
         """
 
-        grid, vis_mask = self.gen_obs_grid()
-
-        # Encode the partially observable view into a numpy array
-        image = grid.encode(vis_mask)
+        image, _ = self.gen_obs_encoding()
 
         # Observations are dictionaries containing:
         # - an image (partially observable view of the environment)
@@ -1444,62 +868,48 @@ class MiniGridEnv(gym.Env):
         """
         Render an agent's POV observation for visualization
         """
-        grid, vis_mask = self.gen_obs_grid()
+        image, vis_mask = self.gen_obs_encoding()
 
         # Render the whole grid
-        img = grid.render(
+        img = Grid.render_encoding(
+            image,
             tile_size,
             agent_pos=(self.agent_view_size // 2, self.agent_view_size - 1),
             agent_dir=3,
             highlight_mask=vis_mask,
+            frame=self.pov_frame,
         )
 
         return img
 
-    def get_full_render(self, highlight, tile_size):
+    def get_highlight_mask(self):
         """
-        Render a non-paratial observation for visualization
+        Compute the mask of the cells of the grid that are visible to the
+        agent, which are highlighted when rendering the whole grid
         """
         # Compute which cells are visible to the agent
-        _, vis_mask = self.gen_obs_grid()
-
-        # Compute the world coordinates of the bottom-left corner
-        # of the agent's view area
-        f_vec = self.dir_vec
-        r_vec = self.right_vec
-        top_left = (
-            self.agent_pos
-            + f_vec * (self.agent_view_size - 1)
-            - r_vec * (self.agent_view_size // 2)
-        )
-
-        # Mask of which cells to highlight
-        highlight_mask = np.zeros(shape=(self.width, self.height), dtype=bool)
-
-        # For each cell in the visibility mask
-        for vis_j in range(0, self.agent_view_size):
-            for vis_i in range(0, self.agent_view_size):
-                # If this cell is not visible, don't highlight it
-                if not vis_mask[vis_i, vis_j]:
-                    continue
+        _, vis_mask = self.gen_obs_encoding()
 
-                # Compute the world coordinates of this cell
-                abs_i, abs_j = top_left - (f_vec * vis_j) + (r_vec * vis_i)
+        # Highlight the visible cells that are inside the grid
+        xs, ys = self.get_view_cells()
+        vis_mask &= (xs >= 0) & (xs < self.width) & (ys >= 0) & (ys < self.height)
 
-                if abs_i < 0 or abs_i >= self.width:
-                    continue
-                if abs_j < 0 or abs_j >= self.height:
-                    continue
+        highlight_mask = np.zeros(shape=(self.width, self.height), dtype=bool)
+        highlight_mask[xs[vis_mask], ys[vis_mask]] = True
 
-                # Mark this cell to be highlighted
-                highlight_mask[abs_i, abs_j] = True
+        return highlight_mask
 
+    def get_full_render(self, highlight, tile_size):
+        """
+        Render a non-paratial observation for visualization
+        """
         # Render the whole grid
         img = self.grid.render(
             tile_size,
             self.agent_pos,
             self.agent_dir,
-            highlight_mask=highlight_mask if highlight else None,
+            highlight_mask=self.get_highlight_mask() if highlight else None,
+            frame=self.full_frame,
         )
 
         return img
@@ -1545,3 +955,56 @@ class MiniGridEnv(gym.Env):
     def close(self):
         if self.window:
             self.window.close()
+
+
+def get_frames(
+    envs,
+    highlight: bool = True,
+    tile_size: int = TILE_PIXELS,
+    agent_pov: bool = False,
+    out: Optional[np.ndarray] = None,
+):
+    """Returns the frames of a batch of environments, as `get_frame` would.
+
+    The environments must have grids of the same size, or the same view size for point of view frames. The tiles of all
+    the frames are gathered at once from the tile atlas.
+
+    Args:
+
+        envs: The environments, possibly wrapped.
+        highlight (bool): If true, the agent's field of view or point of view is highlighted with a lighter gray color.
+        tile_size (int): How many pixels will form a tile from the NxM grid.
+        agent_pov (bool): If true, the rendered frame will only contain the point of view of the agent.
+        out (np.ndarray): If given, the uint8 array of shape (num_envs, height, width, 3) where the frames are written.
+
+    Returns:
+
+        frames (np.ndarray): An array of shape (num_envs, height, width, 3) holding the frames.
+
+    """
+    envs = [env.unwrapped for env in envs]
+
+    if agent_pov:
+        encodings, highlight_masks = zip(*(env.gen_obs_encoding() for env in envs))
+        view_size = envs[0].agent_view_size
+        agent_pos = [(view_size // 2, view_size - 1)] * len(envs)
+        agent_dir = [3] * len(envs)
+    else:
+        encodings = [env.grid.encoding for env in envs]
+        highlight_masks = None
+        if highlight:
+            highlight_masks = [env.get_highlight_mask() for env in envs]
+        agent_pos = [env.agent_pos for env in envs]
+        agent_dir = [env.agent_dir for env in envs]
+
+    if highlight_masks is not None:
+        highlight_masks = np.stack(highlight_masks)
+
+    return Grid.render_encoding(
+        np.stack(encodings),
+        tile_size,
+        agent_pos,
+        agent_dir,
+        highlight_mask=highlight_masks,
+        out=out,
+    )
@@ -0,0 +1,207 @@
+"""
+Tabular MDPs of MiniGrid levels.
+
+`TabularMDP` enumerates every state reachable from the current state of an
+environment, with breadth-first search over the encoded states of
+`minigrid.core.transition`, and stores its deterministic transitions in
+tables. This gives exact values of small levels, e.g. to baseline agents,
+and the transitions can be exported as sparse CSR matrices.
+"""
+import numpy as np
+
+from minigrid.core.transition import encode_state, transition
+from minigrid.core.zobrist import state_hashes
+from minigrid.minigrid_env import MiniGridEnv
+
+# Encoded state arrays identifying states, the step count being left out
+STATE_KEYS = (
+    "grid",
+    "agent_pos",
+    "agent_dir",
+    "carrying",
+    "contents",
+    "carrying_contents",
+)
+
+
+def _state_rows(states):
+    """
+    Rows of bytes identifying a batch of encoded states
+    """
+
+    num_states = len(states["agent_dir"])
+    rows = np.concatenate(
+        [
+            states[key].reshape(num_states, -1).astype(np.uint8, copy=False)
+            for key in STATE_KEYS
+        ],
+        axis=1,
+    )
+
+    return [row.tobytes() for row in rows]
+
+
+class TabularMDP:
+    """
+    Deterministic MDP of the states reachable from the current state of an
+    environment, the initial state having index 0. For each state `s` and
+    action `a`:
+
+    - `next_state[s, a]` is the index of the next state, or -1 if the
+      transition ends the episode
+    - `rewards[s, a]` is the reward of the transition
+
+    Rewards are those of reaching the goal without the time penalty of
+    `MiniGridEnv._reward`, so 1, and the step limit is ignored. States are
+    also held as a batch of encoded states in `states`, and `state_index`
+    maps their `MiniGridEnv.state_hash` to their index. As the hash leaves
+    out the contents of boxes, levels where reachable states differ only by
+    these raise a ValueError.
+
+    Only environments stepped by `MiniGridEnv.step` are supported, the rules
+    added by other environments not being part of the transition function.
+    """
+
+    def __init__(self, env, max_states=1000000):
+        env = env.unwrapped
+        if type(env).step is not MiniGridEnv.step:
+            raise ValueError(f"{type(env).__name__} has its own step function")
+
+        self.num_actions = env.action_space.n
+        actions = np.arange(self.num_actions)
+
+        start = encode_state(env)
+        start_batch = {key: start[key][None] for key in STATE_KEYS}
+        index = {_state_rows(start_batch)[0]: 0}
+        batches = [start_batch]
+        next_states = []
+        rewards = []
+
+        frontier = start_batch
+        while len(frontier["agent_dir"]) > 0:
+            # Apply all the actions to all the states of the frontier
+            batch = {key: value[:, None] for key, value in frontier.items()}
+            batch["step_count"] = np.zeros((1, 1), dtype=np.int64)
+            new_states, reward, terminated, _ = transition(batch, actions, np.inf)
+
+            new_states = {
+                key: new_states[key].reshape((-1,) + new_states[key].shape[2:])
+                for key in STATE_KEYS
+            }
+            rows = _state_rows(new_states)
+            terminated = terminated.ravel()
+
+            # Number the states not seen before, in order
+            next_state = np.full(len(rows), -1, dtype=np.int64)
+            new = []
+            for i in np.flatnonzero(~terminated).tolist():
+                row = rows[i]
+                state = index.get(row)
+                if state is None:
+                    state = index[row] = len(index)
+                    new.append(i)
+                next_state[i] = state
+
+            if len(index) > max_states:
+                raise ValueError(f"more than {max_states} reachable states")
+
+            next_states.append(next_state.reshape(-1, self.num_actions))
+            rewards.append(reward.reshape(-1, self.num_actions))
+
+            frontier = {key: value[new] for key, value in new_states.items()}
+            batches.append(frontier)
+
+        self.num_states = len(index)
+        self.next_state = np.concatenate(next_states)
+        self.rewards = np.concatenate(rewards)
+        self.states = {
+            key: np.concatenate([batch[key] for batch in batches]) for key in STATE_KEYS
+        }
+
+        hashes = state_hashes(
+            self.states["grid"],
+            self.states["agent_pos"],
+            self.states["agent_dir"],
+            self.states["carrying"],
+        )
+        self.state_index = dict(zip(hashes.tolist(), range(self.num_states)))
+        if len(self.state_index) < self.num_states:
+            raise ValueError("different states have the same hash")
+
+    def index(self, env):
+        """
+        Index of the current state of an environment
+        """
+
+        return self.state_index[env.unwrapped.state_hash()]
+
+    def transition_csr(self):
+        """
+        Transition matrix in CSR form, as (data, indices, indptr) arrays, of
+        shape (num_states * num_actions, num_states), row `s * num_actions +
+        a` holding the next state of action `a` in state `s`. Rows of
+        transitions ending the episode are empty.
+        """
+
+        next_state = self.next_state.ravel()
+        ongoing = next_state >= 0
+
+        indices = next_state[ongoing]
+        data = np.ones(len(indices))
+        indptr = np.concatenate([[0], np.cumsum(ongoing)])
+
+        return data, indices, indptr
+
+    def reward_csr(self):
+        """
+        Reward matrix in CSR form, as (data, indices, indptr) arrays, of
+        shape (num_states, num_actions)
+        """
+
+        rows, cols = np.nonzero(self.rewards)
+        indptr = np.searchsorted(rows, np.arange(self.num_states + 1))
+
+        return self.rewards[rows, cols], cols, indptr
+
+    def to_scipy(self):
+        """
+        Transition and reward matrices as `scipy.sparse.csr_matrix`, see
+        `transition_csr` and `reward_csr`
+        """
+
+        try:
+            from scipy.sparse import csr_matrix
+        except ImportError:
+            raise ImportError(
+                "To export sparse matrices, please install scipy, eg: `pip3 install --user scipy`"
+            )
+
+        num_rows = self.num_states * self.num_actions
+        transitions = csr_matrix(
+            self.transition_csr(), shape=(num_rows, self.num_states)
+        )
+        rewards = csr_matrix(
+            self.reward_csr(), shape=(self.num_states, self.num_actions)
+        )
+
+        return transitions, rewards
+
+    def value_iteration(self, gamma=0.99, tol=1e-8, max_iters=100000):
+        """
+        Optimal state values and action values with discount `gamma`,
+        iterated until values change by less than `tol`
+        """
+
+        ongoing = self.next_state >= 0
+        next_state = np.where(ongoing, self.next_state, 0)
+
+        values = np.zeros(self.num_states)
+        for _ in range(max_iters):
+            q_values = self.rewards + gamma * np.where(ongoing, values[next_state], 0)
+            new_values = q_values.max(axis=1)
+            done = np.abs(new_values - values).max() < tol
+            values = new_values
+            if done:
+                break
+
+        return values, q_values
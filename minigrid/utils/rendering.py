@@ -1,4 +1,5 @@
 import math
+from functools import lru_cache
 
 import numpy as np
 
@@ -20,17 +21,30 @@ def downsample(img, factor):
     return img
 
 
+@lru_cache(maxsize=None)
+def pixel_coords(height, width):
+    """
+    Get the coordinates of the pixel centers of an image, normalized to [0, 1]
+    """
+
+    yf = (np.arange(height) + 0.5) / height
+    xf = (np.arange(width) + 0.5) / width
+    xs, ys = np.meshgrid(xf, yf)
+
+    xs.flags.writeable = False
+    ys.flags.writeable = False
+
+    return xs, ys
+
+
 def fill_coords(img, fn, color):
     """
-    Fill pixels of an image with coordinates matching a filter function
+    Fill pixels of an image with coordinates matching a filter function.
+    The filter function is evaluated on all the pixel coordinates at once.
     """
 
-    for y in range(img.shape[0]):
-        for x in range(img.shape[1]):
-            yf = (y + 0.5) / img.shape[0]
-            xf = (x + 0.5) / img.shape[1]
-            if fn(xf, yf):
-                img[y, x] = color
+    xs, ys = pixel_coords(img.shape[0], img.shape[1])
+    img[fn(xs, ys)] = color
 
     return img
 
@@ -61,20 +75,22 @@ def point_in_line(x0, y0, x1, y1, r):
     ymax = max(y0, y1) + r
 
     def fn(x, y):
-        # Fast, early escape test
-        if x < xmin or x > xmax or y < ymin or y > ymax:
-            return False
+        # Bounding box test
+        in_box = (x >= xmin) & (x <= xmax) & (y >= ymin) & (y <= ymax)
+
+        pq_x = x - p0[0]
+        pq_y = y - p0[1]
 
-        q = np.array([x, y])
-        pq = q - p0
+        # Closest point on line, computed in single precision
+        a = np.clip(pq_x * dir[0] + pq_y * dir[1], 0, dist).astype(np.float32)
+        p_x = p0[0] + a * dir[0]
+        p_y = p0[1] + a * dir[1]
 
-        # Closest point on line
-        a = np.dot(pq, dir)
-        a = np.clip(a, 0, dist)
-        p = p0 + a * dir
+        dx = x - p_x
+        dy = y - p_y
+        dist_to_line = np.sqrt(dx * dx + dy * dy)
 
-        dist_to_line = np.linalg.norm(q - p)
-        return dist_to_line <= r
+        return in_box & (dist_to_line <= r)
 
     return fn
 
@@ -88,7 +104,7 @@ def point_in_circle(cx, cy, r):
 
 def point_in_rect(xmin, xmax, ymin, ymax):
     def fn(x, y):
-        return x >= xmin and x <= xmax and y >= ymin and y <= ymax
+        return (x >= xmin) & (x <= xmax) & (y >= ymin) & (y <= ymax)
 
     return fn
 
@@ -98,25 +114,28 @@ def point_in_triangle(a, b, c):
     b = np.array(b, dtype=np.float32)
     c = np.array(c, dtype=np.float32)
 
+    v0 = c - a
+    v1 = b - a
+
+    # Compute dot products
+    dot00 = np.dot(v0, v0)
+    dot01 = np.dot(v0, v1)
+    dot11 = np.dot(v1, v1)
+    inv_denom = 1 / (dot00 * dot11 - dot01 * dot01)
+
     def fn(x, y):
-        v0 = c - a
-        v1 = b - a
-        v2 = np.array((x, y)) - a
+        v2_x = x - a[0]
+        v2_y = y - a[1]
 
-        # Compute dot products
-        dot00 = np.dot(v0, v0)
-        dot01 = np.dot(v0, v1)
-        dot02 = np.dot(v0, v2)
-        dot11 = np.dot(v1, v1)
-        dot12 = np.dot(v1, v2)
+        dot02 = v0[0] * v2_x + v0[1] * v2_y
+        dot12 = v1[0] * v2_x + v1[1] * v2_y
 
         # Compute barycentric coordinates
-        inv_denom = 1 / (dot00 * dot11 - dot01 * dot01)
         u = (dot11 * dot02 - dot01 * dot12) * inv_denom
         v = (dot00 * dot12 - dot01 * dot02) * inv_denom
 
         # Check if point is in triangle
-        return (u >= 0) and (v >= 0) and (u + v) < 1
+        return (u >= 0) & (v >= 0) & ((u + v) < 1)
 
     return fn
 
@@ -0,0 +1,733 @@
+import multiprocessing as mp
+import traceback
+from collections import OrderedDict
+from typing import Callable, List, Optional, Union
+
+import gymnasium as gym
+import numpy as np
+from gymnasium.vector import VectorEnv
+from gymnasium.wrappers import OrderEnforcing, PassiveEnvChecker
+
+from minigrid.core.actions import Actions
+from minigrid.core.constants import DIR_TO_VEC, OBJECT_TO_IDX
+from minigrid.core.grid import EMPTY_ENCODING, WALL_ENCODING, compute_vis_masks
+from minigrid.core.transition import CAN_OVERLAP, CAN_PICKUP, CAN_TOGGLE
+from minigrid.envs.unlock import UnlockEnv
+from minigrid.minigrid_env import MiniGridEnv, get_frames, view_offsets
+
+
+def _unlock_step(env, action, reward, terminated):
+    # Same as UnlockEnv.step, after MiniGridEnv.step
+    if action == env.actions.toggle:
+        if env.door.is_open:
+            reward = env._reward()
+            terminated = True
+
+    return reward, terminated
+
+
+# Wrappers added by `gym.make` that don't change how environments step
+PASSIVE_WRAPPERS = (OrderEnforcing, PassiveEnvChecker)
+
+# Environments overriding `step` that can still be stepped natively, with a
+# function applied to the outcome of `MiniGridEnv.step`, as the override does
+NATIVE_STEP_RULES = {
+    UnlockEnv: _unlock_step,
+}
+
+
+def _object_action(env, action):
+    """
+    Apply a pickup, drop or toggle action, as `MiniGridEnv.step` does
+    """
+
+    fwd_pos = env.front_pos
+    fwd_cell = env.grid.get(*fwd_pos)
+
+    if action == env.actions.pickup:
+        if fwd_cell and fwd_cell.can_pickup():
+            if env.carrying is None:
+                env.carrying = fwd_cell
+                env.carrying.cur_pos = np.array([-1, -1])
+                env.grid.set(fwd_pos[0], fwd_pos[1], None)
+
+    elif action == env.actions.drop:
+        if not fwd_cell and env.carrying:
+            env.grid.set(fwd_pos[0], fwd_pos[1], env.carrying)
+            env.carrying.cur_pos = fwd_pos
+            env.carrying = None
+
+    elif action == env.actions.toggle:
+        if fwd_cell:
+            fwd_cell.toggle(env, fwd_pos)
+
+
+class MiniGridVecEnv(VectorEnv):
+    """
+    Vectorized environment stepping several MiniGrid environments in
+    lockstep, as `gymnasium.vector.SyncVectorEnv` would but with the
+    environments' state held in stacked arrays.
+
+    The positions, directions and step counts of the agents, the objects
+    they carry and the encoded grids of all the environments are stacked,
+    the grid of each environment being a view of the stacked grids. Turning
+    and moving forward are applied to all the environments at once, and the
+    observations are generated for all of them at once. Only pickup, drop
+    and toggle actions, which change objects, and successful episodes go
+    through each environment.
+
+    Environments whose class overrides `step`, unless listed in
+    `NATIVE_STEP_RULES`, and environments with wrappers other than the
+    passive ones added by `gym.make` are stepped one by one through their
+    wrappers. All the environments must have MiniGrid's dictionary
+    observations, with the same image space. Environments stepped natively
+    must have the same grid size, view size and action space. As with
+    `SyncVectorEnv`, the environments are reset when their episode ends, the
+    last observation being kept in the `final_observation` info.
+    """
+
+    def __init__(self, env_fns: List[Callable[[], gym.Env]]):
+        # Environments as created, with their wrappers, and unwrapped
+        self.wrapped_envs = [env_fn() for env_fn in env_fns]
+        self.envs = [env.unwrapped for env in self.wrapped_envs]
+
+        env = self.wrapped_envs[0]
+        super().__init__(len(self.envs), env.observation_space, env.action_space)
+
+        space = self.single_observation_space
+        if not (
+            isinstance(space, gym.spaces.Dict)
+            and set(space.spaces) == {"image", "direction", "mission"}
+        ):
+            raise ValueError(
+                "environments must have MiniGrid observations, use SyncVectorEnv "
+                "for wrappers changing them"
+            )
+        for env in self.wrapped_envs:
+            if env.observation_space["image"] != space["image"]:
+                raise ValueError("environments must have the same image space")
+
+        # Environments stepped natively, and environments stepped one by one
+        self.is_native = np.array([self._is_native(env) for env in self.wrapped_envs])
+        self.native = np.flatnonzero(self.is_native)
+        self.fallback = np.flatnonzero(~self.is_native)
+
+        # Functions applied after the native step, by environment
+        self.step_rules = [
+            (i, NATIVE_STEP_RULES[type(self.envs[i])])
+            for i in self.native
+            if type(self.envs[i]) in NATIVE_STEP_RULES
+        ]
+
+        env = self.envs[self.native[0]] if len(self.native) > 0 else env
+        for i in self.native:
+            if (
+                self.envs[i].width != env.width
+                or self.envs[i].height != env.height
+                or self.envs[i].agent_view_size != env.agent_view_size
+            ):
+                raise ValueError(
+                    "environments stepped natively must have the same grid size "
+                    "and view size"
+                )
+            if self.envs[i].action_space != self.single_action_space:
+                raise ValueError("environments must have the same action space")
+
+        width, height = env.width, env.height
+        view_size = env.agent_view_size
+        self.view_size = view_size
+
+        # Stacked state of the environments
+        self.grids = np.zeros((self.num_envs, width, height, 3), dtype=np.uint8)
+        self.agent_pos = np.zeros((self.num_envs, 2), dtype=np.int64)
+        self.agent_dir = np.zeros(self.num_envs, dtype=np.int64)
+        self.step_count = np.zeros(self.num_envs, dtype=np.int64)
+        self.max_steps = np.array([env.max_steps for env in self.envs])
+        self.carrying = np.zeros((self.num_envs, 3), dtype=np.uint8)
+        self.see_through_walls = np.array([env.see_through_walls for env in self.envs])
+
+        # Offsets of the cells in view of the agent, by direction
+        offsets = [view_offsets(agent_dir, view_size) for agent_dir in range(4)]
+        self.view_dx = np.stack([dx for dx, _ in offsets])
+        self.view_dy = np.stack([dy for _, dy in offsets])
+
+        self.image = np.zeros((self.num_envs,) + space["image"].shape, dtype=np.uint8)
+
+        self._actions = None
+
+    @staticmethod
+    def _is_native(env):
+        # Wrappers would be bypassed by the native step
+        while isinstance(env, gym.Wrapper):
+            if type(env) not in PASSIVE_WRAPPERS:
+                return False
+            env = env.env
+
+        env_type = type(env)
+        if env_type.gen_obs is not MiniGridEnv.gen_obs:
+            return False
+        if env_type.step is MiniGridEnv.step:
+            return True
+
+        for rule_type in NATIVE_STEP_RULES:
+            if isinstance(env, rule_type) and env_type.step is rule_type.step:
+                return True
+
+        return False
+
+    def _sync_env(self, i):
+        """
+        Load the state of an environment after it was reset or stepped on
+        its own, and make its grid a view of the stacked grids
+        """
+
+        env = self.envs[i]
+
+        if self.is_native[i]:
+            self.grids[i] = env.grid.encoding
+            env.grid._encoding = self.grids[i]
+
+        self.agent_pos[i] = env.agent_pos
+        self.agent_dir[i] = env.agent_dir
+        self.step_count[i] = env.step_count
+        self.max_steps[i] = env.max_steps
+        self._sync_carrying(i)
+
+    def _sync_carrying(self, i):
+        carrying = self.envs[i].carrying
+        self.carrying[i] = carrying.encode() if carrying else EMPTY_ENCODING
+
+    def _gen_obs(self, idx):
+        """
+        Generate the observed images of some of the environments stepped
+        natively, as `MiniGridEnv.gen_obs` does
+        """
+
+        if len(idx) == 0:
+            return
+
+        view_size = self.view_size
+        _, width, height, _ = self.grids.shape
+
+        # Cells in view of the agents, cells outside of the grid being walls
+        agent_dir = self.agent_dir[idx]
+        xs = self.agent_pos[idx, 0, None, None] + self.view_dx[agent_dir]
+        ys = self.agent_pos[idx, 1, None, None] + self.view_dy[agent_dir]
+        inside = (xs >= 0) & (xs < width) & (ys >= 0) & (ys < height)
+
+        image = self.grids[
+            idx[:, None, None], np.clip(xs, 0, width - 1), np.clip(ys, 0, height - 1)
+        ]
+        image[~inside] = WALL_ENCODING
+
+        # Process occluders and visibility
+        agent_pos = view_size // 2, view_size - 1
+        vis_mask = compute_vis_masks(image, agent_pos)
+        vis_mask[self.see_through_walls[idx]] = True
+
+        # The agents see what they carry at their own position
+        image[:, agent_pos[0], agent_pos[1]] = self.carrying[idx]
+        image[~vis_mask] = 0
+
+        self.image[idx] = image
+
+    def _observations(self):
+        # Same keys and type as the observations of SyncVectorEnv
+        return OrderedDict(
+            [
+                ("direction", self.agent_dir.copy()),
+                ("image", self.image.copy()),
+                ("mission", tuple(env.mission for env in self.envs)),
+            ]
+        )
+
+    def _observation(self, i):
+        return {
+            "image": self.image[i].copy(),
+            "direction": self.envs[i].agent_dir,
+            "mission": self.envs[i].mission,
+        }
+
+    def _reset_env(self, i, **kwargs):
+        obs, info = self.wrapped_envs[i].reset(**kwargs)
+        self._sync_env(i)
+        if not self.is_native[i]:
+            self._load_observation(i, obs)
+
+        return info
+
+    def _load_observation(self, i, obs):
+        # Observation of an environment stepped one by one, which its
+        # wrappers may have changed
+        self.image[i] = obs["image"]
+        self.agent_dir[i] = obs["direction"]
+
+    def reset_wait(
+        self,
+        seed: Optional[Union[int, List[int]]] = None,
+        options: Optional[dict] = None,
+    ):
+        if seed is None:
+            seed = [None for _ in range(self.num_envs)]
+        if isinstance(seed, int):
+            seed = [seed + i for i in range(self.num_envs)]
+        assert len(seed) == self.num_envs
+
+        infos = {}
+        for i, single_seed in enumerate(seed):
+            kwargs = {}
+            if single_seed is not None:
+                kwargs["seed"] = single_seed
+            if options is not None:
+                kwargs["options"] = options
+
+            info = self._reset_env(i, **kwargs)
+            infos = self._add_info(infos, info, i)
+
+        self._gen_obs(self.native)
+
+        return self._observations(), infos
+
+    def step_async(self, actions):
+        self._actions = np.asarray(actions)
+
+    def step_wait(self):
+        actions = self._actions
+        rewards = np.zeros(self.num_envs, dtype=np.float64)
+        terminateds = np.zeros(self.num_envs, dtype=bool)
+        truncateds = np.zeros(self.num_envs, dtype=bool)
+        infos = {}
+
+        # Environments with their own step function
+        observations, step_infos = {}, {}
+        for i in self.fallback:
+            env = self.wrapped_envs[i]
+            (
+                observations[i],
+                rewards[i],
+                terminateds[i],
+                truncateds[i],
+                step_infos[i],
+            ) = env.step(actions[i])
+            self._sync_env(i)
+            self._load_observation(i, observations[i])
+
+        idx = self.native
+        if len(idx) > 0:
+            self._step_native(idx, actions[idx], rewards, terminateds, truncateds)
+
+        dones = terminateds | truncateds
+        for i in self.fallback:
+            if not dones[i]:
+                infos = self._add_info(infos, step_infos[i], i)
+
+        # Reset the environments whose episode ended, keeping their last
+        # observation and info in their reset info
+        for i in np.flatnonzero(dones):
+            final_observation = observations.get(i) or self._observation(i)
+            info = self._reset_env(i)
+            info["final_observation"] = final_observation
+            info["final_info"] = step_infos.get(i, {})
+            infos = self._add_info(infos, info, i)
+
+        self._gen_obs(np.flatnonzero(dones & self.is_native))
+
+        return self._observations(), rewards, terminateds, truncateds, infos
+
+    def _step_native(self, idx, actions, rewards, terminateds, truncateds):
+        """
+        Step the environments stepped natively, as `MiniGridEnv.step` does
+        """
+
+        if np.any((actions < 0) | (actions > Actions.done)):
+            raise ValueError(f"Unknown action: {actions}")
+
+        _, width, height, _ = self.grids.shape
+
+        self.step_count[idx] += 1
+
+        # Contents of the cells in front of the agents
+        agent_pos = self.agent_pos[idx]
+        fwd_pos = agent_pos + np.array(DIR_TO_VEC)[self.agent_dir[idx]]
+        fwd_x = np.clip(fwd_pos[:, 0], 0, width - 1)
+        fwd_y = np.clip(fwd_pos[:, 1], 0, height - 1)
+        fwd_type, _, fwd_state = self.grids[idx, fwd_x, fwd_y].T.astype(np.int64)
+
+        # Rotate left and right
+        self.agent_dir[idx] = (
+            self.agent_dir[idx] - (actions == Actions.left) + (actions == Actions.right)
+        ) % 4
+
+        # Move forward
+        forward = actions == Actions.forward
+        move = forward & CAN_OVERLAP[fwd_type, fwd_state]
+        self.agent_pos[idx[move]] = fwd_pos[move]
+
+        goal = forward & (fwd_type == OBJECT_TO_IDX["goal"])
+        lava = forward & (fwd_type == OBJECT_TO_IDX["lava"])
+        terminateds[idx] = goal | lava
+
+        for i, action, step_count in zip(
+            idx.tolist(), actions.tolist(), self.step_count[idx].tolist()
+        ):
+            env = self.envs[i]
+            env.step_count = step_count
+            if action == Actions.left:
+                env.agent_dir = (env.agent_dir - 1) % 4
+            elif action == Actions.right:
+                env.agent_dir = (env.agent_dir + 1) % 4
+
+        for i, agent_pos in zip(idx[move].tolist(), fwd_pos[move].tolist()):
+            self.envs[i].agent_pos = tuple(agent_pos)
+
+        for i in idx[goal]:
+            rewards[i] = self.envs[i]._reward()
+
+        # Pick up, drop and toggle objects, where it has an effect
+        carrying = self.carrying[idx, 0] != OBJECT_TO_IDX["empty"]
+        objects = (
+            ((actions == Actions.pickup) & CAN_PICKUP[fwd_type, fwd_state] & ~carrying)
+            | (
+                (actions == Actions.drop)
+                & (fwd_type == OBJECT_TO_IDX["empty"])
+                & carrying
+            )
+            | ((actions == Actions.toggle) & CAN_TOGGLE[fwd_type, fwd_state])
+        )
+        for i, action in zip(idx[objects], actions[objects]):
+            _object_action(self.envs[i], action)
+            self._sync_carrying(i)
+
+        for i, rule in self.step_rules:
+            rewards[i], terminateds[i] = rule(
+                self.envs[i], self._actions[i], rewards[i], terminateds[i]
+            )
+
+        truncateds[idx] = self.step_count[idx] >= self.max_steps[idx]
+
+        self._gen_obs(idx)
+
+    def get_frames(self, *args, **kwargs):
+        """
+        Render the frames of all the environments, see `get_frames`
+        """
+
+        return get_frames(self.envs, *args, **kwargs)
+
+    def close_extras(self, **kwargs):
+        for env in self.wrapped_envs:
+            env.close()
+
+
+def _shared_array(ctx, shape, dtype):
+    """
+    Allocate a shared memory buffer for an array, which can be passed to
+    worker processes
+    """
+
+    size = int(np.prod(shape)) * np.dtype(dtype).itemsize
+    return ctx.RawArray("b", size), shape, dtype
+
+
+def _array(shared):
+    """
+    Get the array view of a shared memory buffer
+    """
+
+    buffer, shape, dtype = shared
+    return np.frombuffer(buffer, dtype=dtype).reshape(shape)
+
+
+def _write_obs(arrays, i, obs):
+    arrays["image"][i] = obs["image"]
+    arrays["direction"][i] = obs["direction"]
+
+    mission = obs["mission"].encode("utf8")
+    tokens = arrays["mission"][i]
+    if len(mission) > len(tokens):
+        raise ValueError(
+            f"mission longer than {len(tokens)} bytes: {obs['mission']}, "
+            "increase max_mission_length"
+        )
+    tokens[:] = 0
+    tokens[: len(mission)] = np.frombuffer(mission, dtype=np.uint8)
+
+
+def _read_mission(tokens):
+    return tokens.tobytes().rstrip(b"\0").decode("utf8")
+
+
+def _worker(env_fns, indices, shared, pipe, parent_pipe):
+    """
+    Run some of the environments of a `SharedMemoryVecEnv`, writing their
+    observations, rewards and end of episode flags to shared memory
+    """
+
+    parent_pipe.close()
+    arrays = {key: _array(value) for key, value in shared.items()}
+    final = {key: arrays[f"final_{key}"] for key in ("image", "direction", "mission")}
+    envs = [env_fn() for env_fn in env_fns]
+
+    try:
+        while True:
+            command, data = pipe.recv()
+
+            if command == "reset":
+                infos = {}
+                for i, env in zip(indices, envs):
+                    obs, infos[i] = env.reset(**data[i])
+                    _write_obs(arrays, i, obs)
+                pipe.send(("ok", infos))
+
+            elif command == "step":
+                infos, resets = {}, []
+                for i, env in zip(indices, envs):
+                    obs, reward, terminated, truncated, info = env.step(
+                        arrays["actions"][i]
+                    )
+                    arrays["reward"][i] = reward
+                    arrays["terminated"][i] = terminated
+                    arrays["truncated"][i] = truncated
+
+                    if terminated or truncated:
+                        _write_obs(final, i, obs)
+                        obs, reset_info = env.reset()
+                        reset_info["final_info"] = info
+                        info = reset_info
+                        resets.append(i)
+
+                    _write_obs(arrays, i, obs)
+                    if info:
+                        infos[i] = info
+                pipe.send(("ok", (infos, resets)))
+
+            elif command == "call":
+                name, args, kwargs = data
+                results = {}
+                for i, env in zip(indices, envs):
+                    attr = getattr(env, name)
+                    results[i] = attr(*args, **kwargs) if callable(attr) else attr
+                pipe.send(("ok", results))
+
+            elif command == "close":
+                pipe.send(("ok", None))
+                break
+
+            else:
+                raise RuntimeError(f"Unknown command: {command}")
+
+    except (KeyboardInterrupt, Exception) as e:
+        pipe.send(("error", (repr(e), traceback.format_exc())))
+
+    finally:
+        for env in envs:
+            env.close()
+
+
+class SharedMemoryVecEnv(VectorEnv):
+    """
+    Vectorized environment running MiniGrid environments in a pool of worker
+    processes, each worker running a contiguous block of environments.
+
+    The workers write the observations, rewards and end of episode flags to
+    arrays in shared memory, and read the actions from shared memory, so
+    that only commands and non-empty infos go through the pipes. Missions
+    are stored as UTF-8 bytes padded with zeros, in the `mission_tokens`
+    array, and are only decoded when an environment is reset. As with
+    `SyncVectorEnv`, the environments are reset when their episode ends,
+    the last observation being kept in the `final_observation` info.
+    """
+
+    def __init__(
+        self,
+        env_fns: List[Callable[[], gym.Env]],
+        num_workers: Optional[int] = None,
+        max_mission_length: int = 256,
+        context: Optional[str] = None,
+    ):
+        dummy_env = env_fns[0]()
+        observation_space = dummy_env.observation_space
+        action_space = dummy_env.action_space
+        dummy_env.close()
+        super().__init__(len(env_fns), observation_space, action_space)
+
+        num_envs = self.num_envs
+        image_shape = observation_space["image"].shape
+
+        ctx = mp.get_context(context)
+        self.shared = {
+            "actions": _shared_array(ctx, (num_envs,), np.int64),
+            "reward": _shared_array(ctx, (num_envs,), np.float64),
+            "terminated": _shared_array(ctx, (num_envs,), bool),
+            "truncated": _shared_array(ctx, (num_envs,), bool),
+        }
+        for prefix in ("", "final_"):
+            self.shared.update(
+                {
+                    f"{prefix}image": _shared_array(
+                        ctx, (num_envs, *image_shape), np.uint8
+                    ),
+                    f"{prefix}direction": _shared_array(ctx, (num_envs,), np.int64),
+                    f"{prefix}mission": _shared_array(
+                        ctx, (num_envs, max_mission_length), np.uint8
+                    ),
+                }
+            )
+        self.arrays = {key: _array(value) for key, value in self.shared.items()}
+        self.mission_tokens = self.arrays["mission"]
+        self.missions = [""] * num_envs
+
+        # Start the workers, each running a block of environments
+        num_workers = min(num_workers or mp.cpu_count(), num_envs)
+        self.indices = np.array_split(np.arange(num_envs), num_workers)
+        self.pipes, self.processes = [], []
+        for indices in self.indices:
+            parent_pipe, child_pipe = ctx.Pipe()
+            process = ctx.Process(
+                target=_worker,
+                name=f"SharedMemoryVecEnv-worker-{indices[0]}",
+                args=(
+                    [env_fns[i] for i in indices],
+                    indices.tolist(),
+                    self.shared,
+                    child_pipe,
+                    parent_pipe,
+                ),
+                daemon=True,
+            )
+            process.start()
+            child_pipe.close()
+            self.pipes.append(parent_pipe)
+            self.processes.append(process)
+
+    def _send(self, command, data=None):
+        for pipe in self.pipes:
+            pipe.send((command, data))
+
+    def _receive(self):
+        results = []
+        for indices, pipe in zip(self.indices, self.pipes):
+            status, result = pipe.recv()
+            if status == "error":
+                error, tb = result
+                raise RuntimeError(
+                    f"Worker running environments {indices.tolist()} raised {error}\n{tb}"
+                )
+            results.append(result)
+
+        return results
+
+    def _observations(self):
+        # Same keys and type as the observations of SyncVectorEnv
+        return OrderedDict(
+            [
+                ("direction", self.arrays["direction"].copy()),
+                ("image", self.arrays["image"].copy()),
+                ("mission", tuple(self.missions)),
+            ]
+        )
+
+    def _final_observation(self, i):
+        return {
+            "image": self.arrays["final_image"][i].copy(),
+            "direction": int(self.arrays["final_direction"][i]),
+            "mission": _read_mission(self.arrays["final_mission"][i]),
+        }
+
+    def reset_async(
+        self,
+        seed: Optional[Union[int, List[int]]] = None,
+        options: Optional[dict] = None,
+    ):
+        if seed is None:
+            seed = [None for _ in range(self.num_envs)]
+        if isinstance(seed, int):
+            seed = [seed + i for i in range(self.num_envs)]
+        assert len(seed) == self.num_envs
+
+        kwargs = []
+        for single_seed in seed:
+            kwargs.append({})
+            if single_seed is not None:
+                kwargs[-1]["seed"] = single_seed
+            if options is not None:
+                kwargs[-1]["options"] = options
+
+        self._send("reset", kwargs)
+
+    def reset_wait(
+        self,
+        seed: Optional[Union[int, List[int]]] = None,
+        options: Optional[dict] = None,
+    ):
+        infos = {}
+        for worker_infos in self._receive():
+            for i, info in worker_infos.items():
+                infos = self._add_info(infos, info, i)
+
+        self.missions = [_read_mission(tokens) for tokens in self.mission_tokens]
+
+        return self._observations(), infos
+
+    def step_async(self, actions):
+        self.arrays["actions"][:] = actions
+        self._send("step")
+
+    def step_wait(self):
+        infos = {}
+        for worker_infos, resets in self._receive():
+            for i, info in worker_infos.items():
+                if i in resets:
+                    info["final_observation"] = self._final_observation(i)
+                infos = self._add_info(infos, info, i)
+
+            # Missions only change when the environments are reset
+            for i in resets:
+                self.missions[i] = _read_mission(self.mission_tokens[i])
+
+        return (
+            self._observations(),
+            self.arrays["reward"].copy(),
+            self.arrays["terminated"].copy(),
+            self.arrays["truncated"].copy(),
+            infos,
+        )
+
+    def call(self, name, *args, **kwargs):
+        """
+        Call a method of all the environments, or get the value of one of
+        their attributes
+        """
+
+        self._send("call", (name, args, kwargs))
+
+        results = {}
+        for worker_results in self._receive():
+            results.update(worker_results)
+
+        return tuple(results[i] for i in range(self.num_envs))
+
+    def close_extras(self, timeout=None, terminate=False, **kwargs):
+        if not terminate:
+            try:
+                self._send("close")
+                self._receive()
+            except (BrokenPipeError, EOFError, RuntimeError):
+                terminate = True
+
+        for process in self.processes:
+            if terminate and process.is_alive():
+                process.terminate()
+            process.join(timeout)
+
+        for pipe in self.pipes:
+            pipe.close()
+
+
+def make_vec_env(env_id: str, num_envs: int, **kwargs) -> MiniGridVecEnv:
+    """
+    Create a `MiniGridVecEnv` of `num_envs` copies of a registered
+    environment, created with `gym.make(env_id, **kwargs)`
+    """
+
+    return MiniGridVecEnv([lambda: gym.make(env_id, **kwargs)] * num_envs)
@@ -453,10 +453,7 @@ class ViewSizeWrapper(Wrapper):
     def observation(self, obs):
         env = self.unwrapped
 
-        grid, vis_mask = env.gen_obs_grid(self.agent_view_size)
-
-        # Encode the partially observable view into a numpy array
-        image = grid.encode(vis_mask)
+        image, _ = env.gen_obs_encoding(self.agent_view_size)
 
         return {**obs, "image": image}
 
@@ -516,10 +513,10 @@ class SymbolicObsWrapper(ObservationWrapper):
         )
 
     def observation(self, obs):
-        objects = np.array(
-            [OBJECT_TO_IDX[o.type] if o is not None else -1 for o in self.grid.grid]
-        )
+        types = self.grid.encoding[:, :, 0].astype(int)
+        types[types == OBJECT_TO_IDX["empty"]] = -1
         w, h = self.width, self.height
+        objects = types.T.reshape(w * h)
         grid = np.mgrid[:w, :h]
         grid = np.concatenate([grid, objects.reshape(1, w, h)])
         grid = np.transpose(grid, (1, 2, 0))
@@ -1,3 +1,6 @@
+import copy
+import math
+import os
 import pickle
 import warnings
 
@@ -7,8 +10,32 @@ import pytest
 from gymnasium.envs.registration import EnvSpec
 from gymnasium.utils.env_checker import check_env, data_equivalence
 
+from minigrid.core.constants import COLOR_TO_IDX, DIR_TO_VEC, OBJECT_TO_IDX
 from minigrid.core.grid import Grid
 from minigrid.core.mission import MissionSpace
+from minigrid.core.reachability import UNREACHABLE, passable_mask
+from minigrid.core.roomgrid import RoomGrid, reject_next_to, reject_next_to_mask
+from minigrid.core.tile_cache import FrameCache, TileCache, all_tile_codes
+from minigrid.core.transition import encode_state, stack_states, transition
+from minigrid.core.world_object import Ball, Box, Door, Key, Wall
+from minigrid.envs.babyai.core.oracle import (
+    Oracle,
+    generate_demos,
+    load_demos,
+    run_episode,
+)
+from minigrid.envs.babyai.core.verifier import ObjDesc, compile_instr
+from minigrid.level_bank import LevelBank, build_level_bank
+from minigrid.minigrid_env import MiniGridEnv, get_frames
+from minigrid.tabular import TabularMDP
+from minigrid.utils.rendering import (
+    fill_coords,
+    point_in_circle,
+    point_in_line,
+    point_in_rect,
+    point_in_triangle,
+    rotate_fn,
+)
 from tests.utils import all_testing_env_specs, assert_equals
 
 CHECK_ENV_IGNORE_WARNINGS = [
@@ -300,3 +327,993 @@ def test_mission_space():
 
     assert mission_space.contains("get the green key and the green key.")
     assert mission_space.contains("go fetch the red ball and the green key.")
+
+
+def test_grid_array_storage():
+    grid = Grid(5, 5)
+    grid.wall_rect(0, 0, 5, 5)
+    door = Door("red", is_locked=True)
+    grid.set(2, 2, door)
+
+    # Cells filled without an object instance are decoded on demand
+    wall = grid.get(0, 0)
+    assert isinstance(wall, Wall)
+    assert grid.get(0, 0) is wall
+    assert grid.get(1, 1) is None
+    assert grid.get(2, 2) is door
+
+    # Object state changes are propagated to the live encoding
+    encoding = grid.encoding
+    assert not encoding.flags.writeable
+    assert tuple(encoding[2, 2]) == door.encode()
+    door.is_locked = False
+    door.is_open = True
+    assert tuple(encoding[2, 2]) == door.encode()
+
+    # Copies track the state of their own objects
+    grid_copy = grid.copy()
+    grid_copy.get(2, 2).is_open = False
+    assert grid_copy != grid
+    assert tuple(grid.encoding[2, 2]) == door.encode()
+
+    grid.set(2, 2, None)
+    assert grid.get(2, 2) is None
+    assert door not in grid
+    assert ("grey", "wall") in grid
+    assert ("red", "door") not in grid
+
+    decoded, vis_mask = Grid.decode(grid.encode())
+    assert decoded == grid
+    assert vis_mask.all()
+
+
+def reference_vis_mask(opaque, agent_pos):
+    """Cell by cell visibility propagation, as originally done by process_vis"""
+    width, height = opaque.shape
+    mask = np.zeros(shape=(width, height), dtype=bool)
+    mask[agent_pos[0], agent_pos[1]] = True
+
+    for j in reversed(range(0, height)):
+        for i in range(0, width - 1):
+            if mask[i, j] and not opaque[i, j]:
+                mask[i + 1, j] = True
+                if j > 0:
+                    mask[i + 1, j - 1] = True
+                    mask[i, j - 1] = True
+
+        for i in reversed(range(1, width)):
+            if mask[i, j] and not opaque[i, j]:
+                mask[i - 1, j] = True
+                if j > 0:
+                    mask[i - 1, j - 1] = True
+                    mask[i, j - 1] = True
+
+    return mask
+
+
+@pytest.mark.parametrize("width", [3, 7, 11])
+def test_process_vis(width):
+    rng = np.random.default_rng(width)
+
+    for _ in range(100):
+        grid = Grid(width, width)
+        for i in range(width):
+            for j in range(width):
+                p = rng.random()
+                if p < 0.2:
+                    grid.set(i, j, Wall())
+                elif p < 0.3:
+                    grid.set(i, j, Door("red", is_open=rng.random() < 0.5))
+        agent_pos = (width // 2, width - 1)
+
+        opaque = np.array(
+            [
+                [
+                    grid.get(i, j) and not grid.get(i, j).see_behind()
+                    for j in range(width)
+                ]
+                for i in range(width)
+            ],
+            dtype=bool,
+        )
+        vis_mask = grid.process_vis(agent_pos)
+
+        np.testing.assert_array_equal(vis_mask, reference_vis_mask(opaque, agent_pos))
+        assert (grid.encode()[~vis_mask, 0] == OBJECT_TO_IDX["empty"]).all()
+
+
+@pytest.mark.parametrize(
+    "env_id",
+    ["MiniGrid-DoorKey-6x6-v0", "MiniGrid-LavaCrossingS9N1-v0", "BabyAI-GoToLocal-v0"],
+)
+def test_gen_obs_matches_gen_obs_grid(env_id):
+    env = gym.make(env_id).unwrapped
+    env.reset(seed=0)
+    env.action_space.seed(0)
+
+    for _ in range(100):
+        obs, _, terminated, truncated, _ = env.step(env.action_space.sample())
+
+        # The view gathered by index matches the rotated slice of the grid
+        topX, topY, _, _ = env.get_view_exts()
+        grid = env.grid.slice(topX, topY, env.agent_view_size, env.agent_view_size)
+        for _ in range(env.agent_dir + 1):
+            grid = grid.rotate_left()
+        assert grid == env.grid.gather(*env.get_view_cells())
+
+        obs_grid, vis_mask = env.gen_obs_grid()
+        np.testing.assert_array_equal(obs["image"], obs_grid.encode(vis_mask))
+
+        if terminated or truncated:
+            env.reset()
+
+    env.close()
+
+
+def test_fill_coords_vectorized():
+    shapes = [
+        point_in_rect(0.12, 0.88, 0.47, 0.53),
+        point_in_circle(0.56, 0.28, 0.19),
+        point_in_line(0.1, 0.3, 0.3, 0.4, r=0.03),
+        rotate_fn(
+            point_in_triangle((0.12, 0.19), (0.87, 0.50), (0.12, 0.81)),
+            cx=0.5,
+            cy=0.5,
+            theta=0.5 * math.pi,
+        ),
+    ]
+
+    for fn in shapes:
+        img = fill_coords(np.zeros((48, 48, 3), dtype=np.uint8), fn, (255, 0, 0))
+
+        # Evaluating the shape pixel by pixel gives the same image
+        expected = np.zeros((48, 48, 3), dtype=np.uint8)
+        for y in range(48):
+            for x in range(48):
+                if fn((x + 0.5) / 48, (y + 0.5) / 48):
+                    expected[y, x] = (255, 0, 0)
+
+        np.testing.assert_array_equal(img, expected)
+
+
+@pytest.mark.parametrize(
+    "env_id", ["MiniGrid-DoorKey-8x8-v0", "MiniGrid-KeyCorridorS3R3-v0"]
+)
+def test_render_matches_tiles(env_id):
+    env = gym.make(env_id, disable_env_checker=True).unwrapped
+    env.reset(seed=0)
+
+    tile_size = 13
+    highlight_mask = np.random.RandomState(0).rand(env.width, env.height) < 0.5
+    img = env.grid.render(tile_size, env.agent_pos, env.agent_dir, highlight_mask)
+
+    # Pasting the tiles of the cells one by one gives the same image
+    expected = np.zeros_like(img)
+    for j in range(env.height):
+        for i in range(env.width):
+            agent_here = (i, j) == tuple(env.agent_pos)
+            tile = Grid.render_tile(
+                env.grid.get(i, j),
+                agent_dir=env.agent_dir if agent_here else None,
+                highlight=highlight_mask[i, j],
+                tile_size=tile_size,
+            )
+            rows = slice(j * tile_size, (j + 1) * tile_size)
+            cols = slice(i * tile_size, (i + 1) * tile_size)
+            expected[rows, cols] = tile
+
+    np.testing.assert_array_equal(img, expected)
+
+
+def test_tile_atlas_file(tmp_path):
+    env = gym.make("MiniGrid-DoorKey-8x8-v0", disable_env_checker=True).unwrapped
+    env.reset(seed=0)
+    expected = env.grid.render(8, env.agent_pos, env.agent_dir)
+
+    tile_cache = Grid.tile_cache
+    try:
+        # The first cache writes the atlas file, the second one maps it
+        for _ in range(2):
+            Grid.tile_cache = TileCache(tmp_path)
+            img = env.grid.render(8, env.agent_pos, env.agent_dir)
+            np.testing.assert_array_equal(img, expected)
+
+        atlas = Grid.tile_cache.get_atlas(8)
+        assert isinstance(atlas.tiles, np.memmap)
+        assert atlas.num_tiles == len(all_tile_codes())
+        assert os.path.exists(Grid.tile_cache.atlas_file(8))
+    finally:
+        Grid.tile_cache = tile_cache
+
+
+def test_tile_cache_budget():
+    env = gym.make("MiniGrid-DoorKey-8x8-v0", disable_env_checker=True).unwrapped
+    env.reset(seed=0)
+
+    tile_cache = Grid.tile_cache
+    try:
+        Grid.tile_cache = TileCache(max_bytes=0)
+
+        # Tiles rendered ahead of time are not rendered again
+        Grid.tile_cache.prewarm([8])
+        env.grid.render(8, env.agent_pos, env.agent_dir)
+        stats = Grid.tile_cache.stats()
+        assert stats["misses"] == len(all_tile_codes())
+        assert stats["hits"] == env.width * env.height
+
+        # Only the most recently used atlas is kept within the budget
+        for tile_size in range(9, 12):
+            env.grid.render(tile_size, env.agent_pos, env.agent_dir)
+            Grid.tile_cache.get_atlas(tile_size)
+        stats = Grid.tile_cache.stats()
+        assert stats["num_atlases"] == 1
+        assert stats["evictions"] > len(all_tile_codes())
+
+        Grid.tile_cache.clear()
+        assert Grid.tile_cache.stats()["num_bytes"] == 0
+    finally:
+        Grid.tile_cache = tile_cache
+
+
+@pytest.mark.parametrize(
+    "env_id", ["MiniGrid-DoorKey-8x8-v0", "MiniGrid-Dynamic-Obstacles-8x8-v0"]
+)
+def test_incremental_render(env_id):
+    env = gym.make(env_id, disable_env_checker=True).unwrapped
+    env.reset(seed=0)
+    rng = np.random.RandomState(0)
+
+    for _ in range(100):
+        _, _, terminated, truncated, _ = env.step(rng.randint(env.action_space.n))
+        if terminated or truncated:
+            env.reset()
+
+        # Frames updated from the previous ones match frames drawn from scratch
+        for agent_pov in [False, True]:
+            img = env.get_frame(tile_size=8, agent_pov=agent_pov)
+            frames = env.full_frame, env.pov_frame
+            env.full_frame, env.pov_frame = FrameCache(), FrameCache()
+            expected = env.get_frame(tile_size=8, agent_pov=agent_pov)
+            env.full_frame, env.pov_frame = frames
+            np.testing.assert_array_equal(img, expected)
+
+
+@pytest.mark.parametrize("agent_pov", [False, True])
+def test_get_frames(agent_pov):
+    envs = [gym.make("MiniGrid-KeyCorridorS3R3-v0") for _ in range(3)]
+    for seed, env in enumerate(envs):
+        env.reset(seed=seed)
+
+    expected = np.stack(
+        [env.unwrapped.get_frame(tile_size=8, agent_pov=agent_pov) for env in envs]
+    )
+
+    out = np.zeros_like(expected)
+    frames = get_frames(envs, tile_size=8, agent_pov=agent_pov, out=out)
+    assert frames is out
+    np.testing.assert_array_equal(out, expected)
+
+
+@pytest.mark.parametrize("use_process", [False, True])
+def test_pregenerate_levels(use_process):
+    env = gym.make("BabyAI-PutNextLocal-v0").unwrapped
+    queued_env = gym.make("BabyAI-PutNextLocal-v0").unwrapped
+    queued_env.pregenerate_levels(max_depth=2, use_process=use_process)
+
+    for seed in [3, None, None, 7, None]:
+        obs, _ = env.reset(seed=seed)
+        queued_obs, _ = queued_env.reset(seed=seed)
+        assert_equals(obs, queued_obs)
+        assert env.hash() == queued_env.hash()
+        assert env.max_steps == queued_env.max_steps
+
+        for action in [2, 0, 2, 3, 1, 4]:
+            assert_equals(env.step(action), queued_env.step(action))
+
+    stats = queued_env.level_queue.stats()
+    assert stats["served"] == 5
+    assert stats["max_depth"] == 2
+    assert 0 <= stats["depth"] <= 2
+
+    queued_env.close()
+    assert queued_env.level_queue is None
+
+    # Known seeds are generated ahead of time, other resets inline
+    seeds = [11, 4, 9]
+    queued_env.pregenerate_levels(max_depth=2, use_process=use_process, seeds=seeds)
+    for seed in seeds + [None, 9, 5]:
+        obs, _ = env.reset(seed=seed)
+        queued_obs, _ = queued_env.reset(seed=seed)
+        assert_equals(obs, queued_obs)
+        assert env.hash() == queued_env.hash()
+
+    stats = queued_env.level_queue.stats()
+    assert stats["served"] == 3
+    assert stats["misses"] == 3
+
+    queued_env.close()
+    env.close()
+
+
+@pytest.mark.parametrize(
+    "env_id",
+    [
+        "MiniGrid-MemoryS7-v0",
+        "MiniGrid-ObstructedMaze-Full-v0",
+        "BabyAI-PutNextLocal-v0",
+    ],
+)
+def test_level_bank(env_id, tmp_path):
+    bank = build_level_bank(env_id, range(5, 10), tmp_path)
+    assert len(bank) == 5 and 7 in bank and 0 not in bank
+
+    env = gym.make(env_id).unwrapped
+    bank_env = gym.make(env_id).unwrapped
+    bank_env.level_bank = LevelBank(tmp_path)
+
+    for seed in range(5, 10):
+        obs, _ = env.reset(seed=seed)
+        bank_obs, _ = bank_env.reset(seed=seed)
+        assert_equals(obs, bank_obs)
+        assert env.hash() == bank_env.hash()
+
+        for action in [2, 0, 2, 3, 1, 5, 2, 4]:
+            assert_equals(env.step(action), bank_env.step(action))
+
+    # Seeds missing from the bank are generated
+    assert_equals(env.reset(seed=0), bank_env.reset(seed=0))
+
+    other_env = gym.make("MiniGrid-Empty-8x8-v0").unwrapped
+    other_env.level_bank = bank_env.level_bank
+    with pytest.raises(ValueError):
+        other_env.reset(seed=5)
+
+    env.close()
+    bank_env.close()
+    other_env.close()
+
+
+def test_level_bank_kwargs(tmp_path):
+    build_level_bank("MiniGrid-DoorKey-5x5-v0", range(3), tmp_path)
+    bank = LevelBank(tmp_path)
+
+    # Restored levels keep the configuration of the environment
+    kwargs = dict(max_steps=7, render_mode="rgb_array", agent_view_size=3)
+    env = gym.make("MiniGrid-DoorKey-5x5-v0", **kwargs).unwrapped
+    bank_env = gym.make("MiniGrid-DoorKey-5x5-v0", **kwargs).unwrapped
+    bank_env.level_bank = bank
+
+    for seed in range(3):
+        assert_equals(env.reset(seed=seed), bank_env.reset(seed=seed))
+        assert env.hash() == bank_env.hash()
+        assert bank_env.max_steps == 7
+        assert bank_env.agent_view_size == 3
+        assert bank_env.render_mode == "rgb_array"
+        assert_equals(env.render(), bank_env.render())
+
+        for action in [2, 0, 2, 3, 1, 5, 2, 4, 2]:
+            assert_equals(env.step(action), bank_env.step(action))
+
+    # Arguments that may change the levels must match
+    other_env = gym.make("MiniGrid-DoorKey-5x5-v0", size=6).unwrapped
+    other_env.width = other_env.height = 5
+    other_env.level_bank = bank
+    with pytest.raises(ValueError):
+        other_env.reset(seed=0)
+
+    env.close()
+    bank_env.close()
+    other_env.close()
+
+
+@pytest.mark.parametrize("num_rows, num_cols", [(3, 3), (1, 6), (16, 16)])
+def test_connect_all(num_rows, num_cols):
+    env = RoomGrid(
+        room_size=4,
+        num_rows=num_rows,
+        num_cols=num_cols,
+        mission_space=MissionSpace(mission_func=lambda: ""),
+    )
+
+    for seed in range(5):
+        env.reset(seed=seed)
+        locked_door, _ = env.add_door(0, 0, locked=True)
+        doors = env.connect_all()
+        assert all(not door.is_locked for door in doors)
+
+        # Every room is reachable from the agent through doors
+        reach = set()
+        stack = [env.room_from_pos(*env.agent_pos)]
+        while stack:
+            room = stack.pop()
+            if room not in reach:
+                reach.add(room)
+                stack += [room.neighbors[k] for k in range(4) if room.doors[k]]
+        assert len(reach) == num_rows * num_cols
+
+        # No door is added next to the locked room
+        assert sum(map(bool, env.room_grid[0][0].doors)) == 1
+
+    env.close()
+
+
+@pytest.mark.parametrize(
+    "env_id",
+    ["MiniGrid-MultiRoom-N6-v0", "MiniGrid-LavaCrossingS9N2-v0", "BabyAI-BossLevel-v0"],
+)
+def test_distance_field(env_id):
+    env = gym.make(env_id).unwrapped
+    env.reset(seed=1)
+    grid = env.grid
+
+    for doors, lava in [("open", False), ("closed", True), ("locked", False)]:
+        passable = passable_mask(grid.encoding, doors, lava)
+
+        # Reference breadth-first search, not moving through impassable cells
+        expected = np.full((grid.width, grid.height), UNREACHABLE)
+        expected[tuple(env.agent_pos)] = 0
+        queue = [tuple(env.agent_pos)]
+        for i, j in queue:
+            if (i, j) != tuple(env.agent_pos) and not passable[i, j]:
+                continue
+            for x, y in [(i + 1, j), (i - 1, j), (i, j + 1), (i, j - 1)]:
+                if 0 <= x < grid.width and 0 <= y < grid.height:
+                    if expected[x, y] == UNREACHABLE:
+                        expected[x, y] = expected[i, j] + 1
+                        queue.append((x, y))
+
+        dist = grid.distance_field(env.agent_pos, doors, lava)
+        assert np.array_equal(dist, expected)
+
+        # Cells have the same label if they are passable and connected
+        labels = grid.component_labels(doors, lava)
+        assert np.array_equal(labels >= 0, passable)
+        reached = passable & (expected != UNREACHABLE)
+        if passable[tuple(env.agent_pos)]:
+            assert np.all(labels[reached] == labels[tuple(env.agent_pos)])
+            assert not np.any(labels[passable & ~reached] == labels[reached][0])
+
+    # Results are cached until the grid changes
+    dist = grid.distance_field(env.agent_pos)
+    assert grid.distance_field(env.agent_pos) is dist
+    x, y = np.argwhere(passable_mask(grid.encoding) & (dist == 1))[0]
+    grid.set(x, y, Wall())
+    assert grid.distance_field(env.agent_pos)[x, y] == 1
+    assert grid.distance_field(env.agent_pos) is not dist
+
+    env.close()
+
+
+def test_obj_desc_matching():
+    env = gym.make("BabyAI-PutNextS7N4-v0").unwrapped
+    env.reset(seed=2)
+    rng = np.random.default_rng(0)
+
+    def reference(desc):
+        cells = []
+        room = env.room_from_pos(*env.agent_pos)
+        for i in range(env.grid.width):
+            for j in range(env.grid.height):
+                cell = env.grid.get(i, j)
+                if cell is None or desc.type not in (None, cell.type):
+                    continue
+                if desc.color not in (None, cell.color):
+                    continue
+                if desc.loc is not None:
+                    dx, dy = DIR_TO_VEC[env.agent_dir]
+                    vx, vy = i - env.agent_pos[0], j - env.agent_pos[1]
+                    side, ahead = dx * vy - dy * vx, dx * vx + dy * vy
+                    matches = {
+                        "left": side < 0,
+                        "right": side > 0,
+                        "front": ahead > 0,
+                        "behind": ahead < 0,
+                    }
+                    if not room.pos_inside(i, j) or not matches[desc.loc]:
+                        continue
+                cells.append((cell, (i, j)))
+        return cells
+
+    for _ in range(30):
+        env.step(rng.integers(6))
+        for desc in [
+            ObjDesc(None),
+            ObjDesc("ball"),
+            ObjDesc("key", "red"),
+            ObjDesc(None, "grey"),
+            ObjDesc("box", loc="left"),
+            ObjDesc(None, loc="front"),
+        ]:
+            objs, poss = desc.find_matching_objs(env)
+            expected = reference(desc)
+            assert [id(obj) for obj in objs] == [id(obj) for obj, _ in expected]
+            assert poss == [pos for _, pos in expected]
+
+            # Without the location, only the positions of the objects
+            # initially matched are updated
+            desc.obj_set = objs[::2]
+            tracked, poss = desc.find_matching_objs(env, use_location=False)
+            assert tracked == objs[::2]
+            assert poss == [pos for obj, pos in expected if obj in tracked]
+
+    env.close()
+
+
+@pytest.mark.parametrize(
+    "env_id",
+    [
+        "BabyAI-BossLevel-v0",
+        "BabyAI-PutNextLocalS5N3-v0",
+        "BabyAI-OpenRedBlueDoorsDebug-v0",
+        "BabyAI-OpenDoorsOrderN4Debug-v0",
+        "BabyAI-PickupDistDebug-v0",
+        "BabyAI-SynthSeq-v0",
+    ],
+)
+def test_compiled_verifier(env_id):
+    """
+    Test that compiled instructions are verified like the instruction tree
+    """
+
+    env = gym.make(env_id).unwrapped
+    tree_env = gym.make(env_id).unwrapped
+    rng = np.random.default_rng(0)
+
+    for seed in range(10):
+        env.reset(seed=seed)
+        tree_env.reset(seed=seed)
+        assert env.verifier is not None
+        tree_env.verifier = None
+
+        for i in range(200):
+            action = rng.choice(6, p=[0.2, 0.2, 0.2, 0.2, 0.1, 0.1])
+            step = env.step(action)
+            assert_equals(step, tree_env.step(action))
+            if step[2] or step[3]:
+                break
+
+            # Copies of the environments keep verifying their own objects
+            if i == 20:
+                env = copy.deepcopy(env)
+                tree_env = copy.deepcopy(tree_env)
+
+        env.step(env.actions.done)
+        targets = [clause[3] for clause in env.verifier.clauses]
+        compiled = compile_instr(env.instrs, env)
+        assert targets == [clause[3] for clause in compiled.clauses]
+
+    env.close()
+    tree_env.close()
+
+
+@pytest.mark.parametrize(
+    "env_id",
+    [
+        "MiniGrid-DoorKey-8x8-v0",
+        "MiniGrid-Dynamic-Obstacles-8x8-v0",
+        "MiniGrid-ObstructedMaze-Full-v0",
+        "BabyAI-BossLevel-v0",
+    ],
+)
+def test_state_hash(env_id):
+    """
+    Test that the incrementally updated hash matches a full recomputation,
+    and that states get the same hash exactly when they are equal
+    """
+
+    env = gym.make(env_id).unwrapped
+    rng = np.random.default_rng(0)
+
+    for seed in range(3):
+        env.reset(seed=seed)
+        env.state_hash()
+
+        for _ in range(300):
+            action = rng.choice(6, p=[0.2, 0.2, 0.3, 0.1, 0.1, 0.1])
+            _, _, terminated, truncated, _ = env.step(action)
+            env.state_hash(check=True)
+            if terminated or truncated:
+                break
+
+        grid, _ = Grid.decode(env.grid.encoding)
+        assert grid.zobrist_hash() == env.grid.zobrist_hash()
+
+    # Copies of the environment hash the same, until they are stepped
+    env.reset(seed=0)
+    env_copy = copy.deepcopy(env)
+    assert env.state_hash() == env_copy.state_hash()
+    env_copy.step(env.actions.left)
+    assert env.state_hash() != env_copy.state_hash()
+
+    env.close()
+
+
+@pytest.mark.parametrize(
+    "env_id",
+    [
+        "MiniGrid-DoorKey-8x8-v0",
+        "MiniGrid-Dynamic-Obstacles-8x8-v0",
+        "MiniGrid-KeyCorridorS3R3-v0",
+        "BabyAI-BossLevel-v0",
+        "BabyAI-PutNextLocalS5N3-v0",
+    ],
+)
+def test_get_set_state(env_id):
+    """
+    Test that restoring a snapshot replays the episode like a copy of the
+    environment taken at the same time
+    """
+
+    env = gym.make(env_id).unwrapped
+    rng = np.random.default_rng(0)
+
+    def rollout(env, actions):
+        steps = []
+        for action in actions:
+            steps.append(env.step(action)[:4])
+            steps.append((env.hash(), env.state_hash(check=True)))
+            if steps[-2][2]:
+                break
+        return tuple(steps)
+
+    state = None
+    for seed in range(5):
+        env.reset(seed=seed)
+        rollout(env, rng.integers(6, size=rng.integers(30)))
+
+        # Snapshots reuse the buffers of the previous one in the episode
+        state = env.get_state(state)
+        env_copy = copy.deepcopy(env)
+
+        actions = rng.integers(6, size=100)
+        steps = rollout(env_copy, actions)
+
+        for _ in range(2):
+            rollout(env, rng.integers(6, size=50))
+            env.set_state(state)
+            assert_equals(rollout(env, actions), steps)
+
+    # Snapshots can't be restored in another episode
+    env.reset(seed=0)
+    with pytest.raises(ValueError):
+        env.set_state(state)
+
+    env.close()
+
+
+@pytest.mark.parametrize(
+    "env_id",
+    [
+        "MiniGrid-DoorKey-8x8-v0",
+        "MiniGrid-LavaCrossingS9N1-v0",
+        "MiniGrid-KeyCorridorS3R3-v0",
+        "MiniGrid-ObstructedMaze-2Dlhb-v0",
+        "BabyAI-BossLevel-v0",
+    ],
+)
+def test_transition(env_id):
+    """
+    Test that the transition function on encoded states matches stepping
+    the environment, one state at a time and in batches
+    """
+
+    env = gym.make(env_id).unwrapped
+    plain_step = type(env).step is MiniGridEnv.step
+    rng = np.random.default_rng(0)
+
+    states, actions, outcomes = [], [], []
+    for seed in range(3):
+        env.reset(seed=seed)
+
+        for _ in range(200):
+            state = encode_state(env)
+            state_copy = copy.deepcopy(state)
+            action = rng.choice(6, p=[0.15, 0.15, 0.3, 0.15, 0.1, 0.15])
+            new_state, reward, terminated, truncated = transition(
+                state, action, env.max_steps
+            )
+            assert_equals(state, state_copy)
+
+            _, env_reward, env_terminated, env_truncated, _ = env.step(action)
+            assert_equals(new_state, encode_state(env))
+            assert truncated == env_truncated
+            if plain_step:
+                assert reward == pytest.approx(env_reward)
+                assert terminated == env_terminated
+
+            states.append(state)
+            actions.append(action)
+            outcomes.append((new_state, reward, terminated, truncated))
+            if env_terminated or env_truncated:
+                break
+
+    new_states, rewards, terminateds, truncateds = zip(*outcomes)
+    assert_equals(
+        transition(stack_states(states), np.array(actions), env.max_steps),
+        (
+            stack_states(new_states),
+            np.array(rewards),
+            np.array(terminateds),
+            np.array(truncateds),
+        ),
+    )
+
+    # States are broadcast with the actions
+    actions = np.arange(len(env.actions))
+    assert_equals(
+        transition(states[0], actions, env.max_steps),
+        transition(stack_states([states[0]] * len(actions)), actions, env.max_steps),
+    )
+
+    env.close()
+
+
+@pytest.mark.parametrize(
+    "env_id",
+    [
+        "MiniGrid-Empty-6x6-v0",
+        "MiniGrid-DoorKey-5x5-v0",
+        "MiniGrid-LavaGapS6-v0",
+        "MiniGrid-FourRooms-v0",
+    ],
+)
+def test_tabular_mdp(env_id):
+    """
+    Test that the tabular MDP of a level follows the environment, and that
+    its optimal policy reaches the goal
+    """
+
+    env = gym.make(env_id).unwrapped
+    env.reset(seed=0)
+    mdp = TabularMDP(env)
+    assert mdp.index(env) == 0
+
+    # Transitions match random rollouts
+    rng = np.random.default_rng(0)
+    for _ in range(200):
+        state = mdp.index(env)
+        action = rng.integers(mdp.num_actions)
+        _, reward, terminated, _, _ = env.step(action)
+        assert terminated == (mdp.next_state[state, action] == -1)
+        assert (reward > 0) == (mdp.rewards[state, action] > 0)
+        if terminated:
+            env.reset(seed=0)
+        else:
+            assert mdp.index(env) == mdp.next_state[state, action]
+
+    # The optimal policy reaches the goal in the number of steps given by
+    # the optimal value
+    values, q_values = mdp.value_iteration(gamma=0.9)
+    num_steps = round(math.log(values[0], 0.9)) + 1
+    env.reset(seed=0)
+    for _ in range(num_steps):
+        _, reward, terminated, _, _ = env.step(q_values[mdp.index(env)].argmax())
+    assert terminated and reward > 0
+
+    # The transition matrix in CSR form holds the next states
+    data, indices, indptr = mdp.transition_csr()
+    next_state = np.full(mdp.num_states * mdp.num_actions, -1)
+    rows = np.flatnonzero(np.diff(indptr))
+    next_state[rows] = indices
+    assert_equals(next_state, mdp.next_state.ravel())
+    assert_equals(data, np.ones(len(indices)))
+
+    data, indices, indptr = mdp.reward_csr()
+    rewards = np.zeros((mdp.num_states, mdp.num_actions))
+    rows = np.repeat(np.arange(mdp.num_states), np.diff(indptr))
+    rewards[rows, indices] = data
+    assert_equals(rewards, mdp.rewards)
+
+    # Environments with their own rules can't be exported
+    with pytest.raises(ValueError):
+        TabularMDP(gym.make("MiniGrid-Unlock-v0"))
+
+
+@pytest.mark.parametrize(
+    "env_id",
+    [
+        "BabyAI-GoToLocal-v0",
+        "BabyAI-OpenDoorsOrderN4-v0",
+        "BabyAI-PutNextLocal-v0",
+        "BabyAI-KeyInBox-v0",
+        "BabyAI-UnlockToUnlock-v0",
+        "BabyAI-UnblockPickup-v0",
+        "BabyAI-KeyCorridorS3R3-v0",
+        "BabyAI-SynthSeq-v0",
+    ],
+)
+def test_oracle(env_id):
+    """
+    Test that the oracle completes the instructions of BabyAI levels
+    """
+
+    env = gym.make(env_id)
+    for seed in range(10):
+        _, _, reward = run_episode(env, seed)
+        assert reward > 0
+
+    # The oracle takes the fewest actions to face an object
+    env = gym.make("BabyAI-GoToObj-v0").unwrapped
+    for seed in range(10):
+        env.reset(seed=seed)
+        target = tuple(env.instrs.desc.obj_poss[0])
+
+        start = (*env.agent_pos, env.agent_dir)
+        dist = {start: 0}
+        queue = [start]
+        for state in queue:
+            x, y, d = state
+            dx, dy = DIR_TO_VEC[d]
+            if (x + dx, y + dy) == target:
+                break
+            for next_state in (
+                (x, y, (d + 1) % 4),
+                (x, y, (d - 1) % 4),
+                (x + dx, y + dy, d),
+            ):
+                if next_state not in dist and env.grid.get(*next_state[:2]) is None:
+                    dist[next_state] = dist[state] + 1
+                    queue.append(next_state)
+
+        _, actions, reward = run_episode(env, seed)
+        assert reward > 0
+        # Facing the object completes the instructions, with any action when
+        # the agent faces it from the start
+        assert len(actions) == max(dist[state], 1)
+
+    # Levels verified through the verify methods have no compiled tables
+    env.verifier = None
+    with pytest.raises(ValueError):
+        Oracle(env)
+
+
+def test_generate_demos(tmp_path):
+    """
+    Test that demonstrations generated in worker processes replay the
+    episodes of the oracle, in the order of the seeds
+    """
+
+    env_id = "BabyAI-GoToLocal-v0"
+    path = tmp_path / "demos.pkl"
+    num_demos, num_failures = generate_demos(env_id, range(8), path, num_workers=2)
+    assert (num_demos, num_failures) == (8, 0)
+
+    inline_path = tmp_path / "inline_demos.pkl"
+    generate_demos(env_id, range(8), inline_path, num_workers=0)
+
+    env = gym.make(env_id)
+    demos = list(load_demos(path))
+    assert [demo["seed"] for demo in demos] == list(range(8))
+    for demo, inline_demo in zip(demos, load_demos(inline_path)):
+        assert_equals(demo, inline_demo)
+
+        obs, _ = env.reset(seed=demo["seed"])
+        assert obs["mission"] == demo["mission"]
+        for image, direction, action in zip(
+            demo["images"], demo["directions"], demo["actions"]
+        ):
+            assert_equals(obs["image"], image)
+            assert obs["direction"] == direction
+            obs, reward, terminated, _, _ = env.step(action)
+        assert terminated and reward == demo["reward"]
+
+
+def test_place_obj():
+    env = gym.make("MiniGrid-Empty-16x16-v0").unwrapped
+    env.reset(seed=0)
+    env.agent_pos = (3, 3)
+
+    # Positions are sampled within top/size, avoiding objects and the agent
+    positions = {env.place_obj(Ball(), top=(2, 2), size=(3, 3)) for _ in range(8)}
+    assert positions == {(x, y) for x in range(2, 5) for y in range(2, 5)} - {(3, 3)}
+
+    # A full rectangle fails right away
+    with pytest.raises(RecursionError):
+        env.place_obj(Ball(), top=(2, 2), size=(3, 3))
+
+    # The vectorized mask places objects like the equivalent reject_fn
+    def place(**kwargs):
+        env.reset(seed=1)
+        return [env.place_obj(Key(), **kwargs) for _ in range(60)]
+
+    assert place(reject_fn=reject_next_to) == place(reject_mask=reject_next_to_mask)
+    with pytest.raises(RecursionError):
+        env.place_obj(
+            Key(), top=env.agent_pos, size=(1, 2), reject_mask=reject_next_to_mask
+        )
+
+
+def test_minigrid_env_exports():
+    from minigrid import minigrid_env
+    from minigrid.core import constants, world_object
+
+    assert minigrid_env.Goal is world_object.Goal
+    assert minigrid_env.WorldObj is world_object.WorldObj
+    assert minigrid_env.OBJECT_TO_IDX is constants.OBJECT_TO_IDX
+
+    env = gym.make("MiniGrid-Empty-8x8-v0").unwrapped
+    assert isinstance(env.actions.forward, minigrid_env.MiniGridEnv.Actions)
+
+
+def test_recolor_placed_object():
+    grid = Grid(5, 5)
+    ball = Ball("red")
+    grid.set(2, 2, ball)
+
+    ball.color = "grey"
+    assert tuple(grid.encoding[2, 2]) == ball.encode()
+    ball.type = "key"
+    assert tuple(grid.encoding[2, 2]) == ball.encode()
+
+    # Objects pickled with plain attributes still load
+    state = {"type": "box", "color": "blue", "contains": None}
+    box = Box.__new__(Box)
+    box.__setstate__(state)
+    assert box.encode() == Box("blue").encode() and box._grid is None
+
+    # Distractors recolored after being placed are grey in the observation
+    env = gym.make("BabyAI-GoToRedBallGrey-v0").unwrapped
+    obs, _ = env.reset(seed=1)
+    for x in range(env.width):
+        for y in range(env.height):
+            obj = env.grid.get(x, y)
+            if obj is not None:
+                assert tuple(env.grid.encoding[x, y]) == obj.encode()
+    types = obs["image"][:, :, 0]
+    objects = np.isin(types, [OBJECT_TO_IDX[t] for t in ("key", "ball", "box")])
+    red_ball = (types == OBJECT_TO_IDX["ball"]) & (obs["image"][:, :, 1] == 0)
+    assert np.all(obs["image"][objects & ~red_ball, 1] == COLOR_TO_IDX["grey"])
+
+
+def test_pickle_env_drops_frames():
+    env = gym.make("MiniGrid-DoorKey-8x8-v0", render_mode="rgb_array").unwrapped
+    env.reset(seed=0)
+    size = len(pickle.dumps(env))
+    env.render()
+    assert len(pickle.dumps(env)) == size
+
+    env_copy = copy.deepcopy(env)
+    assert env_copy.full_frame.img is None
+    np.testing.assert_array_equal(env_copy.render(), env.render())
+
+
+@pytest.mark.parametrize(
+    "env_id",
+    ["MiniGrid-FourRooms-v0", "MiniGrid-RedBlueDoors-8x8-v0", "BabyAI-BossLevel-v0"],
+)
+def test_pickle_env_compact(env_id):
+    """
+    Test that pickles leave out the objects created from the grid encoding,
+    and restore the other objects in the grid
+    """
+
+    env = gym.make(env_id).unwrapped
+    env.reset(seed=0)
+    env.state_hash(check=True)
+    size = len(pickle.dumps(env))
+
+    # Walls created from the encoding aren't pickled
+    assert all(obj is not None for obj in env.grid.grid[: env.width])
+    assert len(pickle.dumps(env)) == size
+    assert len(pickle.dumps(env.grid)) < len(pickle.dumps(vars(env.grid))) / 2
+
+    # Grids pickled with their whole object table still load
+    grid = Grid.__new__(Grid)
+    grid.__setstate__(dict(vars(env.grid)))
+    assert grid == env.grid and grid.objs is env.grid.objs
+
+    pickled_env = pickle.loads(pickle.dumps(env))
+    assert_equals(pickled_env.grid.encoding, env.grid.encoding)
+    assert pickled_env.state_hash(check=True) == env.state_hash()
+    for (x, y), obj in np.ndenumerate(pickled_env.grid.objs):
+        if obj is not None:
+            assert obj._grid is pickled_env.grid and obj._grid_pos == (x, y)
+
+    # Objects the environment refers to are still in the grid
+    if env_id == "MiniGrid-RedBlueDoors-8x8-v0":
+        assert pickled_env.red_door in pickled_env.grid
+        assert pickled_env.blue_door in pickled_env.grid
+
+    for action in np.random.default_rng(0).integers(env.action_space.n, size=100):
+        data_equivalence(env.step(action), pickled_env.step(action))
+        assert pickled_env.state_hash(check=True) == env.state_hash()
@@ -0,0 +1,153 @@
+import gymnasium as gym
+import numpy as np
+import pytest
+
+from minigrid.envs.empty import EmptyEnv
+from minigrid.vector_env import MiniGridVecEnv, SharedMemoryVecEnv
+from minigrid.wrappers import ActionBonus, FullyObsWrapper, ImgObsWrapper
+from tests.utils import assert_equals
+
+NUM_ENVS = 4
+NUM_STEPS = 300
+
+
+def assert_steps_equal(step, other_step):
+    *step, infos = step
+    *other_step, other_infos = other_step
+    assert_equals(tuple(step), tuple(other_step))
+
+    # Final observations are dictionaries in arrays of objects
+    assert infos.keys() == other_infos.keys()
+    for key in infos:
+        for info, other_info in zip(infos[key], other_infos[key]):
+            if key == "final_observation" and info is not None:
+                info = dict(info, direction=int(info["direction"]))
+                other_info = dict(other_info, direction=int(other_info["direction"]))
+            assert_equals(info, other_info)
+
+
+class RandomLimitEnv(EmptyEnv):
+    """
+    Environment whose step limit is drawn when it is reset
+    """
+
+    def _gen_grid(self, width, height):
+        super()._gen_grid(width, height)
+        self.max_steps = self._rand_int(5, 30).item()
+
+
+def assert_vec_env_matches_sync_vector_env(env_fns, num_steps=NUM_STEPS):
+    sync_env = gym.vector.SyncVectorEnv(env_fns)
+    vec_env = MiniGridVecEnv(env_fns)
+
+    assert_equals(sync_env.reset(seed=0), vec_env.reset(seed=0))
+
+    rng = np.random.RandomState(0)
+    for _ in range(num_steps):
+        actions = rng.randint(vec_env.single_action_space.n, size=len(env_fns))
+        assert_steps_equal(sync_env.step(actions), vec_env.step(actions))
+
+        for env, vec_sub_env in zip(sync_env.envs, vec_env.envs):
+            assert env.unwrapped.hash() == vec_sub_env.hash()
+            assert env.unwrapped.state_hash() == vec_sub_env.state_hash(check=True)
+
+    return vec_env
+
+
+@pytest.mark.parametrize(
+    "env_id",
+    [
+        "MiniGrid-Empty-5x5-v0",
+        "MiniGrid-FourRooms-v0",
+        "MiniGrid-LavaCrossingS9N1-v0",
+        "MiniGrid-LavaGapS5-v0",
+        "MiniGrid-DoorKey-5x5-v0",
+        "MiniGrid-Unlock-v0",
+        "MiniGrid-Dynamic-Obstacles-5x5-v0",
+    ],
+)
+def test_vec_env_matches_sync_vector_env(env_id):
+    """
+    Test that MiniGridVecEnv steps the environments as SyncVectorEnv does,
+    both natively and for environments with their own step function.
+    """
+    env_fns = [lambda: gym.make(env_id, max_steps=50)] * NUM_ENVS
+    assert_vec_env_matches_sync_vector_env(env_fns)
+
+
+def test_vec_env_wrappers():
+    """
+    Test that wrapped environments are stepped through their wrappers.
+    """
+    env_fns = [
+        lambda: ActionBonus(gym.make("MiniGrid-DoorKey-5x5-v0")),
+        lambda: gym.make("MiniGrid-DoorKey-5x5-v0"),
+        lambda: gym.wrappers.TimeLimit(gym.make("MiniGrid-DoorKey-5x5-v0"), 7),
+    ]
+    vec_env = assert_vec_env_matches_sync_vector_env(env_fns, 100)
+    assert vec_env.is_native.tolist() == [False, True, False]
+
+    env_fns = [lambda: FullyObsWrapper(gym.make("MiniGrid-Empty-8x8-v0"))] * 2
+    vec_env = assert_vec_env_matches_sync_vector_env(env_fns, 100)
+    assert vec_env.single_observation_space["image"].shape == (8, 8, 3)
+
+    # Wrappers changing the observations must go through SyncVectorEnv
+    with pytest.raises(ValueError):
+        MiniGridVecEnv([lambda: ImgObsWrapper(gym.make("MiniGrid-Empty-8x8-v0"))])
+
+
+def test_vec_env_max_steps_reset():
+    """
+    Test that step limits set when the environments are reset are applied.
+    """
+    env_fns = [lambda: RandomLimitEnv(size=6)] * NUM_ENVS
+    vec_env = assert_vec_env_matches_sync_vector_env(env_fns, 100)
+    assert vec_env.is_native.all()
+
+
+def test_vec_env_native():
+    vec_env = MiniGridVecEnv(
+        [
+            lambda: gym.make("MiniGrid-Empty-5x5-v0"),
+            lambda: gym.make("MiniGrid-DoorKey-5x5-v0"),
+            lambda: gym.make("MiniGrid-Dynamic-Obstacles-5x5-v0"),
+        ]
+    )
+    assert vec_env.is_native.tolist() == [True, True, False]
+
+    # The grids of the environments stepped natively are views of the
+    # stacked grids
+    vec_env.reset(seed=0)
+    for i in vec_env.native:
+        assert np.shares_memory(vec_env.envs[i].grid.encoding, vec_env.grids)
+
+    # Environments stepped natively must have the same grid size
+    with pytest.raises(ValueError):
+        MiniGridVecEnv(
+            [
+                lambda: gym.make("MiniGrid-Empty-5x5-v0"),
+                lambda: gym.make("MiniGrid-Empty-6x6-v0"),
+            ]
+        )
+
+
+@pytest.mark.parametrize("env_id", ["MiniGrid-DoorKey-5x5-v0", "BabyAI-GoToLocal-v0"])
+def test_shared_memory_vec_env(env_id):
+    """
+    Test that SharedMemoryVecEnv gives the same results as SyncVectorEnv.
+    """
+    env_fns = [lambda: gym.make(env_id, max_steps=20)] * NUM_ENVS
+    sync_env = gym.vector.SyncVectorEnv(env_fns)
+    vec_env = SharedMemoryVecEnv(env_fns, num_workers=2)
+
+    try:
+        assert_equals(sync_env.reset(seed=0), vec_env.reset(seed=0))
+
+        rng = np.random.RandomState(0)
+        for _ in range(50):
+            actions = rng.randint(vec_env.single_action_space.n, size=NUM_ENVS)
+            assert_steps_equal(sync_env.step(actions), vec_env.step(actions))
+
+        assert vec_env.call("step_count") == sync_env.get_attr("step_count")
+    finally:
+        vec_env.close()